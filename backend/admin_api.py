@@ -3,6 +3,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from pool_config_cache import POOL_CONFIG_CHANNEL
 
 app = FastAPI(title="HashBrotherhood Admin API")
 
@@ -70,6 +71,9 @@ async def update_pool(pool_id: int, config: PoolConfig):
         config.vardiff_max, pool_id
     ))
     
+    # Stratum servers reload their pool config cache (delivered on commit)
+    cursor.execute("SELECT pg_notify(%s, %s)", (POOL_CONFIG_CHANNEL, str(pool_id)))
+    
     conn.commit()
     cursor.close()
     conn.close()
@@ -5,10 +5,12 @@ import psycopg2
 from psycopg2 import pool
 from psycopg2.extras import RealDictCursor
 from datetime import datetime
-import requests
+import aiohttp
+import asyncio
 import time
 import os
-from typing import Dict, Optional
+from typing import Callable, Dict, List, Optional
+from pydantic import BaseModel
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -73,274 +75,427 @@ async def shutdown_event():
     if db_pool:
         db_pool.closeall()
         print("✅ Database pool closed")
+    if http_session and not http_session.closed:
+        await http_session.close()
 
 # ============================================================
-# NETWORK DATA CACHE (avoid hitting APIs too often)
+# CACHE SETTINGS (avoid hitting APIs too often)
 # ============================================================
-NETWORK_CACHE: Dict[str, tuple] = {}
 NETWORK_CACHE_DURATION = 300  # 5 minutes
+CACHE_DURATION = int(os.getenv("PRICE_CACHE_SECONDS", "60"))
+# Past its TTL an entry is still served (refreshed in the background) this long
+CACHE_MAX_STALE = int(os.getenv("CACHE_MAX_STALE_SECONDS", "3600"))
+# Background refresher reloads entries at this fraction of their TTL
+CACHE_REFRESH_AHEAD = 0.8
+# A failed lookup with nothing cached serves (and caches) the fallback this long
+CACHE_FALLBACK_TTL = int(os.getenv("FALLBACK_CACHE_SECONDS", "30"))
 
 # ============================================================
-# PRICE CACHE
+# UPSTREAM PROVIDERS (override with env, e.g. for local stubs)
 # ============================================================
-PRICE_CACHE: Dict[str, tuple] = {}
-CACHE_DURATION = int(os.getenv("PRICE_CACHE_SECONDS", "60"))
+COINGECKO_API = os.getenv("COINGECKO_API", "https://api.coingecko.com/api/v3")
+CRYPTOCOMPARE_API = os.getenv("CRYPTOCOMPARE_API", "https://min-api.cryptocompare.com/data")
+COINCAP_API = os.getenv("COINCAP_API", "https://api.coincap.io/v2")
+MEMPOOL_API = os.getenv("MEMPOOL_API", "https://mempool.space/api")
+BLOCKCHAIN_INFO_API = os.getenv("BLOCKCHAIN_INFO_API", "https://blockchain.info")
+MONEROBLOCKS_API = os.getenv("MONEROBLOCKS_API", "https://moneroblocks.info/api")
+XMRCHAIN_API = os.getenv("XMRCHAIN_API", "https://xmrchain.net/api")
+ERGO_API = os.getenv("ERGO_API", "https://api.ergoplatform.com/api/v1")
+TWOMINERS_API = os.getenv("TWOMINERS_API", "https://{coin}.2miners.com/api")
+
+PROVIDER_TIMEOUT = float(os.getenv("PROVIDER_TIMEOUT_SECONDS", "4"))
+BREAKER_FAILURES = int(os.getenv("PROVIDER_BREAKER_FAILURES", "3"))
+BREAKER_RESET = float(os.getenv("PROVIDER_BREAKER_RESET_SECONDS", "60"))
+
+COINGECKO_IDS = {
+    'XMR': 'monero',
+    'RVN': 'ravencoin',
+    'ETC': 'ethereum-classic',
+    'LTC': 'litecoin',
+    'BTC': 'bitcoin',
+    'ERG': 'ergo'
+}
 
 # ============================================================
-# COIN PRICE FETCHER (Multi-source with caching)
+# ASYNC HTTP LAYER (shared keep-alive session + circuit breakers)
 # ============================================================
-def get_coin_price(coin_symbol: str) -> float:
-    """Multi-source price fetcher with caching"""
-
-    if coin_symbol in PRICE_CACHE:
-        cached_price, cached_time = PRICE_CACHE[coin_symbol]
-        if time.time() - cached_time < CACHE_DURATION:
-            return cached_price
-
-    coin_map = {
-        'XMR': 'monero',
-        'RVN': 'ravencoin',
-        'ETC': 'ethereum-classic',
-        'LTC': 'litecoin',
-        'BTC': 'bitcoin',
-        'ERG': 'ergo'
-    }
+http_session: Optional[aiohttp.ClientSession] = None
+
+async def get_http_session() -> aiohttp.ClientSession:
+    global http_session
+    if http_session is None or http_session.closed:
+        http_session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=PROVIDER_TIMEOUT),
+            connector=aiohttp.TCPConnector(limit=50, ttl_dns_cache=300),
+            headers={"User-Agent": "HashBrotherhood/1.1"}
+        )
+    return http_session
+
+
+class CircuitBreaker:
+    """Skip a provider after repeated failures, retry it once after a cool-down"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= BREAKER_RESET:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.trial_running:
+            self.trial_running = True
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def failure(self):
+        self.failures += 1
+        if self.trial_running or self.failures >= BREAKER_FAILURES:
+            if self.opened_at is None:
+                print(f"🔌 Circuit open: {self.name}")
+            self.opened_at = time.monotonic()
+        self.trial_running = False
+
+    def cancelled(self):
+        # Lost the race - says nothing about provider health
+        self.trial_running = False
+
+
+BREAKERS: Dict[str, CircuitBreaker] = {}
+
+def get_breaker(name: str) -> CircuitBreaker:
+    if name not in BREAKERS:
+        BREAKERS[name] = CircuitBreaker(name)
+    return BREAKERS[name]
+
+
+async def fetch_provider(name: str, url: str, parse: Callable, as_text: bool = False):
+    """GET url and parse it; None from parse counts as a failed answer"""
+    breaker = get_breaker(name)
+    if not breaker.allow():
+        raise RuntimeError(f"{name} circuit open")
+    try:
+        session = await get_http_session()
+        async with session.get(url) as res:
+            if res.status != 200:
+                raise RuntimeError(f"HTTP {res.status}")
+            data = await (res.text() if as_text else res.json(content_type=None))
+        result = parse(data)
+        if not result:
+            raise ValueError("invalid response")
+    except asyncio.CancelledError:
+        breaker.cancelled()
+        raise
+    except Exception as e:
+        breaker.failure()
+        print(f"⚠️ {name} failed: {str(e) or type(e).__name__}")
+        raise
+    breaker.success()
+    return result
 
-    coingecko_ids = {
-        'XMR': 'monero',
-        'RVN': 'ravencoin',
-        'ETC': 'ethereum-classic',
-        'LTC': 'litecoin',
-        'BTC': 'bitcoin',
-        'ERG': 'ergo'
-    }
 
-    coin_id = coin_map.get(coin_symbol, 'bitcoin')
-    price = 0
+async def race_providers(attempts):
+    """Query all providers at once; first valid answer wins, the rest are cancelled
 
-    # 1. CoinGecko (most reliable)
-    try:
-        cg_id = coingecko_ids.get(coin_symbol)
-        if cg_id:
-            url = f"https://api.coingecko.com/api/v3/simple/price?ids={cg_id}&vs_currencies=usd"
-            response = requests.get(url, timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                price = float(data.get(cg_id, {}).get('usd', 0))
-                if price > 0:
-                    PRICE_CACHE[coin_symbol] = (price, time.time())
-                    print(f"✅ CoinGecko: {coin_symbol} = ${price:.4f}")
-                    return price
-    except Exception as e:
-        print(f"⚠️ CoinGecko failed: {e}")
+    attempts: list of (name, url, parse) or (name, url, parse, as_text)
+    Returns (name, result) or None if every provider failed.
+    """
+    async def attempt(name, *args):
+        return name, await fetch_provider(name, *args)
 
-    # 2. CryptoCompare
+    pending = {asyncio.ensure_future(attempt(*a)) for a in attempts}
     try:
-        url = f"https://min-api.cryptocompare.com/data/price?fsym={coin_symbol}&tsyms=USD"
-        response = requests.get(url, timeout=3)
-        if response.status_code == 200:
-            data = response.json()
-            price = float(data.get('USD', 0))
-            if price > 0:
-                PRICE_CACHE[coin_symbol] = (price, time.time())
-                print(f"✅ CryptoCompare: {coin_symbol} = ${price:.4f}")
-                return price
-    except Exception as e:
-        print(f"⚠️ CryptoCompare failed: {e}")
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+        return None
+    finally:
+        for task in pending:
+            task.cancel()
 
-    # 3. CoinCap
-    try:
-        url = f"https://api.coincap.io/v2/assets/{coin_id}"
-        response = requests.get(url, timeout=3)
-        if response.status_code == 200:
-            data = response.json()
-            price = float(data['data']['priceUsd'])
-            if price > 0:
-                PRICE_CACHE[coin_symbol] = (price, time.time())
-                print(f"✅ CoinCap: {coin_symbol} = ${price:.4f}")
-                return price
-    except Exception as e:
-        print(f"⚠️ CoinCap failed: {e}")
-
-    # 4. Fallback (should rarely reach here)
-    fallback_prices = {
-        'XMR': 165.0,
-        'BTC': 70000.0,
-        'RVN': 0.025,
-        'ETC': 18.0,
-        'LTC': 80.0,
-        'ERG': 1.5
-    }
-    price = fallback_prices.get(coin_symbol, 100.0)
-    print(f"⚠️ Using fallback price: {coin_symbol} = ${price:.4f}")
-    return price
+
+# ============================================================
+# STALE-WHILE-REVALIDATE CACHE (one in-flight refresh per key)
+# ============================================================
+class SWRCache:
+    """Per-key async stale-while-revalidate cache
+
+    Fresh for ttl seconds; for max_stale seconds after that the old value is
+    returned at once while a single background refresh runs. Concurrent misses
+    share one loader call. If a miss fails and there is nothing to serve, the
+    fallback(key) value is cached for fallback_ttl so requests don't keep
+    hitting a dead upstream.
+    """
+
+    def __init__(self, name: str, loader: Callable, ttl: float, max_stale: float = CACHE_MAX_STALE,
+                 fallback: Optional[Callable] = None, fallback_ttl: float = CACHE_FALLBACK_TTL):
+        self.name = name
+        self.loader = loader
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.fallback = fallback
+        self.fallback_ttl = fallback_ttl
+        self.entries: Dict[str, tuple] = {}      # key -> (value, loaded_at)
+        self.fallbacks: Dict[str, tuple] = {}    # key -> (fallback value, expires_at)
+        self.inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.fallback_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.errors = 0
+
+    async def get(self, key=None):
+        now = time.monotonic()
+        entry = self.entries.get(key)
+        if entry:
+            age = now - entry[1]
+            if age < self.ttl:
+                self.hits += 1
+                return entry[0]
+            if age < self.ttl + self.max_stale:
+                self.stale_hits += 1
+                self.refresh(key)
+                return entry[0]
+        negative = self.fallbacks.get(key)
+        if negative and now < negative[1]:
+            self.fallback_hits += 1
+            return negative[0]
+        self.misses += 1
+        try:
+            return await asyncio.shield(self.refresh(key))
+        except Exception:
+            # Too old to serve normally, but better than nothing
+            if entry:
+                return entry[0]
+            if self.fallback is None:
+                raise
+            value = self.fallback(key)
+            self.fallbacks[key] = (value, time.monotonic() + self.fallback_ttl)
+            return value
+
+    def age(self, key=None):
+        entry = self.entries.get(key)
+        return time.monotonic() - entry[1] if entry else None
+
+    def refresh(self, key=None) -> asyncio.Future:
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key))
+            self.inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        return task
+
+    def refresh_due(self, keys, ahead: float = CACHE_REFRESH_AHEAD):
+        """Start refreshes for keys that are missing or near expiry"""
+        now = time.monotonic()
+        return [
+            self.refresh(key) for key in keys
+            if key not in self.entries or now - self.entries[key][1] >= self.ttl * ahead
+        ]
+
+    async def _load(self, key):
+        self.refreshes += 1
+        value = await self.loader(key)
+        self.entries[key] = (value, time.monotonic())
+        self.fallbacks.pop(key, None)
+        return value
+
+    def _done(self, key, task):
+        self.inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+            print(f"⚠️ {self.name} cache refresh failed: {task.exception()}")
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "fallback_hits": self.fallback_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "errors": self.errors,
+            "inflight": len(self.inflight),
+            "age_seconds": {key: round(now - loaded_at, 1) for key, (_, loaded_at) in self.entries.items()}
+        }
 
 
 # ============================================================
-# NETWORK DATA FETCHER (Real-time from multiple APIs)
+# COIN PRICE FETCHER (Multi-source, cached via PRICE_CACHE)
 # ============================================================
-def get_network_data(coin_symbol):
-    """Fetch REAL network data from blockchain APIs"""
+def _positive(value) -> Optional[float]:
+    value = float(value)
+    return value if value > 0 else None
+
+PRICE_FALLBACK = {
+    'XMR': 165.0,
+    'BTC': 70000.0,
+    'RVN': 0.025,
+    'ETC': 18.0,
+    'LTC': 80.0,
+    'ERG': 1.5
+}
+
+async def _fetch_coin_price(coin_symbol: str) -> float:
+    """Race all price providers; raises LookupError if none answered"""
+    coin_id = COINGECKO_IDS.get(coin_symbol, 'bitcoin')
+
+    attempts = [
+        ("CryptoCompare", f"{CRYPTOCOMPARE_API}/price?fsym={coin_symbol}&tsyms=USD",
+         lambda d: _positive(d.get('USD', 0))),
+        ("CoinCap", f"{COINCAP_API}/assets/{coin_id}",
+         lambda d: _positive(d['data']['priceUsd'])),
+    ]
+    if coin_symbol in COINGECKO_IDS:
+        attempts.insert(0, ("CoinGecko", f"{COINGECKO_API}/simple/price?ids={coin_id}&vs_currencies=usd",
+                            lambda d: _positive(d.get(coin_id, {}).get('usd', 0))))
+
+    won = await race_providers(attempts)
+    if not won:
+        raise LookupError(f"no price for {coin_symbol}")
+    source, price = won
+    print(f"✅ {source}: {coin_symbol} = ${price:.4f}")
+    return price
+
+
+def _price_fallback(coin_symbol: str) -> float:
+    # Fallback (should rarely reach here)
+    price = PRICE_FALLBACK.get(coin_symbol, 100.0)
+    print(f"⚠️ Using fallback price: {coin_symbol} = ${price:.4f}")
+    return price
+
 
-    # Check cache first
-    if coin_symbol in NETWORK_CACHE:
-        cached_data, cached_time = NETWORK_CACHE[coin_symbol]
-        if time.time() - cached_time < NETWORK_CACHE_DURATION:
-            return cached_data
+async def get_coin_price(coin_symbol: str) -> float:
+    """Multi-source price with caching"""
+    return await PRICE_CACHE.get(coin_symbol)
 
-    result = None
 
+# ============================================================
+# NETWORK DATA FETCHER (Real-time from multiple APIs)
+# ============================================================
+TWOMINERS_COINS = {
+    # coin: (block reward, 2Miners subdomain)
+    'RVN': (2500, 'rvn'),
+    'ETC': (2.56, 'etc'),
+    'LTC': (6.25, 'ltc')
+}
+
+async def _fetch_network_data(coin_symbol):
+    """Race the network data providers; raises LookupError if none answered"""
     if coin_symbol == 'BTC':
-        result = _get_btc_network()
+        attempts = _btc_network_attempts()
     elif coin_symbol == 'XMR':
-        result = _get_xmr_network()
+        attempts = _xmr_network_attempts()
     elif coin_symbol == 'ERG':
-        result = _get_ergo_network()
-    elif coin_symbol == 'RVN':
-        result = _get_2miners_network('RVN', 'https://rvn.2miners.com/api/stats', 2500)
-    elif coin_symbol == 'ETC':
-        result = _get_2miners_network('ETC', 'https://etc.2miners.com/api/stats', 2.56)
-    elif coin_symbol == 'LTC':
-        result = _get_2miners_network('LTC', 'https://ltc.2miners.com/api/stats', 6.25)
-
-    # If API failed, use conservative fallback
-    if not result:
-        result = _get_fallback_network(coin_symbol)
-
-    # Cache the result
-    if result:
-        NETWORK_CACHE[coin_symbol] = (result, time.time())
+        attempts = _ergo_network_attempts()
+    elif coin_symbol in TWOMINERS_COINS:
+        attempts = _2miners_network_attempts(coin_symbol)
+    else:
+        attempts = []
 
-    return result
+    won = await race_providers(attempts) if attempts else None
+    if not won:
+        raise LookupError(f"no network data for {coin_symbol}")
+    return won[1]
 
 
-def _get_btc_network():
-    """Bitcoin network data from blockchain.info + mempool.space"""
+async def get_network_data(coin_symbol):
+    """Fetch REAL network data from blockchain APIs (cached; conservative fallback if APIs fail)"""
+    return await NETWORK_CACHE.get(coin_symbol)
 
-    # Try mempool.space first (more reliable)
-    try:
-        # Get difficulty
-        res = requests.get("https://mempool.space/api/v1/mining/hashrate/1d", timeout=5)
-        if res.status_code == 200:
-            data = res.json()
-            if data.get('hashrates') and len(data['hashrates']) > 0:
-                network_hashrate = float(data['hashrates'][-1]['avgHashrate'])
-                return {
-                    'hashrate': network_hashrate,
-                    'block_reward': 3.125,
-                    'block_time': 600,
-                    'source': 'Mempool.space'
-                }
-    except Exception as e:
-        print(f"⚠️ Mempool.space failed: {e}")
 
-    # Fallback: blockchain.info
-    try:
-        hashrate_res = requests.get("https://blockchain.info/q/hashrate", timeout=5)
-        if hashrate_res.status_code == 200:
-            # blockchain.info returns hashrate in GH/s
-            hashrate_ghs = float(hashrate_res.text.strip())
-            network_hashrate = hashrate_ghs * 1_000_000_000  # Convert to H/s
-            return {
-                'hashrate': network_hashrate,
-                'block_reward': 3.125,
-                'block_time': 600,
-                'source': 'Blockchain.info'
-            }
-    except Exception as e:
-        print(f"⚠️ Blockchain.info failed: {e}")
+def _network(hashrate, block_reward, block_time, source):
+    if hashrate <= 0 or block_reward <= 0:
+        return None
+    return {
+        'hashrate': hashrate,
+        'block_reward': block_reward,
+        'block_time': block_time,
+        'source': source
+    }
 
-    return None
 
+def _btc_network_attempts():
+    """Bitcoin network data from mempool.space + blockchain.info"""
 
-def _get_xmr_network():
-    """Monero network data from localmonero API / moneroblocks"""
+    def parse_mempool(data):
+        if data.get('hashrates'):
+            return _network(float(data['hashrates'][-1]['avgHashrate']), 3.125, 600, 'Mempool.space')
 
-    # Try moneroblocks.info
-    try:
-        res = requests.get("https://moneroblocks.info/api/get_stats", timeout=5)
-        if res.status_code == 200:
-            data = res.json()
-            network_hashrate = float(data.get('hashrate', 0))
-            last_reward = float(data.get('last_reward', 600000000)) / 1e12  # piconero to XMR
-            return {
-                'hashrate': network_hashrate,
-                'block_reward': last_reward,
-                'block_time': 120,
-                'source': 'MoneroBlocks'
-            }
-    except Exception as e:
-        print(f"⚠️ MoneroBlocks failed: {e}")
+    def parse_blockchain_info(text):
+        # blockchain.info returns hashrate in GH/s
+        return _network(float(text.strip()) * 1_000_000_000, 3.125, 600, 'Blockchain.info')
 
-    # Try xmrchain.net
-    try:
-        res = requests.get("https://xmrchain.net/api/networkinfo", timeout=5)
-        if res.status_code == 200:
-            data = res.json()
-            d = data.get('data', {})
-            network_hashrate = float(d.get('hash_rate', 0))
-            return {
-                'hashrate': network_hashrate,
-                'block_reward': 0.6,  # approximate tail emission
-                'block_time': 120,
-                'source': 'XMRChain'
-            }
-    except Exception as e:
-        print(f"⚠️ XMRChain failed: {e}")
+    return [
+        ("Mempool.space", f"{MEMPOOL_API}/v1/mining/hashrate/1d", parse_mempool),
+        ("Blockchain.info", f"{BLOCKCHAIN_INFO_API}/q/hashrate", parse_blockchain_info, True),
+    ]
+
+
+def _xmr_network_attempts():
+    """Monero network data from moneroblocks / xmrchain"""
 
-    return None
+    def parse_moneroblocks(data):
+        last_reward = float(data.get('last_reward', 600000000)) / 1e12  # piconero to XMR
+        return _network(float(data.get('hashrate', 0)), last_reward, 120, 'MoneroBlocks')
 
+    def parse_xmrchain(data):
+        d = data.get('data', {})
+        # approximate tail emission
+        return _network(float(d.get('hash_rate', 0)), 0.6, 120, 'XMRChain')
 
-def _get_ergo_network():
+    return [
+        ("MoneroBlocks", f"{MONEROBLOCKS_API}/get_stats", parse_moneroblocks),
+        ("XMRChain", f"{XMRCHAIN_API}/networkinfo", parse_xmrchain),
+    ]
+
+
+def _ergo_network_attempts():
     """Ergo network data from ergo blocks API"""
-    try:
-        res = requests.get("https://api.ergoplatform.com/api/v1/blocks?limit=1", timeout=5)
-        if res.status_code == 200:
-            data = res.json()
-            items = data.get('items', [])
-            if items and len(items) > 0:
-                block = items[0]
-                difficulty = float(block.get('difficulty', 0))
-                miner_reward_nano = float(block.get('minerReward', 0))
-                block_reward = miner_reward_nano / 1_000_000_000
-                block_time = 120
-                network_hashrate = difficulty / block_time
-                if network_hashrate > 0 and block_reward > 0:
-                    print(f"✅ Ergo: hashrate={network_hashrate:.0f} H/s, reward={block_reward} ERG")
-                    return {
-                        'hashrate': network_hashrate,
-                        'block_reward': block_reward,
-                        'block_time': block_time,
-                        'source': 'ErgoPlatform'
-                    }
-    except Exception as e:
-        print(f"⚠️ ErgoPlatform failed: {e}")
-    return None
+
+    def parse(data):
+        items = data.get('items', [])
+        if items:
+            block = items[0]
+            block_time = 120
+            block_reward = float(block.get('minerReward', 0)) / 1_000_000_000
+            return _network(float(block.get('difficulty', 0)) / block_time, block_reward,
+                            block_time, 'ErgoPlatform')
+
+    return [("ErgoPlatform", f"{ERGO_API}/blocks?limit=1", parse)]
 
 
-def _get_2miners_network(coin_symbol, pool_url, block_reward):
+def _2miners_network_attempts(coin_symbol):
     """Fetch network data from 2Miners pool API"""
+    block_reward, subdomain = TWOMINERS_COINS[coin_symbol]
 
-    try:
-        res = requests.get(pool_url, timeout=5)
-        data = res.json()
+    def parse(data):
         nodes = data.get('nodes', [])
-        if nodes and len(nodes) > 0:
+        if nodes:
             node = nodes[0]
-            network_hashrate = float(node.get('networkhashps', 0))
-            block_time = float(node.get('avgBlockTime', 60))
-
-            if network_hashrate > 0:
-                return {
-                    'hashrate': network_hashrate,
-                    'block_reward': block_reward,
-                    'block_time': block_time,
-                    'source': '2Miners'
-                }
-    except Exception as e:
-        print(f"⚠️ 2Miners {coin_symbol} failed: {e}")
+            return _network(float(node.get('networkhashps', 0)), block_reward,
+                            float(node.get('avgBlockTime', 60)), '2Miners')
 
-    return None
+    return [(f"2Miners-{coin_symbol}", f"{TWOMINERS_API.format(coin=subdomain)}/stats", parse)]
 
 
 def _get_fallback_network(coin_symbol):
@@ -391,6 +546,36 @@ def _get_fallback_network(coin_symbol):
     return result
 
 
+# ============================================================
+# CACHE INSTANCES + BACKGROUND REFRESHER
+# ============================================================
+PRICE_CACHE = SWRCache("price", _fetch_coin_price, CACHE_DURATION, fallback=_price_fallback)
+NETWORK_CACHE = SWRCache("network", _fetch_network_data, NETWORK_CACHE_DURATION, fallback=_get_fallback_network)
+
+# All coins served by the calculator - kept warm so requests never wait upstream
+PREWARM_COINS = list(COINGECKO_IDS)
+refresher_task: Optional[asyncio.Task] = None
+
+async def cache_refresher():
+    """Reload prices/network data before they expire"""
+    interval = min(CACHE_DURATION, NETWORK_CACHE_DURATION) * (1 - CACHE_REFRESH_AHEAD)
+    while True:
+        tasks = PRICE_CACHE.refresh_due(PREWARM_COINS) + NETWORK_CACHE.refresh_due(PREWARM_COINS)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.sleep(max(interval, 1))
+
+@app.on_event("startup")
+async def start_cache_refresher():
+    global refresher_task
+    refresher_task = asyncio.create_task(cache_refresher())
+
+@app.on_event("shutdown")
+async def stop_cache_refresher():
+    if refresher_task:
+        refresher_task.cancel()
+
+
 # ============================================================
 # API ENDPOINTS
 # ============================================================
@@ -416,6 +601,14 @@ async def health_check():
     except Exception as e:
         return {"status": "unhealthy", "database": "disconnected", "error": str(e)}
 
+@app.get("/api/cache/stats")
+async def cache_stats():
+    return {
+        "price": PRICE_CACHE.stats(),
+        "network": NETWORK_CACHE.stats(),
+        "providers": {name: {"state": b.state, "failures": b.failures} for name, b in BREAKERS.items()}
+    }
+
 @app.get("/api/algorithms")
 async def get_algorithms():
     conn = get_db()
@@ -503,13 +696,54 @@ async def get_coin_info(algorithm: str):
     if not info:
         return {"error": "Unknown algorithm"}
 
-    price = get_coin_price(info['symbol'])
+    price = await get_coin_price(info['symbol'])
 
     return {
         **info,
         'price': price
     }
 
+ALGORITHM_COINS = {
+    'RandomX': 'XMR',
+    'KawPow': 'RVN',
+    'Etchash': 'ETC',
+    'Scrypt': 'LTC',
+    'SHA256': 'BTC',
+    'Autolykos': 'ERG'
+}
+
+HASHRATE_MULTIPLIERS = {
+    'H/s': 1,
+    'KH/s': 1000,
+    'MH/s': 1000000,
+    'GH/s': 1000000000,
+    'TH/s': 1000000000000,
+    'PH/s': 1000000000000000,
+    'EH/s': 1000000000000000000
+}
+
+CALCULATOR_BATCH_MAX = int(os.getenv("CALCULATOR_BATCH_MAX", "500"))
+
+
+def _coins_per_hs_day(network) -> float:
+    """Coins mined per day by 1 H/s - the only network-dependent part of the yield"""
+    blocks_per_day = 86400 / network['block_time']
+    return blocks_per_day * network['block_reward'] / network['hashrate']
+
+
+def _platform_fee() -> float:
+    return float(os.getenv("PLATFORM_FEE_PERCENT", "2.5")) / 100
+
+
+def _yields(net_usdt: float) -> dict:
+    return {
+        "hourly": round(net_usdt / 24, 6),
+        "daily": round(net_usdt, 4),
+        "weekly": round(net_usdt * 7, 2),
+        "monthly": round(net_usdt * 30, 2),
+    }
+
+
 @app.get("/api/calculator/realtime")
 async def calculate_realtime(algorithm: str, hashrate: float, unit: str):
     """Mining calculator with REAL live data"""
@@ -517,53 +751,25 @@ async def calculate_realtime(algorithm: str, hashrate: float, unit: str):
     if hashrate <= 0:
         return {"error": "Hashrate must be positive"}
 
-    coin_map = {
-        'RandomX': 'XMR',
-        'KawPow': 'RVN',
-        'Etchash': 'ETC',
-        'Scrypt': 'LTC',
-        'SHA256': 'BTC',
-        'Autolykos': 'ERG'
-    }
-
-    coin_symbol = coin_map.get(algorithm)
+    coin_symbol = ALGORITHM_COINS.get(algorithm)
     if not coin_symbol:
         return {"error": "Unknown algorithm"}
 
-    network = get_network_data(coin_symbol)
+    network, coin_price = await asyncio.gather(
+        get_network_data(coin_symbol), get_coin_price(coin_symbol)
+    )
     if not network:
         return {"error": "Network data not available"}
 
-    coin_price = get_coin_price(coin_symbol)
-
     if coin_price == 0:
         return {"error": "Could not fetch price"}
 
-    multipliers = {
-        'H/s': 1,
-        'KH/s': 1000,
-        'MH/s': 1000000,
-        'GH/s': 1000000000,
-        'TH/s': 1000000000000,
-        'PH/s': 1000000000000000,
-        'EH/s': 1000000000000000000
-    }
-
-    user_hashrate_hs = hashrate * multipliers.get(unit, 1)
-
-    blocks_per_day = 86400 / network['block_time']
-    user_share = user_hashrate_hs / network['hashrate']
-    daily_coins = blocks_per_day * network['block_reward'] * user_share
-
-    fee = float(os.getenv("PLATFORM_FEE_PERCENT", "2.5")) / 100
-    gross_usdt = daily_coins * coin_price
-    net_usdt = gross_usdt * (1 - fee)
+    user_hashrate_hs = hashrate * HASHRATE_MULTIPLIERS.get(unit, 1)
+    daily_coins = user_hashrate_hs * _coins_per_hs_day(network)
+    net_usdt = daily_coins * coin_price * (1 - _platform_fee())
 
     return {
-        "hourly": round(net_usdt / 24, 6),
-        "daily": round(net_usdt, 4),
-        "weekly": round(net_usdt * 7, 2),
-        "monthly": round(net_usdt * 30, 2),
+        **_yields(net_usdt),
         "coin_price": round(coin_price, 4),
         "coins_per_day": round(daily_coins, 8),
         "network_hashrate": network['hashrate'],
@@ -571,6 +777,77 @@ async def calculate_realtime(algorithm: str, hashrate: float, unit: str):
         "estimated": True
     }
 
+
+class CalculatorRow(BaseModel):
+    algorithm: str
+    hashrate: float
+    unit: str = "H/s"
+
+class CalculatorGrid(BaseModel):
+    algorithm: str
+    hashrates: List[float]
+    unit: str = "H/s"
+
+class CalculatorBatch(BaseModel):
+    rows: List[CalculatorRow] = []
+    grids: List[CalculatorGrid] = []
+
+
+@app.post("/api/calculator/batch")
+async def calculate_batch(batch: CalculatorBatch):
+    """Many calculator rows (or per-algorithm hashrate grids) in one request
+
+    Network data and price are looked up once per coin; each row is then a
+    single multiplication by that coin's USDT-per-H/s-per-day factor.
+    """
+    rows = [(r.algorithm, r.hashrate, r.unit) for r in batch.rows]
+    for grid in batch.grids:
+        rows.extend((grid.algorithm, h, grid.unit) for h in grid.hashrates)
+
+    if not rows:
+        return {"error": "No rows"}
+    if len(rows) > CALCULATOR_BATCH_MAX:
+        return {"error": f"Too many rows (max {CALCULATOR_BATCH_MAX})"}
+
+    symbols = sorted({ALGORITHM_COINS[a] for a, _, _ in rows if a in ALGORITHM_COINS})
+    fetched = await asyncio.gather(*(
+        asyncio.gather(get_network_data(sym), get_coin_price(sym)) for sym in symbols
+    ))
+
+    fee = _platform_fee()
+    coins = {}
+    factors = {}        # symbol -> (coins per H/s/day, net USDT per H/s/day)
+    for sym, (network, coin_price) in zip(symbols, fetched):
+        if not network or not coin_price:
+            coins[sym] = {"error": "Network data not available" if not network else "Could not fetch price"}
+            continue
+        per_hs = _coins_per_hs_day(network)
+        factors[sym] = (per_hs, per_hs * coin_price * (1 - fee))
+        coins[sym] = {
+            "coin_price": round(coin_price, 4),
+            "network_hashrate": network['hashrate'],
+            "data_source": network.get('source', 'Unknown')
+        }
+
+    results = []
+    for algorithm, hashrate, unit in rows:
+        row = {"algorithm": algorithm, "hashrate": hashrate, "unit": unit}
+        sym = ALGORITHM_COINS.get(algorithm)
+        if not sym:
+            row["error"] = "Unknown algorithm"
+        elif hashrate <= 0:
+            row["error"] = "Hashrate must be positive"
+        elif sym not in factors:
+            row["error"] = coins[sym]["error"]
+        else:
+            coins_per_hs, usdt_per_hs = factors[sym]
+            hs = hashrate * HASHRATE_MULTIPLIERS.get(unit, 1)
+            row.update(_yields(hs * usdt_per_hs), coin=sym, coins_per_day=round(hs * coins_per_hs, 8))
+        results.append(row)
+
+    return {"results": results, "coins": coins, "estimated": True}
+
+
 @app.get("/api/miner/{wallet}/balance")
 async def get_miner_balance(wallet: str):
     if len(wallet) < 26:
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# admin_api.update_pool sends this NOTIFY after changing a pool
+POOL_CONFIG_CHANNEL = "pool_configs_changed"
+POOL_CONFIG_REFRESH_INTERVAL = 300  # seconds, safety net if a NOTIFY is missed
+
+class PoolConfigCache:
+    """In-memory pool_configs keyed by stratum port
+
+    Loaded once at startup, then reloaded on a timer and whenever a
+    pool_configs_changed notification arrives. get() never touches the database.
+    """
+
+    def __init__(self, connect, refresh_interval=POOL_CONFIG_REFRESH_INTERVAL, channel=POOL_CONFIG_CHANNEL):
+        self.connect = connect
+        self.refresh_interval = refresh_interval
+        self.channel = channel
+        self.by_port = {}
+        self.loaded_at = None
+        self.listen_conn = None
+        self.refresh_task = None
+        self.refresh_again = False
+        self.task = None
+
+    def get(self, stratum_port):
+        return self.by_port.get(stratum_port)
+
+    def load(self):
+        """Blocking reload - runs on the default executor"""
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT a.stratum_port, p.pool_host, p.pool_port, p.wallet_address, p.worker_name,
+                       p.password, a.name as algo_name
+                FROM pool_configs p
+                JOIN algorithms a ON p.algorithm_id = a.id
+                WHERE a.active = TRUE AND p.active = TRUE
+                ORDER BY p.id
+            """)
+            rows = cursor.fetchall()
+            cursor.close()
+        finally:
+            conn.close()
+
+        configs = {}
+        for row in rows:
+            configs.setdefault(row[0], {
+                'pool_host': row[1],
+                'pool_port': row[2],
+                'wallet': row[3],
+                'worker': row[4],
+                'password': row[5],
+                'algorithm': row[6]
+            })
+        return configs
+
+    def refresh(self):
+        """Reload in the background; requests during a reload coalesce into one more"""
+        if self.refresh_task is None:
+            self.refresh_task = asyncio.ensure_future(self._refresh())
+        else:
+            self.refresh_again = True
+        return self.refresh_task
+
+    async def _refresh(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                self.refresh_again = False
+                try:
+                    self.by_port = await loop.run_in_executor(None, self.load)
+                    self.loaded_at = time.time()
+                    logger.info(f"Pool configs loaded: ports {sorted(self.by_port)}")
+                except Exception as e:
+                    logger.error(f"Pool config reload failed (keeping {len(self.by_port)} cached): {e}")
+                if not self.refresh_again:
+                    return self.by_port
+        finally:
+            # Cleared with no await after the last refresh_again check, so a
+            # later refresh() always starts a new reload
+            self.refresh_task = None
+
+    async def _listen(self, loop):
+        conn = await loop.run_in_executor(None, self.connect)
+        try:
+            conn.autocommit = True
+            cursor = conn.cursor()
+            cursor.execute(f"LISTEN {self.channel}")
+            cursor.close()
+            loop.add_reader(conn.fileno(), self._on_notify, loop)
+        except Exception:
+            conn.close()
+            raise
+        self.listen_conn = conn
+        logger.info(f"Listening for {self.channel}")
+
+    def _on_notify(self, loop):
+        try:
+            self.listen_conn.poll()
+        except Exception as e:
+            logger.error(f"Pool config listener lost: {e}")
+            self._close_listener(loop)
+            return
+        if self.listen_conn.notifies:
+            self.listen_conn.notifies.clear()
+            self.refresh()
+
+    def _close_listener(self, loop):
+        if self.listen_conn is not None:
+            try:
+                loop.remove_reader(self.listen_conn.fileno())
+            except Exception:
+                pass
+            try:
+                self.listen_conn.close()
+            except Exception:
+                pass
+            self.listen_conn = None
+
+    async def start(self):
+        """LISTEN, initial load (before accepting miners), then background refresh
+
+        Listening before the first load means a change committed while it runs
+        still triggers a reload.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            await self._listen(loop)
+        except Exception as e:
+            logger.error(f"LISTEN {self.channel} failed, timer refresh only: {e}")
+        await self.refresh()
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                if self.listen_conn is None:
+                    try:
+                        await self._listen(loop)
+                        # Changes made while we were not listening
+                        await self.refresh()
+                    except Exception as e:
+                        logger.error(f"LISTEN {self.channel} failed, timer refresh only: {e}")
+                await asyncio.sleep(self.refresh_interval)
+                await self.refresh()
+        finally:
+            self._close_listener(loop)
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
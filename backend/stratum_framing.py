@@ -0,0 +1,42 @@
+MAX_LINE_BYTES = 64 * 1024     # longest stratum message we accept
+READ_CHUNK = 4096
+
+class FrameTooLarge(Exception):
+    """Peer sent more than MAX_LINE_BYTES without a newline"""
+
+class LineFramer:
+    """Reassembles newline-delimited stratum messages from arbitrary TCP chunks
+
+    A chunk may hold part of a message, several messages, or both; feed()
+    returns every completed line and keeps the unterminated tail (bounded).
+    """
+
+    def __init__(self, max_line=MAX_LINE_BYTES):
+        self.max_line = max_line
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer += data
+        if b'\n' not in data:
+            if len(self.buffer) > self.max_line:
+                raise FrameTooLarge(f"{len(self.buffer)} bytes without newline")
+            return []
+
+        *lines, tail = self.buffer.split(b'\n')
+        if len(tail) > self.max_line:
+            raise FrameTooLarge(f"{len(tail)} bytes without newline")
+        self.buffer = bytearray(tail)
+        return [bytes(line.rstrip(b'\r')) for line in lines if line.strip()]
+
+    def pending(self):
+        return len(self.buffer)
+
+async def read_lines(reader, max_line=MAX_LINE_BYTES):
+    """Yield complete lines from an asyncio StreamReader until EOF"""
+    framer = LineFramer(max_line)
+    while True:
+        data = await reader.read(READ_CHUNK)
+        if not data:
+            return
+        for line in framer.feed(data):
+            yield line
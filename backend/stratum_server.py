@@ -3,6 +3,8 @@ import json
 import logging
 from datetime import datetime
 import psycopg2
+from pool_config_cache import PoolConfigCache
+from stratum_framing import read_lines
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -12,34 +14,14 @@ class StratumServer:
         self.host = host
         self.port = port
         self.miners = {}
+        self.pool_configs = PoolConfigCache(self.connect_db)
         
+    def connect_db(self):
+        return psycopg2.connect(dbname="hashbrotherhood", user="u0_a307", host="localhost")
+    
     def get_pool_config(self, algo_port):
-        """Get pool configuration from database"""
-        conn = psycopg2.connect(dbname="hashbrotherhood", user="u0_a307", host="localhost")
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT p.pool_host, p.pool_port, p.wallet_address, p.worker_name, p.password,
-                   a.name as algo_name
-            FROM pool_configs p
-            JOIN algorithms a ON p.algorithm_id = a.id
-            WHERE a.stratum_port = %s AND a.active = true
-        """, (algo_port,))
-        
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
-        
-        if result:
-            return {
-                'pool_host': result[0],
-                'pool_port': result[1],
-                'wallet': result[2],
-                'worker': result[3],
-                'password': result[4],
-                'algorithm': result[5]
-            }
-        return None
+        """Get pool configuration from the in-memory cache"""
+        return self.pool_configs.get(algo_port)
     
     async def handle_miner(self, reader, writer):
         """Handle individual miner connection"""
@@ -66,12 +48,8 @@ class StratumServer:
             # Handle bidirectional communication
             async def miner_to_pool():
                 try:
-                    while True:
-                        data = await reader.readline()
-                        if not data:
-                            break
-                        
-                        message = json.loads(data.decode())
+                    async for line in read_lines(reader):
+                        message = json.loads(line)
                         logger.info(f"Miner → Proxy: {message}")
                         
                         # Extract wallet from login
@@ -104,12 +82,8 @@ class StratumServer:
             
             async def pool_to_miner():
                 try:
-                    while True:
-                        data = await pool_reader.readline()
-                        if not data:
-                            break
-                        
-                        message = json.loads(data.decode())
+                    async for line in read_lines(pool_reader):
+                        message = json.loads(line)
                         logger.info(f"Pool → Proxy: {message}")
                         
                         # Track shares
@@ -141,6 +115,7 @@ class StratumServer:
     
     async def start(self):
         """Start stratum server"""
+        await self.pool_configs.start()
         server = await asyncio.start_server(
             self.handle_miner, 
             self.host, 
@@ -151,8 +126,11 @@ class StratumServer:
         logger.info(f"Stratum server running on {addr}")
         logger.info(f"Miners can connect to: {self.host}:{self.port}")
         
-        async with server:
-            await server.serve_forever()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.pool_configs.stop()
 
 if __name__ == "__main__":
     # Start RandomX stratum on port 3333
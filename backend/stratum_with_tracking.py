@@ -1,9 +1,20 @@
 import asyncio
 import json
 import psycopg2
+from psycopg2.extras import execute_values
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import requests
 import time
+from pool_config_cache import PoolConfigCache
+from stratum_framing import LineFramer, FrameTooLarge, read_lines, READ_CHUNK
+
+PRICE_REFRESH_INTERVAL = 60     # seconds between background price fetches
+PRICE_FALLBACK = 165.0
+
+SHARE_FLUSH_INTERVAL = 2        # seconds between revenue_snapshots flushes
+SHARE_FLUSH_BATCH = 500         # flush early once this many rows are buffered
+SHARE_BUFFER_MAX = 50000        # rows kept in memory while the DB is unreachable
 
 def get_db():
     return psycopg2.connect(
@@ -12,24 +23,42 @@ def get_db():
         host="localhost"
     )
 
-def get_coin_price(coin_symbol):
-    try:
-        coin_map = {
-            "XMR": "monero",
-            "RVN": "ravencoin",
-            "ETC": "ethereum-classic",
-            "LTC": "litecoin",
-            "BTC": "bitcoin",
-            "ERG": "ergo"
-        }
-        
-        coin_id = coin_map.get(coin_symbol, "monero")
-        response = requests.get(f"https://api.coingecko.com/api/v3/simple/price?ids={coin_id}&vs_currencies=usd", timeout=5)
-        data = response.json()
-        return float(data[coin_id]['usd'])
-    except Exception as e:
-        print(f"ERROR: Price fetch failed: {e}")
-        return 165.0
+def fetch_coin_price(coin_symbol):
+    """Blocking CoinGecko lookup - only called from the price feed's executor"""
+    coin_map = {
+        "XMR": "monero",
+        "RVN": "ravencoin",
+        "ETC": "ethereum-classic",
+        "LTC": "litecoin",
+        "BTC": "bitcoin",
+        "ERG": "ergo"
+    }
+    coin_id = coin_map.get(coin_symbol, "monero")
+    response = requests.get(f"https://api.coingecko.com/api/v3/simple/price?ids={coin_id}&vs_currencies=usd", timeout=5)
+    data = response.json()
+    return float(data[coin_id]['usd'])
+
+class PriceFeed:
+    """Coin prices refreshed in the background; get() is a dict lookup"""
+
+    def __init__(self, symbols):
+        self.symbols = symbols
+        self.prices = {}
+
+    def get(self, coin_symbol):
+        return self.prices.get(coin_symbol, PRICE_FALLBACK)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            for symbol in self.symbols:
+                try:
+                    self.prices[symbol] = await loop.run_in_executor(None, fetch_coin_price, symbol)
+                except Exception as e:
+                    print(f"ERROR: Price fetch failed: {e}")
+            await asyncio.sleep(PRICE_REFRESH_INTERVAL)
+
+price_feed = PriceFeed(["XMR"])
 
 def calculate_share_earnings(difficulty, algorithm, coin_price):
     base_earning = float(difficulty) * 0.000001
@@ -37,47 +66,76 @@ def calculate_share_earnings(difficulty, algorithm, coin_price):
     net_usdt = usdt_earned * 0.975
     return net_usdt
 
+class ShareWriter:
+    """Buffers revenue_snapshots rows and bulk-inserts them off the event loop"""
+
+    def __init__(self):
+        self.buffer = []
+        self.conn = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.wakeup = asyncio.Event()
+        self.dropped = 0
+
+    def add(self, row):
+        self.buffer.append(row)
+        if len(self.buffer) >= SHARE_FLUSH_BATCH:
+            self.wakeup.set()
+
+    def _insert(self, rows):
+        # Runs on the writer thread; the connection is reused between flushes
+        try:
+            if self.conn is None or self.conn.closed:
+                self.conn = get_db()
+            with self.conn.cursor() as cursor:
+                execute_values(cursor, """
+                    INSERT INTO revenue_snapshots 
+                    (miner_wallet, worker_name, timestamp, algorithm, difficulty, coin_price_usdt, net_usdt_earned, paid)
+                    VALUES %s
+                """, rows, template="(%s, %s, %s, %s, %s, %s, %s, FALSE)", page_size=SHARE_FLUSH_BATCH)
+            self.conn.commit()
+        except Exception:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+            raise
+
+    async def flush(self):
+        if not self.buffer:
+            return
+        rows, self.buffer = self.buffer, []
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self._insert, rows)
+            print(f"✅ Saved {len(rows)} share(s) to revenue_snapshots")
+        except Exception as e:
+            print(f"ERROR: Share flush failed ({len(rows)} rows kept): {e}")
+            self.buffer = rows + self.buffer
+            overflow = len(self.buffer) - SHARE_BUFFER_MAX
+            if overflow > 0:
+                del self.buffer[:overflow]
+                self.dropped += overflow
+                print(f"ERROR: Share buffer full, dropped {overflow} oldest rows")
+
+    async def run(self):
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), SHARE_FLUSH_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self.wakeup.clear()
+                await self.flush()
+        finally:
+            await self.flush()
+
+share_writer = None
+
 def save_share(miner_wallet, worker_name, algorithm, difficulty, coin_price, net_usdt):
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        INSERT INTO revenue_snapshots 
-        (miner_wallet, worker_name, timestamp, algorithm, difficulty, coin_price_usdt, net_usdt_earned, paid)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, FALSE)
-    """, (miner_wallet, worker_name, datetime.now(), algorithm, int(difficulty), coin_price, net_usdt))
-    
-    conn.commit()
-    cursor.close()
-    conn.close()
-    
-    print(f"✅ Share saved: {miner_wallet}/{worker_name} earned ${net_usdt:.8f} USDT (XMR: ${coin_price:.2f})")
+    share_writer.add((miner_wallet, worker_name, datetime.now(), algorithm, int(difficulty), coin_price, net_usdt))
+
+pool_configs = PoolConfigCache(get_db)
 
 def get_pool_config(stratum_port):
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT p.*, a.name as algorithm_name
-        FROM pool_configs p
-        JOIN algorithms a ON p.algorithm_id = a.id
-        WHERE a.stratum_port = %s AND p.active = TRUE
-    """, (stratum_port,))
-    
-    result = cursor.fetchone()
-    cursor.close()
-    conn.close()
-    
-    if result:
-        return {
-            'pool_host': result[2],
-            'pool_port': result[3],
-            'wallet': result[4],
-            'worker': result[5],
-            'password': result[6],
-            'algorithm': result[-1]
-        }
-    return None
+    return pool_configs.get(stratum_port)
 
 async def handle_miner(reader, writer):
     addr = writer.get_extra_info('peername')
@@ -103,61 +161,62 @@ async def handle_miner(reader, writer):
     
     async def miner_to_pool():
         nonlocal miner_wallet, worker_name, last_share_time
+        framer = LineFramer()
         try:
             while True:
-                data = await reader.read(4096)
+                data = await reader.read(READ_CHUNK)
                 if not data:
                     break
                 
-                try:
-                    message = json.loads(data.decode())
-                    print(f"INFO: Miner → Proxy: {message}")
-                    
-                    if message.get('method') == 'login':
-                        login = message['params']['login']
-                        miner_wallet = login.split('.')[0]
-                        worker_name = login.split('.')[1] if '.' in login else 'worker01'
-                        print(f"INFO: Miner wallet: {miner_wallet}, worker: {worker_name}")
-                        message['params']['login'] = f"{pool_config['wallet']}.{pool_config['worker']}"
-                    
-                    if message.get('method') == 'submit':
-                        difficulty = int(message['params'].get('job_id', 1000))
-                        coin_price = get_coin_price("XMR")
-                        net_usdt = calculate_share_earnings(difficulty, pool_config['algorithm'], coin_price)
+                # One read may carry a partial message or several; account each line
+                for line in framer.feed(data):
+                    try:
+                        message = json.loads(line)
+                        print(f"INFO: Miner → Proxy: {message}")
+                        
+                        if message.get('method') == 'login':
+                            login = message['params']['login']
+                            miner_wallet = login.split('.')[0]
+                            worker_name = login.split('.')[1] if '.' in login else 'worker01'
+                            print(f"INFO: Miner wallet: {miner_wallet}, worker: {worker_name}")
+                            message['params']['login'] = f"{pool_config['wallet']}.{pool_config['worker']}"
                         
-                        if miner_wallet:
-                            save_share(miner_wallet, worker_name, pool_config['algorithm'], difficulty, coin_price, net_usdt)
+                        if message.get('method') == 'submit':
+                            difficulty = int(message['params'].get('job_id', 1000))
+                            coin_price = price_feed.get("XMR")
+                            net_usdt = calculate_share_earnings(difficulty, pool_config['algorithm'], coin_price)
                             
-                            current_time = time.time()
-                            time_diff = current_time - last_share_time
-                            hashrate = difficulty / max(time_diff, 1)
-                            last_share_time = current_time
-                            print(f"⚡ Hashrate: {hashrate:.2f} H/s")
-                    
-                    pool_writer.write(json.dumps(message).encode() + b'\n')
-                    await pool_writer.drain()
-                    
-                except json.JSONDecodeError:
-                    pool_writer.write(data)
-                    await pool_writer.drain()
+                            if miner_wallet:
+                                save_share(miner_wallet, worker_name, pool_config['algorithm'], difficulty, coin_price, net_usdt)
+                                
+                                current_time = time.time()
+                                time_diff = current_time - last_share_time
+                                hashrate = difficulty / max(time_diff, 1)
+                                last_share_time = current_time
+                                print(f"⚡ Hashrate: {hashrate:.2f} H/s")
+                        
+                        pool_writer.write(json.dumps(message).encode() + b'\n')
+                        
+                    except json.JSONDecodeError:
+                        pool_writer.write(line + b'\n')
+                
+                await pool_writer.drain()
                     
+        except FrameTooLarge as e:
+            print(f"ERROR: Miner sent oversized message, closing: {e}")
         except Exception as e:
             print(f"ERROR: Miner to pool: {e}")
     
     async def pool_to_miner():
         try:
-            while True:
-                data = await pool_reader.read(4096)
-                if not data:
-                    break
-                
+            async for line in read_lines(pool_reader):
                 try:
-                    message = json.loads(data.decode())
+                    message = json.loads(line)
                     print(f"INFO: Pool → Proxy: {message}")
                 except:
                     pass
                 
-                writer.write(data)
+                writer.write(line + b'\n')
                 await writer.drain()
                 
         except Exception as e:
@@ -176,13 +235,28 @@ async def handle_miner(reader, writer):
     await pool_writer.wait_closed()
 
 async def main():
+    global share_writer
+    share_writer = ShareWriter()
+    await pool_configs.start()
+    background = [
+        asyncio.create_task(price_feed.run()),
+        asyncio.create_task(share_writer.run())
+    ]
+    
     server = await asyncio.start_server(handle_miner, '0.0.0.0', 3333)
     addr = server.sockets[0].getsockname()
     print(f"INFO: Stratum server running on {addr}")
     print(f"INFO: Miners can connect to: {addr[0]}:{addr[1]}")
     
-    async with server:
-        await server.serve_forever()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        # Cancelling the writer flushes whatever is still buffered
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        await pool_configs.stop()
 
 if __name__ == "__main__":
     asyncio.run(main())
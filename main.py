@@ -3,16 +3,30 @@ HashMarket API — Marketplace Backend
 Mevcut HashBrotherhood API'ye eklenen marketplace endpointleri
 """
 
-from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime, timedelta
 from decimal import Decimal
+from collections import deque
+import threading
+import asyncio
 import psycopg2
+import psycopg2.extensions
 from psycopg2.extras import RealDictCursor
+import psycopg
+import psycopg.conninfo
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
 import secrets
+import os
+import base64
+import hashlib
 import json
+import time
 
 app = FastAPI(title="HashMarket API", version="1.0.0")
 
@@ -35,9 +49,242 @@ DB_CONFIG = {
 
 COMMISSION_RATE = Decimal("0.03")  # %3
 
+# Proxy callback'leri için paylaşılan anahtar (stratum_proxy.py --api-key / PROXY_API_KEY).
+# Boşsa /api/proxy/* endpoint'leri kapalıdır (503).
+PROXY_API_KEY = os.environ.get("PROXY_API_KEY", "")
+
+# Bağlantı havuzu — uvicorn threadpool'u varsayılan 40 worker thread kullanır,
+# her sync endpoint aynı anda en fazla bir bağlantı tutar
+DB_POOL_MIN = 2
+DB_POOL_MAX = 40
+DB_POOL_TIMEOUT = 10          # boş bağlantı için max bekleme (sn)
+DB_CONN_MAX_LIFETIME = 1800   # bu yaştan büyük bağlantılar yenilenir (sn)
+DB_CONN_CHECK_IDLE = 30       # bu kadar boşta kalan bağlantı verilmeden önce SELECT 1 (sn)
+
+# Async havuz — async endpoint'ler thread tutmaz, eşzamanlılık bağlantı sayısıyla sınırlı
+ADB_POOL_MIN = 2
+ADB_POOL_MAX = 20
+
+# share_logs günlük partition'lı; ham share'ler bu kadar gün tutulur,
+# sonra order_minute_stats'a özetlenip silinir
+SHARE_LOG_RETENTION_DAYS = 30
+SHARE_LOG_PARTITIONS_AHEAD = 7      # ileriye dönük oluşturulan günlük partition
+SHARE_LOG_MAINTENANCE_INTERVAL = 3600
+
+# Proxy event/batch id'leri (tekrar teslimde çift sayımı önler) bu kadar gün tutulur;
+# proxy spool'unun API'ye ulaşamadan bekleyebileceği süreden uzun olmalı
+PROXY_EVENT_RETENTION_DAYS = 7
+
+# Uptime: bağlı ama bu kadar dakika kabul edilen share yoksa downtime sayılır
+UPTIME_STALE_MINUTES = 10
+UPTIME_SWEEP_INTERVAL = 60
+
+# Admin dashboard materialized view yenileme aralığı (sn)
+ADMIN_STATS_REFRESH_INTERVAL = 30
+
+# Public istatistik cache'i: TTL boyunca taze, sonra STALE süresince eski değer
+# dönülürken arka planda yenilenir
+STATS_CACHE_TTL = 30
+STATS_CACHE_STALE = 300
+
+# Realtime push (SSE): abone başına kuyruk; dolunca en eski event atılır
+EVENT_QUEUE_SIZE = 100
+EVENT_KEEPALIVE = 15                # sn, boşta bağlantıya yorum satırı
+EVENT_MAX_STREAMS_PER_USER = 5
+
+# Marketplace ilan listesi sonuç cache'i (filtre kombinasyonu başına)
+LISTINGS_CACHE_TTL = 5          # sn
+LISTINGS_CACHE_MAX = 1024       # tutulan max anahtar
+LISTINGS_PAGE_MAX = 100
+
+
+class DBPoolTimeout(Exception):
+    """Havuzda DB_POOL_TIMEOUT içinde boş bağlantı bulunamadı"""
+
+
+class DBPool:
+    """
+    Thread-safe psycopg2 bağlantı havuzu.
+    Havuz doluysa bekler (psycopg2.pool gibi hata atmaz), bekleme süresini ölçer,
+    bozuk/eski bağlantıları vermeden önce yeniler.
+    """
+    def __init__(self, minconn, maxconn, timeout, max_lifetime, check_idle, **conn_kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_idle = check_idle
+        self.conn_kwargs = conn_kwargs
+        
+        self._idle = deque()      # (conn, last_used)
+        self._created = {}        # id(conn) → oluşturulma zamanı
+        self._size = 0            # açık + açılmakta olan bağlantı sayısı
+        self._cond = threading.Condition()
+        
+        # Metrikler
+        self.acquired = 0
+        self.waits = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.timeouts = 0
+        self.created = 0
+        self.recycled = 0
+        self.broken = 0
+    
+    def _connect(self):
+        conn = psycopg2.connect(**self.conn_kwargs)
+        self._created[id(conn)] = time.monotonic()
+        self.created += 1
+        return conn
+    
+    def _discard(self, conn):
+        self._created.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+    
+    def _is_usable(self, conn, last_used):
+        """Bağlantı verilmeden önce ömür + sağlık kontrolü"""
+        now = time.monotonic()
+        if conn.closed:
+            self.broken += 1
+            return False
+        if now - self._created.get(id(conn), now) > self.max_lifetime:
+            self.recycled += 1
+            return False
+        if now - last_used > self.check_idle:
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT 1")
+                cur.close()
+                conn.rollback()
+            except Exception:
+                self.broken += 1
+                return False
+        return True
+    
+    def open(self):
+        """minconn kadar bağlantıyı önceden aç"""
+        with self._cond:
+            while self._size < self.minconn:
+                self._idle.append((self._connect(), time.monotonic()))
+                self._size += 1
+    
+    def getconn(self):
+        start = time.monotonic()
+        waited = False
+        
+        while True:
+            conn = None
+            with self._cond:
+                while True:
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        break
+                    if self._size < self.maxconn:
+                        self._size += 1
+                        break
+                    remaining = self.timeout - (time.monotonic() - start)
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise DBPoolTimeout(f"No free connection within {self.timeout}s")
+                    waited = True
+                    self._cond.wait(remaining)
+            
+            if conn is not None:
+                if self._is_usable(conn, last_used):
+                    break
+                self._discard(conn)
+            
+            # Yeni bağlantı aç (kilit dışında — TCP+auth süresi diğer thread'leri bekletmesin)
+            try:
+                conn = self._connect()
+                break
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+        
+        elapsed = time.monotonic() - start
+        with self._cond:
+            self.acquired += 1
+            if waited:
+                self.waits += 1
+                self.wait_time_total += elapsed
+                self.wait_time_max = max(self.wait_time_max, elapsed)
+        return conn
+    
+    def putconn(self, conn):
+        usable = not conn.closed
+        if usable and conn.status != psycopg2.extensions.STATUS_READY:
+            # Commit/rollback edilmemiş transaction havuza geri dönmesin
+            try:
+                conn.rollback()
+            except Exception:
+                usable = False
+        
+        with self._cond:
+            if usable:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self.broken += 1
+                self._discard(conn)
+                self._size -= 1
+            self._cond.notify()
+    
+    def closeall(self):
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+                self._size -= 1
+    
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "max": self.maxconn,
+                "acquired": self.acquired,
+                "waits": self.waits,
+                "wait_ms_avg": round(self.wait_time_total / self.waits * 1000, 2) if self.waits else 0,
+                "wait_ms_max": round(self.wait_time_max * 1000, 2),
+                "timeouts": self.timeouts,
+                "created": self.created,
+                "recycled": self.recycled,
+                "broken": self.broken
+            }
+
+
+db_pool = DBPool(
+    DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT, DB_CONN_MAX_LIFETIME, DB_CONN_CHECK_IDLE,
+    **DB_CONFIG, cursor_factory=RealDictCursor
+)
+
+@app.on_event("startup")
+def startup_event():
+    try:
+        db_pool.open()
+    except Exception as e:
+        # DB henüz hazır değilse bağlantılar ilk istekte açılır
+        print(f"⚠️ Database pool warm-up failed: {e}")
+
+@app.on_event("shutdown")
+def shutdown_event():
+    db_pool.closeall()
+
+@app.exception_handler(DBPoolTimeout)
+async def db_pool_timeout_handler(request: Request, exc: DBPoolTimeout):
+    return JSONResponse(status_code=503, content={"detail": "Veritabanı meşgul, tekrar deneyin"})
+
 def get_db():
-    conn = psycopg2.connect(**DB_CONFIG, cursor_factory=RealDictCursor)
-    return conn
+    return db_pool.getconn()
+
+def return_db(conn):
+    db_pool.putconn(conn)
 
 def db_query(sql, params=None, fetch_one=False):
     conn = get_db()
@@ -45,14 +292,16 @@ def db_query(sql, params=None, fetch_one=False):
         cur = conn.cursor()
         cur.execute(sql, params)
         if sql.strip().upper().startswith("SELECT") or "RETURNING" in sql.upper():
-            return cur.fetchone() if fetch_one else cur.fetchall()
+            result = cur.fetchone() if fetch_one else cur.fetchall()
+            conn.commit()  # INSERT/UPDATE ... RETURNING da kalıcı olsun
+            return result
         conn.commit()
         return True
     except Exception as e:
         conn.rollback()
         raise e
     finally:
-        conn.close()
+        return_db(conn)
 
 def db_execute(sql, params=None):
     conn = get_db()
@@ -67,7 +316,7 @@ def db_execute(sql, params=None):
         conn.rollback()
         raise e
     finally:
-        conn.close()
+        return_db(conn)
 
 def db_transaction(queries):
     """Birden fazla sorguyu tek transaction'da çalıştır"""
@@ -87,7 +336,206 @@ def db_transaction(queries):
         conn.rollback()
         raise e
     finally:
-        conn.close()
+        return_db(conn)
+
+
+# ============================================================
+# ASYNC DATABASE — async def endpoint'ler için (psycopg 3)
+# ============================================================
+# Aynı SQL (%s placeholder, dict satırlar) async sürücüyle çalışır.
+# adb_conn() bloğu hatasız biterse commit, hata olursa rollback yapar.
+adb_pool = AsyncConnectionPool(
+    psycopg.conninfo.make_conninfo(**DB_CONFIG),
+    min_size=ADB_POOL_MIN,
+    max_size=ADB_POOL_MAX,
+    timeout=DB_POOL_TIMEOUT,
+    max_lifetime=DB_CONN_MAX_LIFETIME,
+    check=AsyncConnectionPool.check_connection,
+    kwargs={"row_factory": dict_row},
+    open=False
+)
+
+@app.on_event("startup")
+async def startup_async_pool():
+    await adb_pool.open(wait=False)
+
+@app.on_event("shutdown")
+async def shutdown_async_pool():
+    await adb_pool.close()
+
+@app.exception_handler(PoolTimeout)
+async def adb_pool_timeout_handler(request: Request, exc: PoolTimeout):
+    return JSONResponse(status_code=503, content={"detail": "Veritabanı meşgul, tekrar deneyin"})
+
+def adb_conn():
+    return adb_pool.connection()
+
+async def adb_query(sql, params=None, fetch_one=False):
+    async with adb_conn() as conn:
+        cur = await conn.execute(sql, params)
+        if sql.strip().upper().startswith("SELECT") or "RETURNING" in sql.upper():
+            return await cur.fetchone() if fetch_one else await cur.fetchall()
+        return True
+
+async def adb_execute(sql, params=None):
+    async with adb_conn() as conn:
+        cur = await conn.execute(sql, params)
+        if cur.description:
+            return await cur.fetchone() if cur.rowcount == 1 else await cur.fetchall()
+        return cur.rowcount
+
+async def adb_transaction(queries):
+    """Birden fazla sorguyu tek transaction'da çalıştır (async)"""
+    async with adb_conn() as conn:
+        cur = conn.cursor()
+        results = []
+        for sql, params in queries:
+            await cur.execute(sql, params)
+            if cur.description:
+                results.append(await cur.fetchone())
+            else:
+                results.append(cur.rowcount)
+        return results
+
+
+# ============================================================
+# BACKGROUND JOBS — Periyodik DB bakımı
+# ============================================================
+background_tasks = []
+
+async def share_log_maintenance_loop():
+    """share_logs partition'larını oluştur, retention'ı geçenleri özetleyip sil"""
+    while True:
+        try:
+            result = await adb_query(
+                "SELECT * FROM share_log_maintenance(%s, %s)",
+                (SHARE_LOG_RETENTION_DAYS, SHARE_LOG_PARTITIONS_AHEAD), fetch_one=True
+            )
+            if result and (result['created'] or result['dropped']):
+                print(f"🗂️ share_logs maintenance: {result['created']} partition(s) created, "
+                      f"{result['dropped']} dropped, {result['rolled_up']} minute row(s) rolled up")
+        except Exception as e:
+            print(f"⚠️ share_logs maintenance failed: {e}")
+        try:
+            await adb_execute(
+                "DELETE FROM processed_proxy_events WHERE processed_at < NOW() - %s * INTERVAL '1 day'",
+                (PROXY_EVENT_RETENTION_DAYS,)
+            )
+        except Exception as e:
+            print(f"⚠️ processed_proxy_events cleanup failed: {e}")
+        await asyncio.sleep(SHARE_LOG_MAINTENANCE_INTERVAL)
+
+async def uptime_sweep_loop():
+    """Share göndermeyen siparişleri offline'a al, uptime/downtime sürelerini işle"""
+    while True:
+        try:
+            result = await adb_query(
+                "SELECT order_uptime_sweep(%s) AS closed", (UPTIME_STALE_MINUTES,), fetch_one=True
+            )
+            if result and result['closed']:
+                print(f"⏱️ Uptime sweep: {result['closed']} order(s) marked offline")
+        except Exception as e:
+            print(f"⚠️ Uptime sweep failed: {e}")
+        await asyncio.sleep(UPTIME_SWEEP_INTERVAL)
+
+async def admin_stats_refresh_loop():
+    """admin_dashboard_stats materialized view'ini periyodik yenile"""
+    while True:
+        try:
+            await adb_query("SELECT refresh_admin_dashboard_stats() AS refreshed")
+        except Exception as e:
+            print(f"⚠️ Admin stats refresh failed: {e}")
+        await asyncio.sleep(ADMIN_STATS_REFRESH_INTERVAL)
+
+@app.on_event("startup")
+async def start_background_jobs():
+    background_tasks.append(asyncio.create_task(share_log_maintenance_loop()))
+    background_tasks.append(asyncio.create_task(uptime_sweep_loop()))
+    background_tasks.append(asyncio.create_task(admin_stats_refresh_loop()))
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+
+
+# ============================================================
+# REALTIME — Process içi pub/sub (SSE push)
+# ============================================================
+# Frontend get_order/get_messages/get_notifications polling'i yerine
+# /api/events/{wallet} akışını dinler. Yazma yolları commit sonrası publish eder.
+
+class EventBroker:
+    """Kullanıcı bazlı abonelik; publish her thread'den çağrılabilir
+    
+    Her abonenin sınırlı kuyruğu var; yavaş istemci dolu kuyrukta en eski
+    event'i kaybeder (backpressure yazma yollarına yansımaz).
+    """
+    
+    def __init__(self):
+        self.loop = None
+        self.subscribers = {}       # user_id → set(asyncio.Queue)
+        self.published = 0
+        self.dropped = 0
+    
+    def subscribe(self, user_id):
+        queues = self.subscribers.setdefault(user_id, set())
+        if len(queues) >= EVENT_MAX_STREAMS_PER_USER:
+            raise HTTPException(429, "Çok fazla açık event akışı")
+        queue = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
+        queues.add(queue)
+        return queue
+    
+    def unsubscribe(self, user_id, queue):
+        queues = self.subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self.subscribers[user_id]
+    
+    def publish(self, user_ids, event, data):
+        """user_ids'e event gönder (sync endpoint thread'inden de güvenli)"""
+        if self.loop is None or not any(uid in self.subscribers for uid in user_ids):
+            return
+        payload = json.dumps(jsonable_encoder(data), separators=(",", ":"))
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self._deliver(user_ids, event, payload)
+        else:
+            self.loop.call_soon_threadsafe(self._deliver, user_ids, event, payload)
+    
+    def _deliver(self, user_ids, event, payload):
+        for uid in set(user_ids):
+            for queue in self.subscribers.get(uid, ()):
+                if queue.full():
+                    queue.get_nowait()
+                    self.dropped += 1
+                queue.put_nowait((event, payload))
+                self.published += 1
+    
+    def stats(self):
+        return {
+            "users": len(self.subscribers),
+            "streams": sum(len(q) for q in list(self.subscribers.values())),
+            "published": self.published,
+            "dropped": self.dropped
+        }
+
+event_broker = EventBroker()
+
+@app.on_event("startup")
+async def start_event_broker():
+    event_broker.loop = asyncio.get_running_loop()
+
+def publish_notifications(rows):
+    """INSERT INTO notifications ... RETURNING * satırlarını sahiplerine ilet"""
+    for row in rows:
+        event_broker.publish([row['user_id']], "notification", dict(row))
 
 
 # ============================================================
@@ -164,6 +612,18 @@ class OpenDispute(BaseModel):
     reason: str = Field(..., pattern="^(low_hashrate|offline|wrong_pool|wrong_wallet|other)$")
     description: Optional[str] = None
 
+# --- Proxy ---
+class ShareEvent(BaseModel):
+    worker_id: str = Field(..., max_length=50)
+    share_type: str = Field(..., pattern="^(accepted|rejected|stale)$")
+    difficulty: float = 0
+    hashrate: float = 0
+    ts: Optional[float] = None  # proxy tarafındaki unix zamanı
+
+class ShareBatch(BaseModel):
+    shares: List[ShareEvent] = Field(..., max_length=5000)
+    batch_id: Optional[str] = Field(None, max_length=64)  # tekrar gönderimde aynı kalır
+
 
 # ============================================================
 # AUTH ENDPOINTS — Cüzdan bazlı kimlik
@@ -295,7 +755,7 @@ def confirm_deposit(wallet: str, tx_hash: str, amount: float):
         conn.rollback()
         raise HTTPException(500, str(e))
     finally:
-        conn.close()
+        return_db(conn)
     
     return {"status": "ok", "new_balance": balance_after}
 
@@ -343,7 +803,7 @@ def request_withdrawal(wallet: str, amount: float, to_address: str):
         conn.rollback()
         raise HTTPException(500, str(e))
     finally:
-        conn.close()
+        return_db(conn)
     
     return {
         "status": "pending" if requires_admin else "processing",
@@ -357,6 +817,65 @@ def request_withdrawal(wallet: str, amount: float, to_address: str):
 # LISTING ENDPOINTS — İlan yönetimi
 # ============================================================
 
+# Sıralama anahtarı → (SQL ifadesi, cursor değerinin tipi). Her anahtar l.id ile
+# tamamlanır; (algorithm, status, anahtar, id) index'leri keyset sayfalamayı karşılar
+LISTING_SORTS = {
+    "price_per_hour": ("l.price_per_hour", "numeric"),
+    "hashrate": ("l.hashrate", "numeric"),
+    "rating": ("COALESCE(u.seller_rating, 0)", "numeric"),
+    "created_at": ("l.created_at", "timestamp")
+}
+
+_listings_cache = {}            # anahtar → (expires_at, sonuç)
+_listings_cache_lock = threading.Lock()
+_listings_cache_gen = 0         # her invalidation'da artar; eski sorgu sonucu cache'e yazılmaz
+
+def _listings_cache_get(key):
+    with _listings_cache_lock:
+        entry = _listings_cache.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+def _listings_cache_put(key, value, gen):
+    with _listings_cache_lock:
+        if gen != _listings_cache_gen:
+            return
+        if len(_listings_cache) >= LISTINGS_CACHE_MAX:
+            now = time.monotonic()
+            for k in [k for k, (exp, _) in _listings_cache.items() if exp <= now]:
+                del _listings_cache[k]
+            if len(_listings_cache) >= LISTINGS_CACHE_MAX:
+                _listings_cache.clear()
+        _listings_cache[key] = (time.monotonic() + LISTINGS_CACHE_TTL, value)
+
+def invalidate_listings_cache():
+    """İlan/sipariş değişikliğinden sonra marketplace sonuçlarını düşür"""
+    global _listings_cache_gen
+    with _listings_cache_lock:
+        _listings_cache_gen += 1
+        _listings_cache.clear()
+
+def _encode_listing_cursor(value, listing_id, sort_by, sort_desc):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([str(value if value is not None else 0), listing_id,
+                      sort_by, "desc" if sort_desc else "asc"])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_listing_cursor(cursor, sort_by, sort_desc):
+    """Cursor'ı çöz; başka bir sıralamanın cursor'ı ise 400 (değer tipi uymaz)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, listing_id, cursor_sort, cursor_dir = json.loads(raw)
+        value, listing_id = str(value), int(listing_id)
+    except Exception:
+        raise HTTPException(400, "Geçersiz cursor")
+    if (cursor_sort, cursor_dir) != (sort_by, "desc" if sort_desc else "asc"):
+        raise HTTPException(400, "Cursor farklı bir sıralamaya ait, ilk sayfadan başlayın")
+    return value, listing_id
+
+
 @app.get("/api/listings")
 def get_listings(
     algorithm: Optional[str] = None,
@@ -366,15 +885,35 @@ def get_listings(
     sort_by: str = "price_per_hour",
     sort_dir: str = "asc",
     page: int = 1,
-    limit: int = 20
+    limit: int = 20,
+    cursor: Optional[str] = None
 ):
-    """Marketplace ilan listesi"""
+    """Marketplace ilan listesi
+    
+    cursor verilirse keyset sayfalama (OFFSET yok); yoksa page ile eski davranış.
+    Her yanıt bir sonraki sayfa için next_cursor döner.
+    """
+    limit = max(1, min(limit, LISTINGS_PAGE_MAX))
+    page = max(1, page)
+    if sort_by not in LISTING_SORTS:
+        sort_by = "price_per_hour"
+    sort_desc = sort_dir.lower() == "desc"
+    algo_key = algorithm.lower() if algorithm else None
+    
+    filter_key = (algo_key, status, min_price, max_price)
+    page_key = filter_key + (sort_by, sort_desc, limit, cursor, None if cursor else page)
+    
+    cached = _listings_cache_get(page_key)
+    if cached is not None:
+        return cached
+    gen = _listings_cache_gen
+    
     conditions = ["l.status = %s"]
     params = [status]
     
-    if algorithm:
-        conditions.append("LOWER(l.algorithm) = LOWER(%s)")
-        params.append(algorithm)
+    if algo_key:
+        conditions.append("LOWER(l.algorithm) = %s")
+        params.append(algo_key)
     if min_price is not None:
         conditions.append("l.price_per_hour >= %s")
         params.append(min_price)
@@ -382,19 +921,19 @@ def get_listings(
         conditions.append("l.price_per_hour <= %s")
         params.append(max_price)
     
-    # Sort güvenliği
-    allowed_sorts = {
-        "price_per_hour": "l.price_per_hour",
-        "hashrate": "l.hashrate",
-        "rating": "u.seller_rating",
-        "created_at": "l.created_at"
-    }
-    sort_col = allowed_sorts.get(sort_by, "l.price_per_hour")
-    sort_direction = "DESC" if sort_dir.lower() == "desc" else "ASC"
-    
-    offset = (page - 1) * limit
-    
     where = " AND ".join(conditions)
+    sort_col, sort_type = LISTING_SORTS[sort_by]
+    sort_direction = "DESC" if sort_desc else "ASC"
+    
+    page_conditions = list(conditions)
+    page_params = list(params)
+    offset = 0
+    if cursor:
+        after_value, after_id = _decode_listing_cursor(cursor, sort_by, sort_desc)
+        page_conditions.append(f"({sort_col}, l.id) {'<' if sort_desc else '>'} (%s::{sort_type}, %s)")
+        page_params += [after_value, after_id]
+    else:
+        offset = (page - 1) * limit
     
     listings = db_query(f"""
         SELECT l.*, 
@@ -403,26 +942,43 @@ def get_listings(
                u.seller_rating,
                u.seller_rating_count,
                u.is_verified AS seller_verified,
-               u.total_orders_as_seller
+               u.total_orders_as_seller,
+               {sort_col} AS sort_key
         FROM listings l
         JOIN users u ON l.seller_id = u.id
-        WHERE {where}
-        ORDER BY {sort_col} {sort_direction}
+        WHERE {" AND ".join(page_conditions)}
+        ORDER BY {sort_col} {sort_direction}, l.id {sort_direction}
         LIMIT %s OFFSET %s
-    """, params + [limit, offset])
-    
-    # Toplam sayı
-    count = db_query(
-        f"SELECT COUNT(*) as total FROM listings l WHERE {where}",
-        params, fetch_one=True
-    )
-    
-    return {
-        "listings": [dict(l) for l in listings],
-        "total": count['total'],
+    """, page_params + [limit + 1, offset])
+    
+    has_more = len(listings) > limit
+    listings = [dict(l) for l in listings[:limit]]
+    next_cursor = None
+    if has_more:
+        next_cursor = _encode_listing_cursor(listings[-1]['sort_key'], listings[-1]['id'],
+                                             sort_by, sort_desc)
+    for l in listings:
+        l.pop('sort_key', None)
+    
+    # Toplam sayı sıralama/sayfadan bağımsız; filtre başına bir kez sayılır
+    count_key = ("count",) + filter_key
+    total = _listings_cache_get(count_key)
+    if total is None:
+        total = db_query(
+            f"SELECT COUNT(*) as total FROM listings l WHERE {where}",
+            params, fetch_one=True
+        )['total']
+        _listings_cache_put(count_key, total, gen)
+    
+    result = {
+        "listings": listings,
+        "total": total,
         "page": page,
-        "pages": (count['total'] + limit - 1) // limit
+        "pages": (total + limit - 1) // limit,
+        "next_cursor": next_cursor
     }
+    _listings_cache_put(page_key, result, gen)
+    return result
 
 
 @app.get("/api/listings/{listing_id}")
@@ -470,6 +1026,7 @@ def create_listing(data: CreateListing, wallet: str):
         data.proxy_region or 'eu'
     ), fetch_one=True)
     
+    invalidate_listings_cache()
     return dict(listing)
 
 
@@ -507,6 +1064,7 @@ def update_listing(listing_id: int, data: UpdateListing, wallet: str):
         f"UPDATE listings SET {', '.join(updates)} WHERE id = %s RETURNING *",
         params, fetch_one=True
     )
+    invalidate_listings_cache()
     return dict(result)
 
 
@@ -647,11 +1205,13 @@ def create_order(data: CreateOrder, wallet: str):
         cur.execute("""
             INSERT INTO notifications (user_id, type, title, body, related_type, related_id)
             VALUES (%s, 'order_created', 'Yeni sipariş!', %s, 'order', %s)
+            RETURNING *
         """, (
             listing['seller_id'],
             f"İlanınız kiralandı: {order_code}. Lütfen rig'inizi proxy'ye bağlayın.",
             order['id']
         ))
+        notifications = cur.fetchall()
         
         # 7. Proxy session oluştur
         cur.execute("""
@@ -675,6 +1235,8 @@ def create_order(data: CreateOrder, wallet: str):
         ))
         
         conn.commit()
+        invalidate_listings_cache()
+        publish_notifications(notifications)
         
     except HTTPException:
         conn.rollback()
@@ -683,7 +1245,7 @@ def create_order(data: CreateOrder, wallet: str):
         conn.rollback()
         raise HTTPException(500, f"Sipariş oluşturulamadı: {str(e)}")
     finally:
-        conn.close()
+        return_db(conn)
     
     return {
         "order": dict(order),
@@ -722,6 +1284,63 @@ def get_order(order_id: int, wallet: str):
     return dict(order)
 
 
+# Grafik / dispute çözünürlükleri (saniye)
+HASHRATE_RESOLUTIONS = {"1m": 60, "15m": 900, "1h": 3600}
+
+@app.get("/api/orders/{order_id}/hashrate-history")
+def get_order_hashrate_history(order_id: int, wallet: str, resolution: str = "15m",
+                               hours: int = Query(24, ge=1, le=744)):
+    """Sipariş hashrate / share zaman serisi (order_minute_stats'tan)"""
+    if resolution not in HASHRATE_RESOLUTIONS:
+        raise HTTPException(400, f"resolution: {', '.join(HASHRATE_RESOLUTIONS)}")
+    bucket = HASHRATE_RESOLUTIONS[resolution]
+    
+    order = db_query("""
+        SELECT o.id, o.hashrate_ordered, o.hashrate_unit,
+               b.wallet_address AS buyer_wallet, s.wallet_address AS seller_wallet
+        FROM orders o
+        JOIN users b ON o.buyer_id = b.id
+        JOIN users s ON o.seller_id = s.id
+        WHERE o.id = %s
+    """, (order_id,), fetch_one=True)
+    
+    if not order:
+        raise HTTPException(404, "Sipariş bulunamadı")
+    if wallet.lower() not in [order['buyer_wallet'], order['seller_wallet']]:
+        raise HTTPException(403, "Bu siparişi görüntüleme yetkiniz yok")
+    
+    rows = db_query("""
+        SELECT to_timestamp(floor(extract(epoch FROM minute) / %s) * %s) AT TIME ZONE 'UTC' AS bucket,
+               SUM(shares_accepted) AS shares_accepted,
+               SUM(shares_rejected) AS shares_rejected,
+               SUM(difficulty_sum) AS difficulty_sum,
+               AVG(reported_hashrate) AS reported_hashrate,
+               COUNT(*) FILTER (WHERE online) AS online_minutes
+        FROM order_minute_stats
+        WHERE order_id = %s AND minute >= LOCALTIMESTAMP - %s * INTERVAL '1 hour'
+        GROUP BY 1
+        ORDER BY 1
+    """, (bucket, bucket, order_id, hours))
+    
+    # Hashrate = difficulty * 2^32 / süre (proxy ile aynı formül)
+    points = [{
+        "time": r['bucket'],
+        "shares_accepted": int(r['shares_accepted']),
+        "shares_rejected": int(r['shares_rejected']),
+        "hashrate": float(r['difficulty_sum']) * (2**32) / bucket,
+        "reported_hashrate": float(r['reported_hashrate']) if r['reported_hashrate'] is not None else None,
+        "uptime_percent": round(r['online_minutes'] * 60 / bucket * 100, 2),
+    } for r in rows]
+    
+    return {
+        "order_id": order_id,
+        "resolution": resolution,
+        "hashrate_ordered": order['hashrate_ordered'],
+        "hashrate_unit": order['hashrate_unit'],
+        "points": points
+    }
+
+
 @app.get("/api/my-orders/{wallet}")
 def my_orders(wallet: str, role: str = "all", status: Optional[str] = None):
     """Kullanıcının siparişleri"""
@@ -849,7 +1468,7 @@ def open_dispute(order_id: int, data: OpenDispute, wallet: str):
         conn.rollback()
         raise HTTPException(500, str(e))
     finally:
-        conn.close()
+        return_db(conn)
     
     return dict(dispute)
 
@@ -906,7 +1525,7 @@ def rate_order(order_id: int, data: CreateRating, wallet: str):
         conn.rollback()
         raise HTTPException(500, str(e))
     finally:
-        conn.close()
+        return_db(conn)
     
     return dict(rating)
 
@@ -937,12 +1556,18 @@ def send_message(order_id: int, data: SendMessage, wallet: str):
         raise HTTPException(404, "Kullanıcı bulunamadı")
     
     message = db_query("""
-        INSERT INTO messages (order_id, sender_id, content)
-        VALUES (%s, %s, %s)
-        RETURNING *
+        WITH m AS (
+            INSERT INTO messages (order_id, sender_id, content)
+            VALUES (%s, %s, %s)
+            RETURNING *
+        )
+        SELECT m.*, o.buyer_id, o.seller_id FROM m JOIN orders o ON o.id = m.order_id
     """, (order_id, user['id'], data.content), fetch_one=True)
     
-    return dict(message)
+    message = dict(message)
+    parties = [message.pop('buyer_id'), message.pop('seller_id')]
+    event_broker.publish(parties, "message", {**message, "sender_wallet": wallet})
+    return message
 
 
 # ============================================================
@@ -965,6 +1590,35 @@ def get_notifications(wallet: str, unread_only: bool = False):
     return [dict(n) for n in notifs]
 
 
+@app.get("/api/events/{wallet}")
+async def event_stream(wallet: str, request: Request):
+    """Kullanıcının canlı event akışı (SSE): notification, message, order"""
+    user = await adb_query("SELECT id FROM users WHERE wallet_address = %s", (wallet.lower(),), fetch_one=True)
+    if not user:
+        raise HTTPException(404, "Kullanıcı bulunamadı")
+    
+    user_id = user['id']
+    queue = event_broker.subscribe(user_id)
+    
+    async def stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event, payload = await asyncio.wait_for(queue.get(), EVENT_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event}\ndata: {payload}\n\n"
+        finally:
+            event_broker.unsubscribe(user_id, queue)
+    
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @app.put("/api/notifications/read/{wallet}")
 def mark_read(wallet: str, notification_id: Optional[int] = None):
     """Bildirimleri okundu işaretle"""
@@ -987,51 +1641,15 @@ def mark_read(wallet: str, notification_id: Optional[int] = None):
 
 @app.get("/api/admin/dashboard")
 def admin_dashboard():
-    """Admin ana dashboard"""
-    stats = {}
-    
-    # Aktif siparişler
-    stats['active_orders'] = db_query(
-        "SELECT COUNT(*) as count FROM orders WHERE status IN ('paid', 'active', 'delivering')",
-        fetch_one=True
-    )['count']
-    
-    # Onay bekleyen
-    stats['pending_review'] = db_query(
-        "SELECT COUNT(*) as count FROM orders WHERE status = 'delivering' AND review_at IS NOT NULL",
-        fetch_one=True
-    )['count']
-    
-    # Açık dispute
-    stats['open_disputes'] = db_query(
-        "SELECT COUNT(*) as count FROM disputes WHERE status = 'open'",
-        fetch_one=True
-    )['count']
-    
-    # Bugünkü gelir
-    stats['today_commission'] = db_query(
-        "SELECT COALESCE(SUM(commission), 0) as total FROM orders WHERE DATE(completed_at) = CURRENT_DATE AND status = 'completed'",
-        fetch_one=True
-    )['total']
-    
-    # Toplam kullanıcı
-    stats['total_users'] = db_query(
-        "SELECT COUNT(*) as count FROM users",
-        fetch_one=True
-    )['count']
-    
-    # Toplam hacim
-    stats['total_volume'] = db_query(
-        "SELECT COALESCE(SUM(total_paid), 0) as total FROM orders WHERE status = 'completed'",
-        fetch_one=True
-    )['total']
-    
-    # Bekleyen çekimler
-    stats['pending_withdrawals'] = db_query(
-        "SELECT COUNT(*) as count FROM transactions WHERE type = 'withdraw' AND status = 'pending'",
-        fetch_one=True
-    )['count']
-    
+    """Admin ana dashboard (admin_dashboard_stats'tan tek okuma)
+    
+    Sayaçlar ADMIN_STATS_REFRESH_INTERVAL'da bir yenilenir; refreshed_at tazeliği gösterir.
+    """
+    stats = db_query("SELECT * FROM admin_dashboard_stats", fetch_one=True)
+    if not stats:
+        raise HTTPException(503, "İstatistikler henüz hazır değil")
+    stats = dict(stats)
+    stats.pop('id', None)
     return stats
 
 
@@ -1118,6 +1736,10 @@ def admin_order_action(order_id: int, data: AdminOrderAction, admin_id: int = 1)
         cur.execute("SELECT release_escrow(%s, %s, %s, %s)",
                     (order_id, float(payout), float(refund), float(commission)))
         
+        # Açık uptime aralığını kapat, süreyi şimdiye kadar işle (durum değişince
+        # order_uptime_event siparişi artık görmez)
+        cur.execute("SELECT order_uptime_event(%s, NOW()::timestamp, false, 'admin_action')", (order_id,))
+        
         # Sipariş güncelle
         new_status = 'completed' if data.action in ('approve', 'partial') else 'cancelled'
         cur.execute("""
@@ -1169,6 +1791,7 @@ def admin_order_action(order_id: int, data: AdminOrderAction, admin_id: int = 1)
             INSERT INTO notifications (user_id, type, title, body, related_type, related_id)
             VALUES (%s, 'order_completed', %s, %s, 'order', %s),
                    (%s, 'order_completed', %s, %s, 'order', %s)
+            RETURNING *
         """, (
             order['buyer_id'], 'Sipariş tamamlandı',
             f"Sipariş {order['order_code']}: {data.action}. İade: {refund} USDT",
@@ -1177,6 +1800,7 @@ def admin_order_action(order_id: int, data: AdminOrderAction, admin_id: int = 1)
             f"Sipariş {order['order_code']}: {payout} USDT hesabınıza eklendi.",
             order_id
         ))
+        notifications = cur.fetchall()
         
         # Admin log
         cur.execute("""
@@ -1186,12 +1810,16 @@ def admin_order_action(order_id: int, data: AdminOrderAction, admin_id: int = 1)
               json.dumps({"payout": float(payout), "refund": float(refund), "commission": float(commission)})))
         
         conn.commit()
+        invalidate_listings_cache()
+        publish_notifications(notifications)
+        event_broker.publish([order['buyer_id'], order['seller_id']], "order",
+                             {"order_id": order_id, "type": "status", "status": new_status})
         
     except Exception as e:
         conn.rollback()
         raise HTTPException(500, str(e))
     finally:
-        conn.close()
+        return_db(conn)
     
     return {
         "status": new_status,
@@ -1288,207 +1916,462 @@ def admin_ban_user(user_id: int, reason: str = "Platform kuralları ihlali"):
 # ============================================================
 # PROXY CALLBACK ENDPOINTS — Proxy sunucudan gelen veriler
 # ============================================================
+# Proxy'ler bu endpoint'leri ani yüklerle çağırır; threadpool'u (40 thread)
+# bloklamamak için hepsi async DB katmanını kullanır.
+
+def require_proxy_key(x_proxy_key: Optional[str] = Header(None)):
+    """Proxy endpoint'leri: X-Proxy-Key başlığı PROXY_API_KEY ile eşleşmeli
+    
+    Yönlendirme cevapları alıcının pool cüzdanı/şifresini içerir; anahtarsız
+    erişim sipariş bilgilerini ifşa eder.
+    """
+    if not PROXY_API_KEY:
+        raise HTTPException(503, "Proxy API anahtarı yapılandırılmamış")
+    if not x_proxy_key or not secrets.compare_digest(x_proxy_key.encode(), PROXY_API_KEY.encode()):
+        raise HTTPException(401, "Geçersiz proxy anahtarı")
+
+async def claim_proxy_event(cur, event_id):
+    """Proxy event'ini işlenmiş olarak işaretle; aynı id daha önce işlendiyse False
+    
+    Endpoint'in kendi transaction'ında çağrılır: iş rollback olursa id de
+    kaydedilmez. Aynı id ile eşzamanlı ikinci istek unique index'te ilkini bekler.
+    event_id göndermeyen proxy'ler için her zaman True.
+    """
+    if not event_id:
+        return True
+    await cur.execute("""
+        INSERT INTO processed_proxy_events (event_id) VALUES (%s)
+        ON CONFLICT DO NOTHING
+        RETURNING event_id
+    """, (event_id,))
+    return await cur.fetchone() is not None
+
+PROXY_ROUTE_FIELDS = """
+    o.proxy_worker_id AS worker_id, o.pool_host, o.pool_port, o.pool_wallet, o.pool_worker,
+    o.pool_password, o.backup_pool_host, o.backup_pool_port,
+    o.algorithm, o.hashrate_ordered, o.hashrate_unit, o.hours, o.status
+"""
 
-@app.post("/api/proxy/connect")
-def proxy_worker_connected(worker_id: str, miner_ip: str, user_agent: str = None):
-    """Proxy: Worker bağlandı"""
-    conn = get_db()
+@app.get("/api/proxy/order/{worker_id}", dependencies=[Depends(require_proxy_key)])
+async def get_proxy_order(worker_id: str):
+    """Proxy: Worker'ın yönlendirileceği pool bilgisi"""
+    order = await adb_query(f"""
+        SELECT {PROXY_ROUTE_FIELDS}
+        FROM orders o
+        WHERE o.proxy_worker_id = %s AND o.status IN ('paid', 'active')
+    """, (worker_id,), fetch_one=True)
+    if not order:
+        raise HTTPException(404, "Active order not found")
+    return order
+
+
+@app.get("/api/proxy/routes", dependencies=[Depends(require_proxy_key)])
+async def get_proxy_routes(region: Optional[str] = None):
+    """Proxy: Bölgedeki tüm aktif siparişlerin yönlendirmesi (route cache toplu yenileme)"""
+    condition = "AND split_part(o.proxy_server, '.', 1) = %s" if region else ""
+    routes = await adb_query(f"""
+        SELECT {PROXY_ROUTE_FIELDS}
+        FROM orders o
+        WHERE o.status IN ('paid', 'active') {condition}
+    """, (region,) if region else None)
+    return {"routes": routes, "generated_at": time.time()}
+
+
+@app.post("/api/proxy/connect", dependencies=[Depends(require_proxy_key)])
+async def proxy_worker_connected(worker_id: str, miner_ip: str, user_agent: str = None,
+                                 ts: Optional[float] = None,
+                                 event_id: Optional[str] = Query(None, max_length=64)):
+    """Proxy: Worker bağlandı (ts: proxy'deki olay zamanı — spool'dan gecikmeli gelebilir)"""
     try:
-        cur = conn.cursor()
-        
-        # Proxy session güncelle
-        cur.execute("""
-            UPDATE proxy_sessions SET 
-                status = 'connected', 
-                miner_ip = %s,
-                miner_user_agent = %s,
-                connected_at = NOW(),
-                last_activity_at = NOW()
-            WHERE worker_id = %s AND status = 'waiting'
-        """, (miner_ip, user_agent, worker_id))
-        
-        # Order durumunu güncelle
-        cur.execute("""
-            UPDATE orders SET 
-                status = 'active',
-                started_at = NOW(),
-                expected_end_at = NOW() + (hours * INTERVAL '1 hour'),
-                proxy_connected_at = NOW()
-            WHERE proxy_worker_id = %s AND status = 'paid'
-            RETURNING id, buyer_id, seller_id, hours
-        """, (worker_id,))
-        order = cur.fetchone()
-        
-        if order:
-            # Bildirimler
-            cur.execute("""
-                INSERT INTO notifications (user_id, type, title, body, related_type, related_id)
-                VALUES (%s, 'order_started', 'Mining başladı!', %s, 'order', %s)
-            """, (order['buyer_id'], f"Rig bağlandı, {order['hours']} saatlik mining başladı.", order['id']))
+        async with adb_conn() as conn:
+            cur = conn.cursor()
+            if not await claim_proxy_event(cur, event_id):
+                return {"status": "ok", "duplicate": True}
             
-            # Sistem mesajı
-            cur.execute("""
-                INSERT INTO messages (order_id, sender_id, content, is_system)
-                VALUES (%s, %s, '✅ Rig bağlandı, mining başladı!', true)
-            """, (order['id'], order['seller_id']))
-        
-        conn.commit()
+            # Proxy session güncelle
+            await cur.execute("""
+                UPDATE proxy_sessions SET 
+                    status = 'connected', 
+                    miner_ip = %s,
+                    miner_user_agent = %s,
+                    connected_at = t.at,
+                    last_activity_at = t.at
+                FROM (SELECT COALESCE(to_timestamp(%s)::timestamp, NOW()) AS at) t
+                WHERE worker_id = %s AND status = 'waiting'
+            """, (miner_ip, user_agent, ts, worker_id))
+            
+            # Order durumunu güncelle
+            await cur.execute("""
+                UPDATE orders SET 
+                    status = 'active',
+                    started_at = t.at,
+                    expected_end_at = t.at + (hours * INTERVAL '1 hour'),
+                    proxy_connected_at = t.at
+                FROM (SELECT COALESCE(to_timestamp(%s)::timestamp, NOW()) AS at) t
+                WHERE proxy_worker_id = %s AND status = 'paid'
+                RETURNING id, buyer_id, seller_id, hours
+            """, (ts, worker_id))
+            order = await cur.fetchone()
+            
+            # Uptime: online aralığı aç (share gelmezse sweep geri kapatır)
+            await cur.execute("""
+                SELECT order_uptime_event(id, COALESCE(to_timestamp(%s)::timestamp, NOW()::timestamp), true)
+                FROM orders WHERE proxy_worker_id = %s AND status IN ('active', 'delivering', 'dispute')
+            """, (ts, worker_id))
+            
+            notifications = []
+            message = None
+            if order:
+                # Bildirimler
+                await cur.execute("""
+                    INSERT INTO notifications (user_id, type, title, body, related_type, related_id)
+                    VALUES (%s, 'order_started', 'Mining başladı!', %s, 'order', %s)
+                    RETURNING *
+                """, (order['buyer_id'], f"Rig bağlandı, {order['hours']} saatlik mining başladı.", order['id']))
+                notifications = await cur.fetchall()
+                
+                # Sistem mesajı
+                await cur.execute("""
+                    INSERT INTO messages (order_id, sender_id, content, is_system)
+                    VALUES (%s, %s, '✅ Rig bağlandı, mining başladı!', true)
+                    RETURNING *
+                """, (order['id'], order['seller_id']))
+                message = await cur.fetchone()
     except Exception as e:
-        conn.rollback()
         raise HTTPException(500, str(e))
-    finally:
-        conn.close()
+    
+    if order:
+        parties = [order['buyer_id'], order['seller_id']]
+        publish_notifications(notifications)
+        event_broker.publish(parties, "message", dict(message))
+        event_broker.publish(parties, "order", {"order_id": order['id'], "type": "status", "status": "active"})
     
     return {"status": "ok"}
 
 
-@app.post("/api/proxy/share")
-def proxy_share_submitted(
+@app.post("/api/proxy/share", dependencies=[Depends(require_proxy_key)])
+async def proxy_share_submitted(
     worker_id: str, 
     share_type: str,  # accepted, rejected, stale
     difficulty: float = 0,
     hashrate: float = 0
 ):
     """Proxy: Share submit edildi"""
-    order = db_query(
+    order = await adb_query(
         "SELECT id FROM orders WHERE proxy_worker_id = %s AND status = 'active'",
         (worker_id,), fetch_one=True
     )
     if not order:
         return {"status": "no_active_order"}
     
-    session = db_query(
+    session = await adb_query(
         "SELECT id FROM proxy_sessions WHERE worker_id = %s AND status IN ('connected', 'mining') ORDER BY id DESC LIMIT 1",
         (worker_id,), fetch_one=True
     )
     
-    conn = get_db()
     try:
-        cur = conn.cursor()
-        
-        # Share log kaydet
-        cur.execute("""
-            INSERT INTO share_logs (order_id, session_id, share_type, difficulty, calculated_hashrate)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (order['id'], session['id'] if session else None, share_type, difficulty, hashrate))
-        
-        # Order share sayaçlarını güncelle
-        if share_type == 'accepted':
-            cur.execute("""
-                UPDATE orders SET 
-                    shares_accepted = shares_accepted + 1,
-                    current_hashrate = %s,
-                    last_share_at = NOW()
-                WHERE id = %s
-            """, (hashrate, order['id']))
-        else:
-            cur.execute("""
-                UPDATE orders SET shares_rejected = shares_rejected + 1 WHERE id = %s
-            """, (order['id'],))
-        
-        # Proxy session güncelle
-        if session:
-            cur.execute("""
-                UPDATE proxy_sessions SET status = 'mining', last_activity_at = NOW()
-                WHERE id = %s
-            """, (session['id'],))
-        
-        conn.commit()
+        async with adb_conn() as conn:
+            cur = conn.cursor()
+            
+            # Share log kaydet
+            await cur.execute("""
+                INSERT INTO share_logs (order_id, session_id, share_type, difficulty, calculated_hashrate)
+                VALUES (%s, %s, %s, %s, %s)
+            """, (order['id'], session['id'] if session else None, share_type, difficulty, hashrate))
+            
+            # Sipariş/dakika özeti
+            accepted = share_type == 'accepted'
+            await cur.execute("""
+                INSERT INTO order_minute_stats
+                    (order_id, minute, shares_accepted, shares_rejected, difficulty_sum, reported_hashrate, online)
+                VALUES (%s, date_trunc('minute', NOW()::timestamp), %s, %s, %s, %s, %s)
+                ON CONFLICT (order_id, minute) DO UPDATE SET
+                    shares_accepted = order_minute_stats.shares_accepted + EXCLUDED.shares_accepted,
+                    shares_rejected = order_minute_stats.shares_rejected + EXCLUDED.shares_rejected,
+                    difficulty_sum = order_minute_stats.difficulty_sum + EXCLUDED.difficulty_sum,
+                    reported_hashrate = EXCLUDED.reported_hashrate,
+                    online = order_minute_stats.online OR EXCLUDED.online
+            """, (order['id'], int(accepted), int(not accepted), difficulty if accepted else 0, hashrate, accepted))
+            
+            # Order share sayaçlarını güncelle
+            if share_type == 'accepted':
+                await cur.execute("""
+                    UPDATE orders SET 
+                        shares_accepted = shares_accepted + 1,
+                        current_hashrate = %s,
+                        last_share_at = NOW()
+                    WHERE id = %s
+                """, (hashrate, order['id']))
+                
+                # Uptime: offline görünüyorsa online'a geçir
+                await cur.execute("""
+                    SELECT order_uptime_event(id, NOW()::timestamp, true) FROM orders WHERE id = %s AND NOT is_online
+                """, (order['id'],))
+            else:
+                await cur.execute("""
+                    UPDATE orders SET shares_rejected = shares_rejected + 1 WHERE id = %s
+                """, (order['id'],))
+            
+            # Proxy session güncelle
+            if session:
+                await cur.execute("""
+                    UPDATE proxy_sessions SET status = 'mining', last_activity_at = NOW()
+                    WHERE id = %s
+                """, (session['id'],))
     except Exception as e:
-        conn.rollback()
-    finally:
-        conn.close()
+        pass
     
     return {"status": "ok"}
 
 
-@app.post("/api/proxy/hashrate")
-def proxy_hashrate_update(worker_id: str, hashrate: float, hashrate_unit: str, 
-                           shares_period: int = 0, accepted_period: int = 0, rejected_period: int = 0):
-    """Proxy: Periyodik hashrate raporu (her 5dk)"""
-    order = db_query(
-        "SELECT id, hashrate_ordered FROM orders WHERE proxy_worker_id = %s AND status = 'active'",
-        (worker_id,), fetch_one=True
-    )
-    if not order:
-        return {"status": "no_active_order"}
+@app.post("/api/proxy/shares/bulk", dependencies=[Depends(require_proxy_key)])
+async def proxy_shares_bulk(data: ShareBatch):
+    """Proxy: Toplu share bildirimi (share başına HTTP isteği yerine)"""
+    if not data.shares:
+        return {"status": "ok", "inserted": 0, "inactive": []}
+    
+    worker_ids = list({s.worker_id for s in data.shares})
     
-    conn = get_db()
     try:
-        cur = conn.cursor()
-        
-        # Snapshot kaydet
-        cur.execute("""
-            INSERT INTO hashrate_snapshots 
-            (order_id, hashrate, hashrate_unit, shares_in_period, accepted_in_period, rejected_in_period)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """, (order['id'], hashrate, hashrate_unit, shares_period, accepted_period, rejected_period))
-        
-        # Ortalama hashrate hesapla
-        avg = db_query("""
-            SELECT AVG(hashrate) as avg_hr FROM hashrate_snapshots
-            WHERE order_id = %s
-        """, (order['id'],), fetch_one=True)
-        
-        accuracy = (float(avg['avg_hr']) / float(order['hashrate_ordered']) * 100) if order['hashrate_ordered'] > 0 else 0
-        
-        cur.execute("""
-            UPDATE orders SET 
-                current_hashrate = %s,
-                avg_hashrate = %s,
-                hashrate_accuracy = %s
-            WHERE id = %s
-        """, (hashrate, float(avg['avg_hr']), min(accuracy, 100), order['id']))
-        
-        # Düşük hashrate kontrolü
-        if accuracy < 50:
-            cur.execute("""
-                INSERT INTO notifications (user_id, type, title, body, related_type, related_id)
-                SELECT buyer_id, 'hashrate_low', '⚠️ Düşük hashrate!', 
-                       'Hashrate sipariş değerinin %%50 altında: ' || %s::text, 'order', id
-                FROM orders WHERE id = %s
-            """, (round(hashrate, 2), order['id']))
-        
-        conn.commit()
+        async with adb_conn() as conn:
+            cur = conn.cursor()
+            if not await claim_proxy_event(cur, data.batch_id):
+                return {"status": "ok", "inserted": 0, "inactive": [], "duplicate": True}
+            
+            # Worker → aktif sipariş / session eşlemesi (batch başına bir kez)
+            await cur.execute(
+                "SELECT id, proxy_worker_id FROM orders WHERE proxy_worker_id = ANY(%s) AND status = 'active'",
+                (worker_ids,)
+            )
+            orders = {r['proxy_worker_id']: r['id'] for r in await cur.fetchall()}
+            
+            await cur.execute("""
+                SELECT DISTINCT ON (worker_id) id, worker_id FROM proxy_sessions
+                WHERE worker_id = ANY(%s) AND status IN ('connected', 'mining')
+                ORDER BY worker_id, id DESC
+            """, (worker_ids,))
+            sessions = {r['worker_id']: r['id'] for r in await cur.fetchall()}
+            
+            # share_logs kolonları + sipariş başına toplu sayaçlar
+            cols = ([], [], [], [], [], [])  # order_id, session_id, share_type, difficulty, hashrate, ts
+            totals = {}  # order_id → [accepted, rejected, son hashrate, son accepted ts, ilk accepted ts]
+            for share in data.shares:
+                order_id = orders.get(share.worker_id)
+                if not order_id:
+                    continue
+                
+                for col, val in zip(cols, (order_id, sessions.get(share.worker_id), share.share_type,
+                                           share.difficulty, share.hashrate, share.ts)):
+                    col.append(val)
+                
+                t = totals.setdefault(order_id, [0, 0, None, None, None])
+                if share.share_type == 'accepted':
+                    t[0] += 1
+                    t[2] = share.hashrate
+                    t[3] = share.ts or time.time()
+                    if t[4] is None:
+                        t[4] = t[3]
+                else:
+                    t[1] += 1
+            
+            # Tek ifade: share_logs multi-row INSERT + sipariş/dakika özeti upsert
+            # (share başına round trip yok; dakika satırları sabit sırada kilitlenir)
+            if cols[0]:
+                await cur.execute("""
+                    WITH v AS (
+                        SELECT v.order_id, v.session_id, v.share_type, v.difficulty, v.hashrate,
+                               COALESCE(to_timestamp(v.ts)::timestamp, NOW()) AS submitted_at
+                        FROM unnest(%s::int[], %s::bigint[], %s::text[], %s::numeric[], %s::numeric[], %s::float8[])
+                             AS v(order_id, session_id, share_type, difficulty, hashrate, ts)
+                    ), logged AS (
+                        INSERT INTO share_logs (order_id, session_id, share_type, difficulty, calculated_hashrate, submitted_at)
+                        SELECT order_id, session_id, share_type, difficulty, hashrate, submitted_at FROM v
+                    )
+                    INSERT INTO order_minute_stats
+                        (order_id, minute, shares_accepted, shares_rejected, difficulty_sum, reported_hashrate, online)
+                    SELECT order_id, date_trunc('minute', submitted_at),
+                           COUNT(*) FILTER (WHERE share_type = 'accepted'),
+                           COUNT(*) FILTER (WHERE share_type <> 'accepted'),
+                           COALESCE(SUM(difficulty) FILTER (WHERE share_type = 'accepted'), 0),
+                           MAX(hashrate),
+                           bool_or(share_type = 'accepted')
+                    FROM v
+                    GROUP BY 1, 2
+                    ORDER BY 1, 2
+                    ON CONFLICT (order_id, minute) DO UPDATE SET
+                        shares_accepted = order_minute_stats.shares_accepted + EXCLUDED.shares_accepted,
+                        shares_rejected = order_minute_stats.shares_rejected + EXCLUDED.shares_rejected,
+                        difficulty_sum = order_minute_stats.difficulty_sum + EXCLUDED.difficulty_sum,
+                        reported_hashrate = COALESCE(EXCLUDED.reported_hashrate, order_minute_stats.reported_hashrate),
+                        online = order_minute_stats.online OR EXCLUDED.online
+                """, cols)
+            
+            # Sipariş başına tek UPDATE
+            if totals:
+                # Satırlar id sırasıyla kilitlenir (uptime sweep de aynı sırayı kullanır,
+                # UPDATE ... FROM unnest'in join sırası garanti değil → deadlock)
+                ids = sorted(totals)
+                await cur.execute(
+                    "SELECT id FROM orders WHERE id = ANY(%s) ORDER BY id FOR UPDATE", (ids,)
+                )
+                await cur.execute("""
+                    UPDATE orders o SET
+                        shares_accepted = o.shares_accepted + v.accepted,
+                        shares_rejected = o.shares_rejected + v.rejected,
+                        -- Geç gelen (replay/eski) batch daha yeni hashrate'i ezmez
+                        current_hashrate = CASE
+                            WHEN v.hashrate IS NOT NULL AND (o.last_share_at IS NULL
+                                 OR to_timestamp(v.last_ts)::timestamp > o.last_share_at)
+                            THEN v.hashrate ELSE o.current_hashrate END,
+                        last_share_at = GREATEST(o.last_share_at, to_timestamp(v.last_ts)::timestamp)
+                    FROM unnest(%s::int[], %s::int[], %s::int[], %s::numeric[], %s::float8[])
+                         AS v(order_id, accepted, rejected, hashrate, last_ts)
+                    WHERE o.id = v.order_id
+                """, (ids, [totals[i][0] for i in ids], [totals[i][1] for i in ids],
+                      [totals[i][2] for i in ids], [totals[i][3] for i in ids]))
+
+                # Uptime: share gelen ama offline görünen siparişler ilk share anından online
+                online_ids = [i for i in ids if totals[i][0]]
+                if online_ids:
+                    await cur.execute("""
+                        SELECT order_uptime_event(o.id, to_timestamp(v.first_ts)::timestamp, true)
+                        FROM orders o
+                        JOIN unnest(%s::int[], %s::float8[]) AS v(order_id, first_ts) ON o.id = v.order_id
+                        WHERE NOT o.is_online
+                        ORDER BY o.id
+                    """, (online_ids, [totals[i][4] for i in online_ids]))
+
+            inserted = len(cols[0])
+            
+            active_sessions = [sessions[w] for w in worker_ids if w in orders and w in sessions]
+            if active_sessions:
+                await cur.execute("""
+                    UPDATE proxy_sessions SET status = 'mining', last_activity_at = NOW()
+                    WHERE id = ANY(%s)
+                """, (active_sessions,))
     except Exception as e:
-        conn.rollback()
-    finally:
-        conn.close()
+        raise HTTPException(500, str(e))
+    
+    return {
+        "status": "ok",
+        "inserted": inserted,
+        "inactive": [w for w in worker_ids if w not in orders]
+    }
+
+
+@app.post("/api/proxy/hashrate", dependencies=[Depends(require_proxy_key)])
+async def proxy_hashrate_update(worker_id: str, hashrate: float, hashrate_unit: str, 
+                                shares_period: int = 0, accepted_period: int = 0, rejected_period: int = 0,
+                                ts: Optional[float] = None,
+                                event_id: Optional[str] = Query(None, max_length=64)):
+    """Proxy: Periyodik hashrate raporu (her 5dk)"""
+    try:
+        async with adb_conn() as conn:
+            cur = conn.cursor()
+            if not await claim_proxy_event(cur, event_id):
+                return {"status": "ok", "duplicate": True}
+            
+            # Snapshot kaydı + ortalama tek ifadede: orders'taki çalışan toplam/sayaç
+            # güncellenir, hashrate_snapshots üzerinde AVG() yok (sipariş yaşından bağımsız O(1))
+            await cur.execute("""
+                WITH snap AS (
+                    INSERT INTO hashrate_snapshots 
+                    (order_id, hashrate, hashrate_unit, shares_in_period, accepted_in_period, rejected_in_period, recorded_at)
+                    SELECT id, %s, %s, %s, %s, %s, COALESCE(to_timestamp(%s)::timestamp, NOW())
+                    FROM orders WHERE proxy_worker_id = %s AND status = 'active'
+                    RETURNING order_id, hashrate
+                )
+                UPDATE orders o SET 
+                    current_hashrate = snap.hashrate,
+                    hashrate_sum = o.hashrate_sum + snap.hashrate,
+                    hashrate_samples = o.hashrate_samples + 1,
+                    avg_hashrate = (o.hashrate_sum + snap.hashrate) / (o.hashrate_samples + 1),
+                    hashrate_accuracy = CASE WHEN o.hashrate_ordered > 0
+                        THEN LEAST((o.hashrate_sum + snap.hashrate) / (o.hashrate_samples + 1)
+                                   / o.hashrate_ordered * 100, 100)
+                        ELSE 0 END
+                FROM snap
+                WHERE o.id = snap.order_id
+                RETURNING o.id, o.buyer_id, o.seller_id, o.avg_hashrate, CASE WHEN o.hashrate_ordered > 0
+                    THEN o.hashrate_sum / o.hashrate_samples / o.hashrate_ordered * 100
+                    ELSE 0 END AS accuracy
+            """, (hashrate, hashrate_unit, shares_period, accepted_period, rejected_period, ts, worker_id))
+            order = await cur.fetchone()
+            if not order:
+                return {"status": "no_active_order"}
+            
+            accuracy = float(order['accuracy'])
+            
+            # Düşük hashrate kontrolü
+            notifications = []
+            if accuracy < 50:
+                await cur.execute("""
+                    INSERT INTO notifications (user_id, type, title, body, related_type, related_id)
+                    SELECT buyer_id, 'hashrate_low', '⚠️ Düşük hashrate!', 
+                           'Hashrate sipariş değerinin %%50 altında: ' || %s::text, 'order', id
+                    FROM orders WHERE id = %s
+                    RETURNING *
+                """, (round(hashrate, 2), order['id']))
+                notifications = await cur.fetchall()
+    except Exception as e:
+        # Proxy 5xx'te raporu spool'layıp tekrar gönderir
+        raise HTTPException(500, str(e))
+    
+    publish_notifications(notifications)
+    event_broker.publish([order['buyer_id'], order['seller_id']], "order", {
+        "order_id": order['id'], "type": "hashrate",
+        "hashrate": hashrate, "hashrate_unit": hashrate_unit,
+        "avg_hashrate": order['avg_hashrate'], "accuracy": round(accuracy, 2),
+        "accepted": accepted_period, "rejected": rejected_period
+    })
     
     return {"status": "ok", "accuracy": round(accuracy, 2)}
 
 
-@app.post("/api/proxy/disconnect")
-def proxy_worker_disconnected(worker_id: str):
+@app.post("/api/proxy/disconnect", dependencies=[Depends(require_proxy_key)])
+async def proxy_worker_disconnected(worker_id: str, ts: Optional[float] = None,
+                                    event_id: Optional[str] = Query(None, max_length=64)):
     """Proxy: Worker bağlantısı koptu"""
-    conn = get_db()
     try:
-        cur = conn.cursor()
-        
-        cur.execute("""
-            UPDATE proxy_sessions SET status = 'disconnected', disconnected_at = NOW()
-            WHERE worker_id = %s AND status IN ('connected', 'mining')
-        """, (worker_id,))
-        
-        cur.execute("""
-            UPDATE orders SET proxy_disconnected_at = NOW()
-            WHERE proxy_worker_id = %s AND status = 'active'
-            RETURNING id, buyer_id, seller_id
-        """, (worker_id,))
-        order = cur.fetchone()
-        
-        if order:
-            cur.execute("""
-                INSERT INTO notifications (user_id, type, title, body, related_type, related_id)
-                VALUES (%s, 'rig_offline', '🔴 Rig offline!', 'Mining durdu. Satıcı rig''i yeniden bağlamalı.', 'order', %s),
-                       (%s, 'rig_offline', '⚠️ Rig''iniz offline!', 'Lütfen rig''inizi tekrar bağlayın.', 'order', %s)
-            """, (order['buyer_id'], order['id'], order['seller_id'], order['id']))
-        
-        conn.commit()
+        async with adb_conn() as conn:
+            cur = conn.cursor()
+            if not await claim_proxy_event(cur, event_id):
+                return {"status": "ok", "duplicate": True}
+            
+            await cur.execute("""
+                UPDATE proxy_sessions SET status = 'disconnected', disconnected_at = COALESCE(to_timestamp(%s)::timestamp, NOW())
+                WHERE worker_id = %s AND status IN ('connected', 'mining')
+            """, (ts, worker_id))
+            
+            await cur.execute("""
+                UPDATE orders SET proxy_disconnected_at = COALESCE(to_timestamp(%s)::timestamp, NOW())
+                WHERE proxy_worker_id = %s AND status = 'active'
+                RETURNING id, buyer_id, seller_id
+            """, (ts, worker_id))
+            order = await cur.fetchone()
+            
+            # Uptime: online aralığını kapat
+            await cur.execute("""
+                SELECT order_uptime_event(id, COALESCE(to_timestamp(%s)::timestamp, NOW()::timestamp), false, 'disconnect')
+                FROM orders WHERE proxy_worker_id = %s AND is_online
+            """, (ts, worker_id))
+            
+            notifications = []
+            if order:
+                await cur.execute("""
+                    INSERT INTO notifications (user_id, type, title, body, related_type, related_id)
+                    VALUES (%s, 'rig_offline', '🔴 Rig offline!', 'Mining durdu. Satıcı rig''i yeniden bağlamalı.', 'order', %s),
+                           (%s, 'rig_offline', '⚠️ Rig''iniz offline!', 'Lütfen rig''inizi tekrar bağlayın.', 'order', %s)
+                    RETURNING *
+                """, (order['buyer_id'], order['id'], order['seller_id'], order['id']))
+                notifications = await cur.fetchall()
     except Exception as e:
-        conn.rollback()
-    finally:
-        conn.close()
+        raise HTTPException(500, str(e))
+    
+    if order:
+        publish_notifications(notifications)
+        event_broker.publish([order['buyer_id'], order['seller_id']], "order",
+                             {"order_id": order['id'], "type": "status", "status": "offline"})
     
     return {"status": "ok"}
 
@@ -1496,11 +2379,87 @@ def proxy_worker_disconnected(worker_id: str):
 # ============================================================
 # STATS ENDPOINTS — Genel istatistikler
 # ============================================================
+# Home sayfasının her yüklemesinde çağrılır; sonuçlar process içinde
+# stale-while-revalidate ile cache'lenir, ETag/Cache-Control ile CDN'e bırakılır.
+
+class SWRCache:
+    """TTL + stale-while-revalidate cache (tek değer)
+    
+    ttl boyunca taze; sonraki max_stale süresince eski değer hemen dönülür,
+    yenileme arka planda tek task ile yapılır. Eşzamanlı miss'ler aynı yükleme
+    task'ını bekler (single-flight).
+    """
+    
+    def __init__(self, name, loader, ttl=STATS_CACHE_TTL, max_stale=STATS_CACHE_STALE):
+        self.name = name
+        self.loader = loader
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.value = None
+        self.loaded_at = None
+        self.task = None        # süren yükleme
+    
+    async def get(self):
+        age = self.age()
+        if age is not None and age < self.ttl + self.max_stale:
+            if age >= self.ttl:
+                self.refresh()
+            return self.value
+        try:
+            return await asyncio.shield(self.refresh())
+        except Exception:
+            # Süresi çok geçmiş ama hiç yoktan iyidir
+            if self.loaded_at is None:
+                raise
+            return self.value
+    
+    def age(self):
+        return time.monotonic() - self.loaded_at if self.loaded_at is not None else None
+    
+    def refresh(self):
+        if self.task is None:
+            self.task = asyncio.ensure_future(self._load())
+            self.task.add_done_callback(self._done)
+        return self.task
+    
+    async def _load(self):
+        value = await self.loader()
+        self.value, self.loaded_at = value, time.monotonic()
+        return value
+    
+    def _done(self, task):
+        self.task = None
+        if not task.cancelled() and task.exception() is not None:
+            print(f"⚠️ {self.name} cache refresh failed: {task.exception()}")
+
+
+def json_body(loader):
+    """Loader sonucunu (gövde, ETag) çiftine çevir; cache serileştirilmiş JSON tutar"""
+    async def load():
+        value = await loader()
+        body = json.dumps(jsonable_encoder(value), separators=(",", ":")).encode()
+        etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        return body, etag
+    return load
+
+
+async def cached_json_response(cache: SWRCache, request: Request):
+    """Cache'li gövdeyi ETag/Cache-Control ile döndür; If-None-Match tutarsa 304"""
+    body, etag = await cache.get()
+    age = cache.age()
+    max_age = max(0, int(cache.ttl - age)) if age is not None else 0
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={max_age}, stale-while-revalidate={cache.max_stale}"
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match == "*" or etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
-@app.get("/api/stats/algorithms")
-def get_algorithm_stats():
-    """Algoritma bazlı istatistikler"""
-    stats = db_query("""
+
+async def load_algorithm_stats():
+    stats = await adb_query("""
         SELECT algorithm, 
                COUNT(*) as listing_count,
                AVG(price_per_hour) as avg_price,
@@ -1514,15 +2473,30 @@ def get_algorithm_stats():
     return [dict(s) for s in stats]
 
 
+async def load_platform_stats():
+    counts = await adb_query("""
+        SELECT (SELECT COUNT(*) FROM listings WHERE status = 'active') AS total_listings,
+               (SELECT COUNT(*) FROM orders WHERE status = 'completed') AS total_completed,
+               (SELECT COUNT(*) FROM users) AS total_users
+    """, fetch_one=True)
+    algorithms = await adb_query("SELECT DISTINCT algorithm FROM listings WHERE status = 'active'")
+    return {**dict(counts), "algorithms": [dict(a) for a in algorithms]}
+
+
+algorithm_stats_cache = SWRCache("algorithm stats", json_body(load_algorithm_stats))
+platform_stats_cache = SWRCache("platform stats", json_body(load_platform_stats))
+
+
+@app.get("/api/stats/algorithms")
+async def get_algorithm_stats(request: Request):
+    """Algoritma bazlı istatistikler"""
+    return await cached_json_response(algorithm_stats_cache, request)
+
+
 @app.get("/api/stats/platform")
-def platform_stats():
+async def platform_stats(request: Request):
     """Genel platform istatistikleri (public)"""
-    return {
-        "total_listings": db_query("SELECT COUNT(*) as c FROM listings WHERE status = 'active'", fetch_one=True)['c'],
-        "total_completed": db_query("SELECT COUNT(*) as c FROM orders WHERE status = 'completed'", fetch_one=True)['c'],
-        "total_users": db_query("SELECT COUNT(*) as c FROM users", fetch_one=True)['c'],
-        "algorithms": db_query("SELECT DISTINCT algorithm FROM listings WHERE status = 'active'")
-    }
+    return await cached_json_response(platform_stats_cache, request)
 
 
 # ============================================================
@@ -1531,7 +2505,9 @@ def platform_stats():
 
 @app.get("/api/health")
 def health():
-    return {"status": "ok", "service": "HashMarket API", "version": "1.0.0"}
+    return {"status": "ok", "service": "HashMarket API", "version": "1.0.0",
+            "db_pool": db_pool.stats(), "db_pool_async": adb_pool.get_stats(),
+            "events": event_broker.stats()}
 
 
 if __name__ == "__main__":
@@ -7,6 +7,7 @@ Tüm share'leri loglar, hashrate hesaplar, API'ye raporlar.
 
 Kullanım:
   python3 stratum_proxy.py --port 3333 --api http://localhost:8000 --region eu
+  python3 stratum_proxy.py --port 3333 --workers 4   # çok çekirdek (SO_REUSEPORT)
 
 Satıcı bağlantısı:
   stratum+tcp://eu.hashbrotherhood.com:3333 -u hb_ord_XXXXX -p x
@@ -14,12 +15,19 @@ Satıcı bağlantısı:
 
 import asyncio
 import json
+import math
 import time
 import argparse
 import signal
 import sys
+import os
+import queue
+import uuid
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from array import array
 from typing import Optional, Dict
 import aiohttp
 import logging
@@ -39,20 +47,202 @@ log = logging.getLogger("stratum-proxy")
 # ============================================================
 class Config:
     API_BASE = "http://localhost:8000"
+    API_KEY = os.environ.get("PROXY_API_KEY", "")   # /api/proxy/* için X-Proxy-Key
     REGION = "eu"
     PROXY_HOST = "0.0.0.0"
     PROXY_PORT = 3333
     HASHRATE_REPORT_INTERVAL = 300  # 5 dakika
     HEARTBEAT_INTERVAL = 30         # 30 saniye
     SHARE_BUFFER_SIZE = 50          # Bu kadar share birikince toplu gönder
-    MAX_CONNECTIONS = 500
+    SHARE_FLUSH_INTERVAL = 2.0      # ...ya da en geç bu kadar saniyede bir
+    SHARE_BATCH_MAX = 500           # Tek istekte gönderilecek max share
+    SHARE_QUEUE_MAX = 100000        # API erişilemezken bellekte tutulacak max share
+    MAX_CONNECTIONS = 500           # makine başına (--workers modunda process'lere bölünür)
     READ_TIMEOUT = 600              # 10 dk okuma timeout
+    ROUTE_CACHE_TTL = 300           # worker → pool yönlendirmesi cache süresi
+    ROUTE_NEGATIVE_TTL = 30         # bilinmeyen hb_ord_ kodları için cache süresi
+    ROUTE_NEGATIVE_MAX = 10000      # max negatif cache kaydı
+    ROUTE_REFRESH_INTERVAL = 60     # aktif siparişlerin toplu yenilenme aralığı
+    WORKERS = 1                     # >1 ise SO_REUSEPORT ile N proxy process
+    STATS_INTERVAL = 60             # worker → supervisor istatistik aralığı
+    PENDING_SUBMIT_MAX = 256        # session başına cevap bekleyen max submit
+    PENDING_SUBMIT_TTL = 120        # pool bu sürede cevaplamazsa submit unutulur
+    POOL_CONNECT_TIMEOUT = 5        # pool TCP bağlantı timeout'u
+    POOL_HANDSHAKE_TIMEOUT = 10     # subscribe/authorize/login cevabı için süre
+    SUBSCRIBE_REPLY_WAIT = 3        # authorize'ı subscribe cevabını bekleyerek gönderen miner'lar için
+    FAILOVER_ROUNDS = 3             # upstream düşünce tüm pool'ları kaç tur dene
+    FAILOVER_BACKOFF = 2.0          # turlar arası bekleme (her turda 2 katı)
+    SPOOL_DIR = "proxy_spool"       # API'ye ulaşmayan event'ler ("" = kapalı)
+    SPOOL_SEGMENT_BYTES = 8 * 1024 * 1024
+    SPOOL_FSYNC_INTERVAL = 0.5      # bellekteki event'ler bu aralıkla diske yazılır + fsync
+    SPOOL_MEMORY_MAX = 100000       # disk yazılamazsa bellekte tutulacak max event
+    SPOOL_REPLAY_BATCH = 200        # replay'de tek seferde okunan event
+    SPOOL_RETRY_MIN = 1.0           # replay backoff (saniye)
+    SPOOL_RETRY_MAX = 60.0
+
+# ============================================================
+# FAST PATH — Parse edilmesi gereken mesajları byte düzeyinde ayır
+# ============================================================
+# Proxy'nin değiştirdiği veya okuduğu mesajlar (method/cevap işaretleri).
+# Bunları içermeyen satırlar json.loads/dumps yapılmadan olduğu gibi iletilir.
+MINER_PARSE_MARKERS = (b'"mining.authorize"', b'"mining.submit"', b'"login"', b'"submit"', b'"keepalived"')
+POOL_PARSE_MARKERS = (b'"result"', b'"mining.set_difficulty"')
+
+# Authorize'ı subscribe cevabını bekleyerek gönderen miner'lara verilen geçici extranonce
+PLACEHOLDER_EXTRANONCE1 = "hb0001"
+PLACEHOLDER_EXTRANONCE2_SIZE = 4
+
+def needs_parse(data: bytes, markers: tuple) -> bool:
+    for marker in markers:
+        if marker in data:
+            return True
+    return False
+
+
+# ============================================================
+# HASHRATE ESTIMATOR — O(1) kayar pencere
+# ============================================================
+class HashrateEstimator:
+    """
+    Share difficulty'lerinden hashrate tahmini.
+    Share'ler tek bir ring buffer'da (en büyük pencere kadar) tutulur; her pencere
+    buffer'ın bir sonekidir ve kendi başlangıç indeksi + çalışan difficulty
+    toplamına sahiptir. Ekleme ve eviction amortize O(1), toplam yeniden hesaplanmaz.
+    Ayrıca üstel azalan (EWMA) bir iş toplamı tutulur.
+    """
+    WINDOWS = (60, 300, 900, 3600)      # 1m / 5m / 15m / 1h
+    WINDOW_NAMES = {60: "1m", 300: "5m", 900: "15m", 3600: "1h"}
+    
+    __slots__ = ('windows', 'ewma_tau', '_cap', '_times', '_diffs', '_head', '_tail',
+                 '_start', '_sums', '_first_at', '_ewma_work', '_ewma_at')
+    
+    def __init__(self, windows: tuple = WINDOWS, ewma_tau: float = 300.0, capacity: int = 16):
+        self.windows = tuple(sorted(windows))
+        self.ewma_tau = ewma_tau
+        
+        self._cap = capacity
+        self._times = array('d', bytes(8 * capacity))
+        self._diffs = array('d', bytes(8 * capacity))
+        self._head = 0                          # buffer'daki en eski share'in mutlak sırası
+        self._tail = 0                          # sıradaki yazılacak mutlak sıra
+        self._start = [0] * len(self.windows)   # her pencerenin ilk share'i (mutlak sıra)
+        self._sums = [0.0] * len(self.windows)  # her pencerenin difficulty toplamı
+        
+        self._first_at: Optional[float] = None
+        self._ewma_work = 0.0
+        self._ewma_at: Optional[float] = None
+    
+    def _grow(self):
+        new_cap = self._cap * 2
+        times = array('d', bytes(8 * new_cap))
+        diffs = array('d', bytes(8 * new_cap))
+        for seq in range(self._head, self._tail):
+            times[seq % new_cap] = self._times[seq % self._cap]
+            diffs[seq % new_cap] = self._diffs[seq % self._cap]
+        self._times, self._diffs, self._cap = times, diffs, new_cap
+    
+    def _evict(self, now: float):
+        for i, window in enumerate(self.windows):
+            cutoff = now - window
+            seq = self._start[i]
+            total = self._sums[i]
+            while seq < self._tail and self._times[seq % self._cap] < cutoff:
+                total -= self._diffs[seq % self._cap]
+                seq += 1
+            self._start[i] = seq
+            self._sums[i] = total if seq < self._tail else 0.0
+        self._head = self._start[-1]    # en büyük pencerenin dışındakiler atılır
+    
+    def add(self, now: float, difficulty: float):
+        """Yeni share kaydet"""
+        if self._tail - self._head >= self._cap:
+            self._evict(now)
+            if self._tail - self._head >= self._cap:
+                self._grow()
+        
+        idx = self._tail % self._cap
+        self._times[idx] = now
+        self._diffs[idx] = difficulty
+        self._tail += 1
+        for i in range(len(self._sums)):
+            self._sums[i] += difficulty
+        
+        if self._first_at is None:
+            self._first_at = now
+        self._decay_ewma(now)
+        self._ewma_work += difficulty
+        
+        self._evict(now)
+    
+    def _decay_ewma(self, now: float):
+        if self._ewma_at is not None and now > self._ewma_at:
+            self._ewma_work *= math.exp(-(now - self._ewma_at) / self.ewma_tau)
+        self._ewma_at = now
+    
+    def rate(self, window: int, now: Optional[float] = None) -> float:
+        """Pencere içi hashrate (H/s): difficulty * 2^32 / süre"""
+        now = now or time.time()
+        self._evict(now)
+        i = self.windows.index(window)
+        if self._tail - self._start[i] < 2 or self._first_at is None:
+            return 0.0
+        # Oturum pencereden kısaysa sadece geçen süreye böl
+        span = min(window, now - self._first_at)
+        if span <= 0:
+            return 0.0
+        return self._sums[i] * (2**32) / span
+    
+    def ewma(self, now: Optional[float] = None) -> float:
+        """Üstel ağırlıklı hashrate (H/s), zaman sabiti ewma_tau"""
+        now = now or time.time()
+        if self._first_at is None:
+            return 0.0
+        self._decay_ewma(now)
+        # Başlangıçta ağırlıkların toplamı henüz tau'ya ulaşmadı — normalize et
+        weight = self.ewma_tau * (1 - math.exp(-(now - self._first_at) / self.ewma_tau))
+        if weight <= 0:
+            return 0.0
+        return self._ewma_work * (2**32) / weight
+    
+    def rates(self, now: Optional[float] = None) -> dict:
+        """Tüm pencereler + EWMA"""
+        now = now or time.time()
+        result = {self.WINDOW_NAMES.get(w, f"{w}s"): self.rate(w, now) for w in self.windows}
+        result["ewma"] = self.ewma(now)
+        return result
+    
+    def shares_in_window(self, window: int) -> int:
+        return self._tail - self._start[self.windows.index(window)]
+    
+    def memory_bytes(self) -> int:
+        return (sys.getsizeof(self) + sys.getsizeof(self._times) + sys.getsizeof(self._diffs)
+                + sys.getsizeof(self._start) + sys.getsizeof(self._sums))
+
 
 # ============================================================
 # WORKER SESSION — Her bağlantı için
 # ============================================================
 class WorkerSession:
-    def __init__(self, worker_id: str, miner_ip: str):
+    # __dict__ yok — on binlerce eşzamanlı session için bellek tasarrufu.
+    # Yeni alan eklerken buraya da eklenmeli.
+    __slots__ = (
+        'worker_id', 'miner_ip', 'connected_at', 'last_share_at', 'last_report_at',
+        'shares_accepted', 'shares_rejected', 'shares_stale',
+        'period_accepted', 'period_rejected',
+        'hashrate', 'current_hashrate',
+        'target_pool', 'target_port', 'target_wallet', 'target_worker',
+        'pool_reader', 'pool_writer', 'miner_writer',
+        'is_active', 'user_agent', 'algorithm',
+        'subscription_id', 'extranonce1', 'extranonce2_size', 'difficulty',
+        'pending_submits', 'pending_max', 'pending_ttl', 'pending_expired',
+        'protocol', 'upstreams', 'upstream_index', 'pool_password', 'failovers',
+        'miner_login_id', 'miner_session_id', 'upstream_session_id',
+        'miner_subscribe_id', 'miner_authorize_id',
+    )
+    
+    def __init__(self, worker_id: str, miner_ip: str,
+                 pending_max: int = Config.PENDING_SUBMIT_MAX,
+                 pending_ttl: float = Config.PENDING_SUBMIT_TTL):
         self.worker_id = worker_id
         self.miner_ip = miner_ip
         self.connected_at = time.time()
@@ -69,15 +259,20 @@ class WorkerSession:
         self.period_rejected = 0
         
         # Hashrate hesaplama
-        self.share_times: list = []      # son share zamanları
-        self.share_diffs: list = []      # son share difficulty'leri
-        self.current_hashrate = 0.0
+        self.hashrate = HashrateEstimator()
+        self.current_hashrate = 0.0      # 5dk pencere
         
         # Pool bilgileri (API'den gelecek)
         self.target_pool: Optional[str] = None
         self.target_port: Optional[int] = None
         self.target_wallet: Optional[str] = None
         self.target_worker: Optional[str] = None
+        self.pool_password = "x"
+        
+        # Failover: (host, port) listesi — ilki asıl pool, sonrası yedekler
+        self.upstreams: list = []
+        self.upstream_index = 0
+        self.failovers = 0
         
         # Bağlantı nesneleri
         self.pool_reader: Optional[asyncio.StreamReader] = None
@@ -94,7 +289,75 @@ class WorkerSession:
         self.extranonce1 = None
         self.extranonce2_size = None
         self.difficulty = 1
-        self.job_id_map: Dict[str, float] = {}  # job_id → difficulty
+        self.protocol = "stratum"        # "stratum" (v1) veya "cryptonote" (login/submit/job)
+        
+        # CryptoNote: miner'ın login id'si ve session id'leri. Miner ilk pool'un
+        # verdiği id'yi kullanmaya devam eder; yedek pool'a geçince submit'lerde
+        # yeni pool'un id'si yazılır.
+        self.miner_login_id = None
+        self.miner_session_id: Optional[str] = None
+        self.upstream_session_id: Optional[str] = None
+        
+        # Stratum v1: cevabı ilk pool'a bağlanınca verilecek subscribe/authorize id'leri.
+        # Miner'a pool'un gerçek extranonce'u gider; set_extranonce sadece yedek pool'da.
+        self.miner_subscribe_id = None
+        self.miner_authorize_id = None
+        
+        # Cevap bekleyen submit'ler: msg_id → (difficulty, gönderim zamanı).
+        # Ekleme sırası = zaman sırası, eskiler baştan atılır.
+        self.pending_submits: OrderedDict = OrderedDict()
+        self.pending_max = pending_max
+        self.pending_ttl = pending_ttl
+        self.pending_expired = 0         # pool'un hiç cevaplamadığı submit'ler
+    
+    def set_route(self, order: dict):
+        """Sipariş bilgilerinden hedef pool + yedekleri ayarla"""
+        self.target_pool = order.get('pool_host')
+        self.target_port = order.get('pool_port')
+        self.target_wallet = order.get('pool_wallet')
+        self.target_worker = order.get('pool_worker') or self.worker_id
+        self.pool_password = order.get('pool_password') or "x"
+        self.algorithm = order.get('algorithm', '')
+        
+        self.upstreams = [(self.target_pool, self.target_port)]
+        backup = (order.get('backup_pool_host'), order.get('backup_pool_port'))
+        if backup[0] and backup[1] and backup not in self.upstreams:
+            self.upstreams.append(backup)
+    
+    def add_pending_submit(self, msg_id: str, difficulty: float):
+        """Pool'a giden submit'i cevap gelene kadar sakla"""
+        now = time.time()
+        self.expire_pending_submits(now)
+        pending = self.pending_submits
+        pending[msg_id] = (difficulty, now)
+        pending.move_to_end(msg_id)
+        while len(pending) > self.pending_max:
+            pending.popitem(last=False)
+            self.pending_expired += 1
+    
+    def pop_pending_submit(self, msg_id: str) -> Optional[float]:
+        """Submit cevabı geldi — difficulty'yi döndür (bilinmiyorsa None)"""
+        entry = self.pending_submits.pop(msg_id, None)
+        return entry[0] if entry else None
+    
+    def expire_pending_submits(self, now: Optional[float] = None):
+        cutoff = (now or time.time()) - self.pending_ttl
+        pending = self.pending_submits
+        while pending:
+            msg_id, (_, sent_at) = next(iter(pending.items()))
+            if sent_at >= cutoff:
+                break
+            del pending[msg_id]
+            self.pending_expired += 1
+    
+    def memory_bytes(self) -> int:
+        """Session'ın yaklaşık bellek kullanımı (stream nesneleri hariç)"""
+        size = sys.getsizeof(self) + self.hashrate.memory_bytes() + sys.getsizeof(self.pending_submits)
+        for value in (self.worker_id, self.miner_ip, self.target_pool, self.target_wallet,
+                      self.target_worker, self.user_agent, self.algorithm):
+            if value is not None:
+                size += sys.getsizeof(value)
+        return size
     
     def record_share(self, difficulty: float, accepted: bool):
         """Share kaydı + hashrate hesapla"""
@@ -108,25 +371,16 @@ class WorkerSession:
             self.period_rejected += 1
         
         self.last_share_at = now
-        self.share_times.append(now)
-        self.share_diffs.append(difficulty)
-        
-        # Son 5dk'lık pencere
-        cutoff = now - 300
-        while self.share_times and self.share_times[0] < cutoff:
-            self.share_times.pop(0)
-            self.share_diffs.pop(0)
-        
-        # Hashrate hesapla (toplam difficulty / süre)
-        if len(self.share_times) >= 2:
-            time_span = self.share_times[-1] - self.share_times[0]
-            if time_span > 0:
-                total_diff = sum(self.share_diffs)
-                # Hashrate = difficulty * 2^32 / time (standart stratum formülü)
-                self.current_hashrate = (total_diff * (2**32)) / time_span
+        
+        # Hashrate = difficulty * 2^32 / time (standart stratum formülü), son 5dk
+        self.hashrate.add(now, difficulty)
+        self.current_hashrate = self.hashrate.rate(300, now)
     
     def get_period_stats(self):
         """Periyodik rapor verisi al ve sayaçları sıfırla"""
+        # Share gelmiyorsa hashrate de düşsün (son share anındaki değerde kalmasın)
+        self.current_hashrate = self.hashrate.rate(300)
+        self.expire_pending_submits()
         stats = {
             "shares_period": self.period_accepted + self.period_rejected,
             "accepted_period": self.period_accepted,
@@ -143,18 +397,250 @@ class WorkerSession:
         return int(time.time() - self.connected_at)
 
 
+# ============================================================
+# EVENT SPOOL — API'ye ulaşmayan event'ler için disk kuyruğu
+# ============================================================
+class EventSpool:
+    """
+    Append-only disk kuyruğu. API erişilemezken connect/share/hashrate/disconnect
+    event'leri segment dosyalarına JSON satırı olarak yazılır ve API dönünce
+    sırayla (en eski segmentten) tekrar gönderilir.
+    
+    Hot path sadece bellekteki listeye ekler; dosya yazma + fsync tek thread'lik
+    executor'da SPOOL_FSYNC_INTERVAL'da bir toplu yapılır (crash'te en fazla bu
+    aralıktaki event'ler kaybolur). Okuma konumu segment yanındaki .offset
+    dosyasında tutulur, teslim en az bir kez (at-least-once) garantilidir.
+    """
+    def __init__(self, directory: str, config: Config):
+        self.directory = directory
+        self.segment_bytes = config.SPOOL_SEGMENT_BYTES
+        self.fsync_interval = config.SPOOL_FSYNC_INTERVAL
+        self.memory_max = config.SPOOL_MEMORY_MAX
+        self.replay_batch = config.SPOOL_REPLAY_BATCH
+        self.retry_min = config.SPOOL_RETRY_MIN
+        self.retry_max = config.SPOOL_RETRY_MAX
+        
+        self._memory: list = []          # henüz diske yazılmamış satırlar
+        self._disk_depth = 0             # diskte teslim edilmemiş event sayısı
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="spool")
+        self._running = True
+        
+        # Sadece io thread'inde kullanılır
+        self._segments: list = []        # mevcut segment sıra numaraları (küçükten büyüğe)
+        self._write_seq = 0
+        self._fh = None
+        self._fh_size = 0
+        self._read_offset = 0
+        
+        # İstatistik
+        self.spooled_events = 0
+        self.replayed_events = 0
+        self.dropped_events = 0
+    
+    @property
+    def depth(self) -> int:
+        """Teslim edilmemiş event sayısı (bellek + disk)"""
+        return len(self._memory) + self._disk_depth
+    
+    def append(self, event: dict):
+        """Event'i kuyruğa ekle (bloklamaz)"""
+        self._memory.append(json.dumps(event, separators=(',', ':')).encode() + b'\n')
+        self.spooled_events += 1
+    
+    # --- io thread ---
+    def _path(self, seq: int, suffix: str = "seg") -> str:
+        return os.path.join(self.directory, f"{seq:08d}.{suffix}")
+    
+    def _io_open(self) -> int:
+        """Mevcut segmentleri bul, teslim edilmemiş event'leri say"""
+        os.makedirs(self.directory, exist_ok=True)
+        self._segments = sorted(
+            int(name[:-4]) for name in os.listdir(self.directory)
+            if name.endswith(".seg") and name[:-4].isdigit()
+        )
+        self._write_seq = self._segments[-1] if self._segments else 0
+        self._read_offset = 0
+        pending = 0
+        if self._segments:
+            try:
+                with open(self._path(self._segments[0], "offset")) as f:
+                    self._read_offset = int(f.read().strip() or 0)
+            except (OSError, ValueError):
+                pass
+            for i, seq in enumerate(self._segments):
+                with open(self._path(seq), "rb") as f:
+                    if i == 0:
+                        f.seek(self._read_offset)
+                    pending += sum(1 for line in f if line.endswith(b'\n'))
+        return pending
+    
+    def _io_roll(self):
+        if self._fh:
+            self._fh.close()
+        self._write_seq += 1
+        self._fh = open(self._path(self._write_seq), "ab")
+        self._fh_size = 0
+        self._segments.append(self._write_seq)
+    
+    def _io_write(self, lines: list):
+        if self._fh is None or self._fh_size >= self.segment_bytes:
+            self._io_roll()
+        data = b''.join(lines)
+        self._fh.write(data)
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._fh_size += len(data)
+    
+    def _io_remove(self, seq: int):
+        for suffix in ("seg", "offset", "offset.tmp"):
+            try:
+                os.remove(self._path(seq, suffix))
+            except FileNotFoundError:
+                pass
+    
+    def _io_read(self, limit: int) -> list:
+        """En eski segmentten (satır, bitiş offset'i) listesi. Biten segmentler silinir."""
+        while self._segments:
+            seq = self._segments[0]
+            batch = []
+            with open(self._path(seq), "rb") as f:
+                f.seek(self._read_offset)
+                offset = self._read_offset
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break       # yarım yazılmış satır
+                    offset += len(line)
+                    batch.append((line, offset))
+                    if len(batch) >= limit:
+                        break
+            if batch:
+                return batch
+            
+            # Segment tükendi — aktif segmentse de kapatılır, sonraki yazım yenisini açar
+            if seq == self._write_seq and self._fh:
+                self._fh.close()
+                self._fh = None
+            self._segments.pop(0)
+            self._io_remove(seq)
+            self._read_offset = 0
+        return []
+    
+    def _io_commit(self, offset: int):
+        """Okuma konumunu atomik yaz (geçici dosya + fsync + rename); crash'te
+        eski ya da yeni değer kalır, yarım yazılmış değer kalmaz"""
+        self._read_offset = offset
+        path = self._path(self._segments[0], "offset")
+        tmp = self._path(self._segments[0], "offset.tmp")
+        with open(tmp, "w") as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        dir_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    
+    def _io_close(self):
+        if self._fh:
+            self._fh.close()
+            self._fh = None
+    
+    # --- event loop ---
+    async def _run_io(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._io, func, *args)
+    
+    async def _sync(self):
+        """Bellekteki satırları diske yaz"""
+        if not self._memory:
+            return
+        lines, self._memory = self._memory, []
+        try:
+            await self._run_io(self._io_write, lines)
+            self._disk_depth += len(lines)
+        except OSError as e:
+            log.error(f"Spool write failed: {e}")
+            self._memory[:0] = lines
+            overflow = len(self._memory) - self.memory_max
+            if overflow > 0:
+                del self._memory[:overflow]
+                self.dropped_events += overflow
+                log.warning(f"⚠️ Spool memory full, dropped {overflow} oldest event(s)")
+    
+    async def _replay(self, deliver) -> bool:
+        """Diskteki event'leri sırayla teslim et. API hâlâ erişilemezse False."""
+        while self._running:
+            batch = await self._run_io(self._io_read, self.replay_batch)
+            if not batch:
+                self._disk_depth = 0
+                return True
+            
+            delivered = None
+            for line, offset in batch:
+                try:
+                    event = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    event = None
+                if event is not None and not await deliver(event):
+                    break
+                delivered = offset
+                self._disk_depth -= 1
+                self.replayed_events += 1
+            
+            if delivered is not None:
+                await self._run_io(self._io_commit, delivered)
+            if delivered != batch[-1][1]:
+                return False
+        return True
+    
+    async def run(self, deliver):
+        """Periyodik diske yaz + API dönünce replay (exponential backoff)"""
+        try:
+            self._disk_depth = await self._run_io(self._io_open)
+        except OSError as e:
+            log.error(f"Spool disabled, cannot open {self.directory}: {e}")
+            return
+        if self._disk_depth:
+            log.info(f"📦 Spool: {self._disk_depth} undelivered event(s) in {self.directory}")
+        
+        backoff = self.retry_min
+        retry_at = 0.0
+        while self._running:
+            await asyncio.sleep(self.fsync_interval)
+            await self._sync()
+            
+            if self._disk_depth and time.time() >= retry_at:
+                if await self._replay(deliver):
+                    log.info(f"📦 Spool drained ({self.replayed_events} event(s) replayed so far)")
+                    backoff = self.retry_min
+                else:
+                    retry_at = time.time() + backoff
+                    backoff = min(backoff * 2, self.retry_max)
+    
+    async def stop(self):
+        """Kalan event'leri diske yaz ve kapat"""
+        self._running = False
+        await self._sync()
+        await self._run_io(self._io_close)
+        self._io.shutdown(wait=True)
+
+
 # ============================================================
 # API CLIENT — Backend ile iletişim
 # ============================================================
 class APIClient:
-    def __init__(self, base_url: str):
+    def __init__(self, base_url: str, spool: Optional[EventSpool] = None, api_key: str = ""):
         self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.spool = spool                  # teslim edilemeyen event'ler buraya
         self._session: Optional[aiohttp.ClientSession] = None
     
     async def _get_session(self):
         if self._session is None or self._session.closed:
             self._session = aiohttp.ClientSession(
-                timeout=aiohttp.ClientTimeout(total=10)
+                timeout=aiohttp.ClientTimeout(total=10),
+                headers={"X-Proxy-Key": self.api_key} if self.api_key else None
             )
         return self._session
     
@@ -162,19 +648,45 @@ class APIClient:
         if self._session and not self._session.closed:
             await self._session.close()
     
-    async def _post(self, path: str, **params):
+    async def _request(self, path: str, params: Optional[dict] = None, payload=None):
+        """POST at. (cevap, tekrar_denenebilir) döner — 4xx kalıcı hata sayılır."""
         try:
             session = await self._get_session()
-            async with session.post(f"{self.base_url}{path}", params=params) as resp:
+            async with session.post(f"{self.base_url}{path}", params=params, json=payload) as resp:
                 if resp.status == 200:
-                    return await resp.json()
+                    return await resp.json(), False
                 else:
                     text = await resp.text()
                     log.warning(f"API {path} returned {resp.status}: {text}")
-                    return None
+                    # 401/403: proxy anahtarı yanlış/eksik — düzelince tekrar gönderilsin
+                    return None, resp.status >= 500 or resp.status in (401, 403)
         except Exception as e:
             log.error(f"API error {path}: {e}")
-            return None
+            return None, True
+    
+    async def _send(self, path: str, params: Optional[dict], payload, spool: bool):
+        """(cevap, tekrar_denenebilir) döner; spool'a yazılan event için (None, True)"""
+        if spool and self.spool is not None and self.spool.depth:
+            # Spool'da bekleyen event'ler var — sıra bozulmasın diye arkasına ekle
+            self.spool.append({"path": path, "params": params, "json": payload})
+            return None, True
+        result, retryable = await self._request(path, params, payload)
+        if result is None and retryable and spool and self.spool is not None:
+            self.spool.append({"path": path, "params": params, "json": payload})
+        return result, retryable
+    
+    async def _post(self, path: str, spool: bool = False, **params):
+        if spool:
+            # Tekrar gönderimde (spool replay) aynı kalır; API aynı id'yi ikinci kez işlemez
+            params["event_id"] = uuid.uuid4().hex
+        return (await self._send(path, params, None, spool))[0]
+    
+    async def deliver_spooled(self, event: dict) -> bool:
+        """Spool'dan gelen event'i gönder. False = API hâlâ erişilemez, sonra tekrar dene."""
+        result, retryable = await self._request(event["path"], event.get("params"), event.get("json"))
+        if result is None and not retryable:
+            log.warning(f"Dropping spooled event rejected by API: {event['path']}")
+        return result is not None or not retryable
     
     async def _get(self, path: str, **params):
         try:
@@ -188,39 +700,318 @@ class APIClient:
             return None
     
     async def get_order_by_worker(self, worker_id: str):
-        """Sipariş bilgilerini worker_id ile al"""
-        return await self._get(f"/api/proxy/order/{worker_id}")
+        """Sipariş bilgilerini worker_id ile al. Aktif sipariş yoksa False, API'ye ulaşılamazsa None"""
+        path = f"/api/proxy/order/{worker_id}"
+        try:
+            session = await self._get_session()
+            async with session.get(f"{self.base_url}{path}") as resp:
+                if resp.status == 200:
+                    return await resp.json()
+                if resp.status == 404:
+                    return False
+                return None
+        except Exception as e:
+            log.error(f"API error {path}: {e}")
+            return None
+    
+    async def get_routes(self, region: str):
+        """Bölgedeki tüm aktif siparişlerin yönlendirme bilgisi"""
+        return await self._get("/api/proxy/routes", region=region)
     
     async def notify_connect(self, worker_id: str, miner_ip: str, user_agent: str = ""):
-        return await self._post("/api/proxy/connect",
-                                worker_id=worker_id, miner_ip=miner_ip, user_agent=user_agent)
+        return await self._post("/api/proxy/connect", spool=True,
+                                worker_id=worker_id, miner_ip=miner_ip, user_agent=user_agent,
+                                ts=time.time())
     
     async def notify_share(self, worker_id: str, share_type: str, difficulty: float, hashrate: float):
         return await self._post("/api/proxy/share",
                                 worker_id=worker_id, share_type=share_type,
                                 difficulty=difficulty, hashrate=hashrate)
     
+    async def notify_shares_bulk(self, shares: list, batch_id: str, spool: bool = False):
+        """Biriken share event'lerini tek istekte gönder. (cevap, tekrar_denenebilir) döner.
+        
+        batch_id tekrar denemelerde aynı kalmalı: timeout'a rağmen commit olmuş
+        batch tekrar gelirse API onu atlar.
+        """
+        return await self._send("/api/proxy/shares/bulk", None,
+                                {"shares": shares, "batch_id": batch_id}, spool)
+    
     async def notify_hashrate(self, worker_id: str, hashrate: float, hashrate_unit: str,
                                shares_period: int, accepted_period: int, rejected_period: int):
-        return await self._post("/api/proxy/hashrate",
+        return await self._post("/api/proxy/hashrate", spool=True,
                                 worker_id=worker_id, hashrate=hashrate, hashrate_unit=hashrate_unit,
                                 shares_period=shares_period, accepted_period=accepted_period,
-                                rejected_period=rejected_period)
+                                rejected_period=rejected_period, ts=time.time())
     
     async def notify_disconnect(self, worker_id: str):
-        return await self._post("/api/proxy/disconnect", worker_id=worker_id)
+        return await self._post("/api/proxy/disconnect", spool=True,
+                                worker_id=worker_id, ts=time.time())
+
+
+# ============================================================
+# ROUTE CACHE — worker_id → pool yönlendirmesi
+# ============================================================
+class RouteCache:
+    """
+    Her mining.authorize/login'de API'ye gitmemek için worker_id → sipariş
+    yönlendirme cache'i. Bilinmeyen kodlar kısa süreli negatif cache'lenir,
+    aynı worker için eşzamanlı istekler tek API çağrısını paylaşır
+    (reconnect fırtınası backend'e yığılmaz). Cache ROUTE_REFRESH_INTERVAL'da
+    bir /api/proxy/routes ile toplu yenilenir; listede olmayan siparişler düşer.
+    """
+    def __init__(self, api: APIClient, config: Config):
+        self.api = api
+        self.config = config
+        self._entries: Dict[str, tuple] = {}    # worker_id → (order | None, expires_at)
+        self._negatives = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._running = True
+        
+        # İstatistik
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.stale_served = 0
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    async def get(self, worker_id: str):
+        """Sipariş dict'i veya None (aktif sipariş yok / API erişilemez)"""
+        entry = self._entries.get(worker_id)
+        if entry and entry[1] > time.monotonic():
+            if entry[0] is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return entry[0]
+        
+        # Aynı worker için zaten istek varsa onu bekle
+        pending = self._inflight.get(worker_id)
+        if pending:
+            return await asyncio.shield(pending)
+        
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[worker_id] = future
+        order = None
+        try:
+            order = await self.api.get_order_by_worker(worker_id)
+            
+            if order:
+                self._set(worker_id, order, self.config.ROUTE_CACHE_TTL)
+            elif order is False:
+                self._set(worker_id, None, self.config.ROUTE_NEGATIVE_TTL)
+                order = None
+            elif entry and entry[0] is not None:
+                # API erişilemiyor — süresi dolmuş da olsa son bilinen yönlendirmeyi kullan
+                self.stale_served += 1
+                order = entry[0]
+            return order
+        finally:
+            future.set_result(order)
+            self._inflight.pop(worker_id, None)
+    
+    def _set(self, worker_id: str, order, ttl: float):
+        old = self._entries.get(worker_id)
+        if old and old[0] is None:
+            self._negatives -= 1
+        if order is None:
+            if self._negatives >= self.config.ROUTE_NEGATIVE_MAX:
+                self._prune_negatives()
+            self._negatives += 1
+        self._entries[worker_id] = (order, time.monotonic() + ttl)
+    
+    def _prune_negatives(self):
+        """Negatif kayıtlar sınırı aştı — süresi dolanları, yetmezse hepsini at"""
+        now = time.monotonic()
+        expired = [w for w, (o, exp) in self._entries.items() if o is None and exp <= now]
+        if not expired:
+            expired = [w for w, (o, _) in self._entries.items() if o is None]
+        for w in expired:
+            del self._entries[w]
+        self._negatives -= len(expired)
+    
+    def invalidate(self, worker_id: str):
+        """Sipariş bitti — yönlendirmeyi unut"""
+        entry = self._entries.pop(worker_id, None)
+        if entry and entry[0] is None:
+            self._negatives -= 1
+    
+    async def refresh(self):
+        """Aktif siparişlerin tamamını çek, cache'i değiştir"""
+        result = await self.api.get_routes(self.config.REGION)
+        if result is None:
+            return False
+        
+        now = time.monotonic()
+        routes = {r['worker_id']: r for r in result.get('routes', [])}
+        
+        for worker_id, (order, expires_at) in list(self._entries.items()):
+            if order is not None and worker_id not in routes:
+                self.invalidate(worker_id)      # sipariş bitti
+            elif order is None and expires_at <= now:
+                self.invalidate(worker_id)      # süresi dolmuş negatif kayıt
+        
+        for worker_id, order in routes.items():
+            self._set(worker_id, order, self.config.ROUTE_CACHE_TTL)
+        return True
+    
+    async def run(self):
+        """Periyodik toplu yenileme"""
+        while self._running:
+            if await self.refresh():
+                log.debug(f"🗺️ Route cache refreshed: {len(self._entries)} entries")
+            await asyncio.sleep(self.config.ROUTE_REFRESH_INTERVAL)
+    
+    def stop(self):
+        self._running = False
+
+
+# ============================================================
+# SHARE BUFFER — Share'leri biriktir, toplu gönder
+# ============================================================
+class ShareBuffer:
+    """
+    Proxy başına tek bellek içi kuyruk. Share başına HTTP isteği yerine
+    SHARE_BUFFER_SIZE dolunca ya da SHARE_FLUSH_INTERVAL geçince
+    /api/proxy/shares/bulk'a toplu gönderilir. Spool açıksa gönderilemeyen
+    batch'ler diske gider, kapalıysa bellekte bekletilir.
+    """
+    def __init__(self, api: APIClient, config: Config, on_inactive=None):
+        self.api = api
+        self.on_inactive = on_inactive  # aktif siparişi kalmamış worker_id'ler için callback
+        self.max_size = config.SHARE_BUFFER_SIZE
+        self.flush_interval = config.SHARE_FLUSH_INTERVAL
+        self.max_batch = config.SHARE_BATCH_MAX
+        self.max_queue = config.SHARE_QUEUE_MAX
+        self._events: list = []
+        self._retry: list = []           # gönderilemeyen (batch_id, batch) — id'siyle tekrar denenir
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._running = True
+        
+        # İstatistik
+        self.sent_events = 0
+        self.sent_batches = 0
+        self.dropped_events = 0
+        self.rejected_events = 0        # API'nin kalıcı olarak reddettiği (4xx) share'ler
+    
+    def __len__(self):
+        return len(self._events) + sum(len(batch) for _, batch in self._retry)
+    
+    def add(self, worker_id: str, share_type: str, difficulty: float, hashrate: float):
+        """Share event'i kuyruğa ekle (bloklamaz)"""
+        self._events.append({
+            "worker_id": worker_id,
+            "share_type": share_type,
+            "difficulty": difficulty,
+            "hashrate": hashrate,
+            "ts": time.time()
+        })
+        if len(self._events) >= self.max_size:
+            self._wakeup.set()
+    
+    async def run(self):
+        """Boyut veya süre dolunca flush et"""
+        while self._running:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+    
+    async def flush(self):
+        """Kuyruktaki tüm share'leri SHARE_BATCH_MAX'lik parçalar halinde gönder"""
+        async with self._flush_lock:
+            while self._retry or self._events:
+                if self._retry:
+                    batch_id, batch = self._retry.pop(0)
+                else:
+                    batch_id, batch = uuid.uuid4().hex, self._events[:self.max_batch]
+                    del self._events[:self.max_batch]
+                
+                spooled = self.api.spool is not None
+                result, retryable = await self.api.notify_shares_bulk(batch, batch_id, spool=spooled)
+                if result is None and not retryable:
+                    # Kalıcı ret (4xx): tekrar denemek sıradaki share'leri de bloklar
+                    self.rejected_events += len(batch)
+                    log.error(f"❌ Share batch {batch_id} rejected by API, dropped {len(batch)} share(s)")
+                    continue
+                if result is None and spooled:
+                    # Spool'a yazıldı, sıradakine geç
+                    continue
+                if result is None:
+                    # API'ye ulaşılamadı — aynı id ile sıranın başına geri koy, sonraki turda dene
+                    self._retry.insert(0, (batch_id, batch))
+                    self._trim()
+                    break
+                
+                self.sent_events += len(batch)
+                self.sent_batches += 1
+                
+                if self.on_inactive:
+                    for worker_id in result.get('inactive', []):
+                        self.on_inactive(worker_id)
+    
+    def _trim(self):
+        """Kuyruk SHARE_QUEUE_MAX'ı aşarsa en eski share'leri at"""
+        overflow = len(self) - self.max_queue
+        if overflow <= 0:
+            return
+        self.dropped_events += overflow
+        log.warning(f"⚠️ Share queue full, dropped {overflow} oldest share(s)")
+        while overflow > 0 and self._retry:
+            batch = self._retry[0][1]
+            if len(batch) <= overflow:
+                self._retry.pop(0)
+                overflow -= len(batch)
+            else:
+                del batch[:overflow]
+                overflow = 0
+        del self._events[:overflow]
+    
+    async def stop(self):
+        """Son kalan share'leri gönder"""
+        self._running = False
+        self._wakeup.set()
+        await self.flush()
 
 
 # ============================================================
 # STRATUM PROXY SERVER
 # ============================================================
 class StratumProxy:
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, worker_index: Optional[int] = None, stats_queue=None):
         self.config = config
-        self.api = APIClient(config.API_BASE)
+        self.worker_index = worker_index    # --workers modunda bu process'in sırası
+        self.stats_queue = stats_queue      # supervisor'a istatistik kanalı
+        self.spool = None
+        if config.SPOOL_DIR:
+            # Her worker process'in kendi spool dizini (yeniden başlayınca aynı dizini okur)
+            spool_dir = config.SPOOL_DIR if worker_index is None else os.path.join(config.SPOOL_DIR, f"w{worker_index}")
+            self.spool = EventSpool(spool_dir, config)
+        self.api = APIClient(config.API_BASE, self.spool, config.API_KEY)
+        self.routes = RouteCache(self.api, config)
+        self.shares = ShareBuffer(self.api, config, on_inactive=self.routes.invalidate)
         self.sessions: Dict[str, WorkerSession] = {}
         self.server: Optional[asyncio.AbstractServer] = None
         self._running = True
+        
+        # Eşzamanlı bağlantı limiti (handshake öncesi dahil). --workers modunda
+        # MAX_CONNECTIONS makine başınadır, her process eşit pay alır.
+        self.active_connections = 0
+        self.max_connections = -(-config.MAX_CONNECTIONS // max(1, config.WORKERS))
+        self._next_proxy_id = 1_000_000_000
+        
+        # Process ömrü boyunca sayaçlar
+        self.connections_total = 0
+        self.connections_rejected = 0
+        self.failovers = 0
+        self.shares_accepted = 0
+        self.shares_rejected = 0
     
     async def start(self):
         """Proxy sunucuyu başlat"""
@@ -228,7 +1019,8 @@ class StratumProxy:
             self.handle_miner,
             self.config.PROXY_HOST,
             self.config.PROXY_PORT,
-            limit=65536
+            limit=65536,
+            reuse_port=self.config.WORKERS > 1
         )
         
         addr = self.server.sockets[0].getsockname()
@@ -236,13 +1028,32 @@ class StratumProxy:
         log.info(f"  HashMarket Stratum Proxy v1.0")
         log.info(f"  Region: {self.config.REGION}")
         log.info(f"  Listening: {addr[0]}:{addr[1]}")
+        if self.worker_index is not None:
+            log.info(f"  Worker: {self.worker_index + 1}/{self.config.WORKERS} (pid {os.getpid()})")
         log.info(f"  API: {self.config.API_BASE}")
+        if not self.config.API_KEY:
+            log.warning("⚠️ No --api-key / PROXY_API_KEY set, API will reject proxy requests")
         log.info(f"  Hashrate report interval: {self.config.HASHRATE_REPORT_INTERVAL}s")
+        log.info(f"  Share batch: {self.config.SHARE_BUFFER_SIZE} shares / {self.config.SHARE_FLUSH_INTERVAL}s")
         log.info(f"═══════════════════════════════════════════════")
         
         # Background task: periyodik hashrate raporlama
         asyncio.create_task(self._periodic_reporter())
         
+        # Background task: share kuyruğunu toplu gönder
+        asyncio.create_task(self.shares.run())
+        
+        # Background task: yönlendirme cache'ini yenile
+        asyncio.create_task(self.routes.run())
+        
+        # Background task: spool'u diske yaz / API dönünce tekrar gönder
+        if self.spool:
+            asyncio.create_task(self.spool.run(self.api.deliver_spooled))
+        
+        # Background task: supervisor'a istatistik gönder
+        if self.stats_queue is not None:
+            asyncio.create_task(self._stats_publisher())
+        
         async with self.server:
             await self.server.serve_forever()
     
@@ -259,9 +1070,45 @@ class StratumProxy:
             self.server.close()
             await self.server.wait_closed()
         
+        self.routes.stop()
+        await self.shares.stop()
+        if self.spool:
+            await self.spool.stop()
         await self.api.close()
         log.info("Proxy stopped.")
     
+    def get_stats(self) -> dict:
+        """Bu process'in anlık istatistikleri"""
+        return {
+            "pid": os.getpid(),
+            "sessions": len(self.sessions),
+            "connections": self.active_connections,
+            "connections_total": self.connections_total,
+            "connections_rejected": self.connections_rejected,
+            "failovers": self.failovers,
+            "shares_accepted": self.shares_accepted,
+            "shares_rejected": self.shares_rejected,
+            "hashrate": sum(s.current_hashrate for s in self.sessions.values()),
+            "share_queue": len(self.shares),
+            "shares_dropped": self.shares.dropped_events,
+            "shares_rejected_by_api": self.shares.rejected_events,
+            "spool_depth": self.spool.depth if self.spool else 0,
+            "spool_replayed": self.spool.replayed_events if self.spool else 0,
+            "route_cache": len(self.routes),
+            "pending_submits": sum(len(s.pending_submits) for s in self.sessions.values()),
+            "pending_expired": sum(s.pending_expired for s in self.sessions.values()),
+            "session_memory_bytes": sum(s.memory_bytes() for s in self.sessions.values()),
+        }
+    
+    async def _stats_publisher(self):
+        """STATS_INTERVAL'da bir istatistikleri supervisor'a gönder"""
+        while self._running:
+            try:
+                self.stats_queue.put_nowait((self.worker_index, self.get_stats()))
+            except Exception as e:
+                log.debug(f"Stats publish failed: {e}")
+            await asyncio.sleep(self.config.STATS_INTERVAL)
+    
     async def handle_miner(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
         """Yeni miner bağlantısı"""
         addr = writer.get_extra_info('peername')
@@ -269,7 +1116,15 @@ class StratumProxy:
         worker_id = None
         session = None
         
+        if self.active_connections >= self.max_connections:
+            self.connections_rejected += 1
+            log.warning(f"🚫 Connection limit reached ({self.max_connections}), rejecting {miner_ip}")
+            writer.close()
+            return
+        
         log.info(f"🔌 New connection from {miner_ip}")
+        self.connections_total += 1
+        self.active_connections += 1
         
         try:
             # İlk mesajı bekle (mining.subscribe veya login)
@@ -289,27 +1144,24 @@ class StratumProxy:
             
             log.info(f"✅ Worker {worker_id} authenticated → {session.target_pool}:{session.target_port}")
             
-            # Pool'a bağlan
-            try:
-                pool_reader, pool_writer = await asyncio.open_connection(
-                    session.target_pool, session.target_port
-                )
-                session.pool_reader = pool_reader
-                session.pool_writer = pool_writer
-                log.info(f"🔗 Connected to pool: {session.target_pool}:{session.target_port}")
-            except Exception as e:
-                log.error(f"❌ Pool connection failed: {session.target_pool}:{session.target_port} → {e}")
-                await self._send_error(writer, -1, f"Pool connection failed: {e}")
-                writer.close()
-                await writer.wait_closed()
+            # Pool'a bağlan (asıl pool, olmazsa yedekler)
+            if not await self._connect_upstream(session, 0, initial=True):
+                pools = ", ".join(f"{host}:{port}" for host, port in session.upstreams)
+                log.error(f"❌ Pool connection failed for {worker_id}: {pools}")
+                msg_id = (session.miner_login_id if session.protocol == "cryptonote"
+                          else session.miner_authorize_id if session.miner_authorize_id is not None else -1)
+                await self._send_error(writer, msg_id, "Pool connection failed")
                 return
             
-            # İki yönlü proxy başlat
-            await asyncio.gather(
-                self._miner_to_pool(session, reader, writer),
-                self._pool_to_miner(session, writer),
-                return_exceptions=True
-            )
+            # İki yönlü proxy başlat — biri biterse (miner koptu / pool'lar tükendi) diğeri de durur
+            tasks = {
+                asyncio.create_task(self._miner_to_pool(session, reader, writer)),
+                asyncio.create_task(self._pool_to_miner(session, writer)),
+            }
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
             
         except asyncio.CancelledError:
             pass
@@ -317,6 +1169,7 @@ class StratumProxy:
             log.error(f"💥 Error handling {miner_ip}: {e}")
         finally:
             # Cleanup
+            self.active_connections -= 1
             if worker_id and session:
                 await self._cleanup_session(worker_id, session)
             
@@ -329,13 +1182,34 @@ class StratumProxy:
     async def _handle_handshake(self, reader, writer, miner_ip):
         """Stratum handshake — worker_id'yi al, sipariş bilgilerini çek"""
         buffer = b""
+        user_agent = ""
+        subscribe_id = None         # cevabı pool'a bağlanınca verilecek subscribe
+        placeholder_sent = False
         
         while True:
+            # Subscribe cevabı bekletiliyorsa authorize için kısa süre bekle
+            timeout = self.config.SUBSCRIBE_REPLY_WAIT if subscribe_id is not None else 30
             try:
-                data = await asyncio.wait_for(reader.read(4096), timeout=30)
+                data = await asyncio.wait_for(reader.read(4096), timeout=timeout)
             except asyncio.TimeoutError:
-                log.warning(f"Handshake timeout from {miner_ip}")
-                return None, None
+                if subscribe_id is None:
+                    log.warning(f"Handshake timeout from {miner_ip}")
+                    return None, None
+                # Miner authorize'ı subscribe cevabından sonra gönderiyor. Pool henüz
+                # bilinmediği için geçici extranonce verilir, pool'a bağlanınca
+                # mining.set_extranonce ile gerçeği gönderilir.
+                await self._send_json(writer, {
+                    "id": subscribe_id,
+                    "result": [
+                        ["mining.notify", "hb_sub_001"],
+                        PLACEHOLDER_EXTRANONCE1,
+                        PLACEHOLDER_EXTRANONCE2_SIZE
+                    ],
+                    "error": None
+                })
+                subscribe_id = None
+                placeholder_sent = True
+                continue
             
             if not data:
                 return None, None
@@ -358,21 +1232,11 @@ class StratumProxy:
                 
                 # --- mining.subscribe ---
                 if method == 'mining.subscribe':
-                    user_agent = ""
                     if msg.get('params') and len(msg['params']) > 0:
                         user_agent = msg['params'][0]
                     
-                    # Subscribe response gönder
-                    response = {
-                        "id": msg.get('id', 1),
-                        "result": [
-                            ["mining.notify", "hb_sub_001"],
-                            "hb0001",  # extranonce1
-                            4           # extranonce2_size
-                        ],
-                        "error": None
-                    }
-                    await self._send_json(writer, response)
+                    # Cevap pool'a bağlanınca, pool'un extranonce'u ile verilecek
+                    subscribe_id = msg.get('id', 1)
                     continue
                 
                 # --- mining.authorize ---
@@ -392,7 +1256,7 @@ class StratumProxy:
                         return None, None
                     
                     # API'den sipariş bilgilerini al
-                    order = await self.api.get_order_by_worker(worker_id)
+                    order = await self.routes.get(worker_id)
                     
                     if not order:
                         await self._send_error(writer, msg.get('id'),
@@ -400,22 +1264,18 @@ class StratumProxy:
                         return None, None
                     
                     # Session oluştur
-                    session = WorkerSession(worker_id, miner_ip)
-                    session.user_agent = user_agent if 'user_agent' in dir() else ""
+                    session = WorkerSession(worker_id, miner_ip,
+                                            self.config.PENDING_SUBMIT_MAX, self.config.PENDING_SUBMIT_TTL)
+                    session.user_agent = user_agent
                     session.miner_writer = writer
-                    session.target_pool = order.get('pool_host')
-                    session.target_port = order.get('pool_port')
-                    session.target_wallet = order.get('pool_wallet')
-                    session.target_worker = order.get('pool_worker') or worker_id
-                    session.algorithm = order.get('algorithm', '')
+                    session.set_route(order)
+                    if placeholder_sent:
+                        session.extranonce1 = PLACEHOLDER_EXTRANONCE1
+                        session.extranonce2_size = PLACEHOLDER_EXTRANONCE2_SIZE
                     
-                    # Authorize OK
-                    response = {
-                        "id": msg.get('id', 2),
-                        "result": True,
-                        "error": None
-                    }
-                    await self._send_json(writer, response)
+                    # Subscribe + authorize cevapları pool'a bağlanınca pool'un cevabıyla verilecek
+                    session.miner_subscribe_id = subscribe_id
+                    session.miner_authorize_id = msg.get('id', 2)
                     
                     return worker_id, session
                 
@@ -430,24 +1290,22 @@ class StratumProxy:
                             "Invalid login. Use your order code: hb_ord_XXXXX")
                         return None, None
                     
-                    order = await self.api.get_order_by_worker(worker_id)
+                    order = await self.routes.get(worker_id)
                     
                     if not order:
                         await self._send_error(writer, msg.get('id'),
                             f"No active order found for {worker_id}")
                         return None, None
                     
-                    session = WorkerSession(worker_id, miner_ip)
+                    session = WorkerSession(worker_id, miner_ip,
+                                            self.config.PENDING_SUBMIT_MAX, self.config.PENDING_SUBMIT_TTL)
                     session.user_agent = params.get('agent', '')
                     session.miner_writer = writer
-                    session.target_pool = order.get('pool_host')
-                    session.target_port = order.get('pool_port')
-                    session.target_wallet = order.get('pool_wallet')
-                    session.target_worker = order.get('pool_worker') or worker_id
-                    session.algorithm = order.get('algorithm', '')
+                    session.set_route(order)
+                    session.protocol = "cryptonote"
                     
-                    # Login'i pool credential'larıyla değiştireceğiz
-                    # (pool bağlantısı sonra yapılacak)
+                    # Login cevabı pool'a bağlanınca pool'un cevabıyla verilecek
+                    session.miner_login_id = msg.get('id')
                     
                     return worker_id, session
         
@@ -472,144 +1330,383 @@ class StratumProxy:
             
             buffer += data
             
-            while b'\n' in buffer:
-                line, buffer = buffer.split(b'\n', 1)
-                line = line.strip()
-                if not line:
+            end = buffer.rfind(b'\n')
+            if end < 0:
+                continue
+            chunk, buffer = buffer[:end + 1], buffer[end + 1:]
+            
+            # Fast path: proxy'nin değiştirmesi gereken mesaj yoksa byte'ları aynen ilet
+            if not needs_parse(chunk, MINER_PARSE_MARKERS):
+                await self._write_pool(session, chunk)
+                continue
+            
+            out = []
+            for line in chunk.split(b'\n'):
+                if not line.strip():
+                    continue
+                
+                if not needs_parse(line, MINER_PARSE_MARKERS):
+                    out.append(line + b'\n')
                     continue
                 
                 try:
-                    msg = json.loads(line.decode())
-                except json.JSONDecodeError:
+                    msg = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
                     # Raw data forward
-                    if session.pool_writer:
-                        session.pool_writer.write(line + b'\n')
-                        await session.pool_writer.drain()
+                    out.append(line + b'\n')
                     continue
                 
                 method = msg.get('method', '')
+                rewritten = False
                 
                 # --- mining.authorize → Pool'a wallet ile gönder ---
                 if method == 'mining.authorize':
                     msg['params'] = [
                         f"{session.target_wallet}.{session.target_worker}",
-                        "x"
+                        session.pool_password
                     ]
+                    rewritten = True
                     log.debug(f"📤 Auth rewritten → {session.target_wallet}")
                 
                 # --- mining.submit → Share log ---
                 elif method == 'mining.submit':
-                    # Share'i logla (henüz kabul/red bilmiyoruz, pool cevabını bekleyeceğiz)
                     msg_id = msg.get('id')
+                    if session.pool_writer is None:
+                        await self._reject_submit(session, writer, msg_id)
+                        continue
+                    
+                    # Share'i logla (henüz kabul/red bilmiyoruz, pool cevabını bekleyeceğiz)
                     if msg_id:
-                        session.job_id_map[str(msg_id)] = session.difficulty
+                        session.add_pending_submit(str(msg_id), session.difficulty)
                     
                     # Worker adını değiştir
                     if msg.get('params') and len(msg['params']) > 0:
                         msg['params'][0] = f"{session.target_wallet}.{session.target_worker}"
+                        rewritten = True
                 
                 # --- login (CN/RX) → Pool credential'larıyla değiştir ---
                 elif method == 'login':
                     if 'params' in msg:
                         msg['params']['login'] = session.target_wallet
-                        msg['params']['pass'] = 'x'
+                        msg['params']['pass'] = session.pool_password
+                        rewritten = True
                 
-                # --- submit (CN/RX) ---
-                elif method == 'submit':
+                # --- submit / keepalived (CN/RX) ---
+                elif method in ('submit', 'keepalived'):
                     msg_id = msg.get('id')
-                    if msg_id:
-                        session.job_id_map[str(msg_id)] = session.difficulty
+                    if method == 'submit' and session.pool_writer is None:
+                        await self._reject_submit(session, writer, msg_id)
+                        continue
+                    if method == 'submit' and msg_id:
+                        session.add_pending_submit(str(msg_id), session.difficulty)
+                    
+                    # Yedek pool'a geçildiyse session id'yi yeni pool'unkiyle değiştir
+                    params = msg.get('params')
+                    if (isinstance(params, dict) and session.upstream_session_id
+                            and params.get('id') != session.upstream_session_id):
+                        params['id'] = session.upstream_session_id
+                        rewritten = True
                 
-                # Pool'a forward
-                if session.pool_writer:
-                    out = json.dumps(msg).encode() + b'\n'
-                    session.pool_writer.write(out)
-                    await session.pool_writer.drain()
+                # Sadece değişen mesajlar yeniden serialize edilir
+                out.append(json.dumps(msg).encode() + b'\n' if rewritten else line + b'\n')
+            
+            # Pool'a forward (chunk başına tek write/drain)
+            if out:
+                await self._write_pool(session, b''.join(out))
+    
+    async def _reject_submit(self, session: WorkerSession, writer: asyncio.StreamWriter, msg_id):
+        """Yedek pool'a geçiş sürerken gelen submit pool'a gitmez — miner'a stale hatası dön"""
+        session.shares_stale += 1
+        error_msg = "Pool switching, share not submitted"
+        if session.protocol == "cryptonote":
+            response = {"id": msg_id, "jsonrpc": "2.0", "result": None,
+                        "error": {"code": -1, "message": error_msg}}
+        else:
+            response = {"id": msg_id, "result": None, "error": [21, error_msg, None]}
+        await self._send_json(writer, response)
+    
+    async def _write_pool(self, session: WorkerSession, data: bytes):
+        """Pool'a yaz. Upstream kopmuşsa/değişiyorsa mesaj düşer, miner bağlantısı sürer."""
+        pool_writer = session.pool_writer
+        if pool_writer is None:
+            return
+        try:
+            pool_writer.write(data)
+            await pool_writer.drain()
+        except (ConnectionError, OSError) as e:
+            # Okuma tarafı kopmayı görüp failover başlatır
+            log.debug(f"Pool write failed for {session.worker_id}: {e}")
     
     async def _pool_to_miner(self, session: WorkerSession, miner_writer: asyncio.StreamWriter):
         """Pool → Miner yönü (share result intercept)"""
         buffer = b""
         
         while session.is_active:
-            if not session.pool_reader:
-                await asyncio.sleep(0.1)
-                continue
-            
             try:
                 data = await asyncio.wait_for(
                     session.pool_reader.read(4096),
                     timeout=self.config.READ_TIMEOUT
                 )
-            except asyncio.TimeoutError:
-                break
+            except (asyncio.TimeoutError, ConnectionError, OSError):
+                data = b""
             
             if not data:
-                break
+                # Upstream düştü — miner bağlıyken yedek pool'a geç
+                if not session.is_active or not await self._failover(session):
+                    break
+                buffer = b""
+                continue
             
             buffer += data
             
-            while b'\n' in buffer:
-                line, buffer = buffer.split(b'\n', 1)
-                line = line.strip()
-                if not line:
-                    continue
-                
-                try:
-                    msg = json.loads(line.decode())
-                except json.JSONDecodeError:
-                    miner_writer.write(line + b'\n')
-                    await miner_writer.drain()
-                    continue
-                
-                # --- Share result (mining.submit cevabı) ---
-                msg_id = str(msg.get('id', ''))
-                if msg_id in session.job_id_map:
-                    difficulty = session.job_id_map.pop(msg_id)
-                    accepted = msg.get('result', False) is True or msg.get('result') is not None
-                    error = msg.get('error')
-                    
-                    if error:
-                        accepted = False
-                    
-                    share_type = 'accepted' if accepted else 'rejected'
-                    session.record_share(difficulty, accepted)
-                    
-                    status_icon = "✅" if accepted else "❌"
-                    log.info(f"{status_icon} {session.worker_id} share {share_type} | "
-                             f"diff={difficulty:.0f} | HR={session.current_hashrate:.2f} H/s | "
-                             f"total={session.shares_accepted}A/{session.shares_rejected}R")
-                    
-                    # API'ye bildir (async, bloklamaz)
-                    asyncio.create_task(
-                        self.api.notify_share(
-                            session.worker_id, share_type,
-                            difficulty, session.current_hashrate
-                        )
-                    )
-                
-                # --- mining.set_difficulty ---
-                if isinstance(msg.get('method'), str) and msg['method'] == 'mining.set_difficulty':
-                    if msg.get('params') and len(msg['params']) > 0:
-                        session.difficulty = float(msg['params'][0])
-                        log.info(f"🎯 {session.worker_id} difficulty set to {session.difficulty}")
-                
-                # --- job notify (CN/RX result with job) ---
-                if 'result' in msg and isinstance(msg.get('result'), dict):
-                    if 'job' in msg['result']:
-                        job = msg['result']['job']
-                        if 'target' in job:
-                            # target'tan difficulty hesapla
-                            try:
-                                target = int(job['target'], 16)
-                                if target > 0:
-                                    session.difficulty = (2**256 - 1) / target / (2**32)
-                            except:
-                                pass
-                
-                # Miner'a forward
-                out = json.dumps(msg).encode() + b'\n'
-                miner_writer.write(out)
-                await miner_writer.drain()
+            end = buffer.rfind(b'\n')
+            if end < 0:
+                continue
+            chunk, buffer = buffer[:end + 1], buffer[end + 1:]
+            
+            # Pool → miner mesajları hiç değiştirilmez; sadece cevaplar ve difficulty
+            # değişimleri okunur. mining.notify gibi diğer her şey parse edilmeden geçer.
+            if needs_parse(chunk, POOL_PARSE_MARKERS):
+                for line in chunk.split(b'\n'):
+                    if needs_parse(line, POOL_PARSE_MARKERS):
+                        self._inspect_pool_message(session, line)
+            
+            # Miner'a forward (orijinal byte'lar)
+            miner_writer.write(chunk)
+            await miner_writer.drain()
+    
+    def _proxy_id(self) -> int:
+        """Proxy'nin kendi gönderdiği mesajlar için id (miner id'leriyle çakışmaz)"""
+        self._next_proxy_id += 1
+        return self._next_proxy_id
+    
+    async def _connect_upstream(self, session: WorkerSession, start: int, initial: bool = False) -> bool:
+        """
+        session.upstreams'i start'tan başlayarak sırayla dene; bağlanıp handshake
+        yapabilen ilk pool session'ın upstream'i olur.
+        """
+        count = len(session.upstreams)
+        for offset in range(count):
+            index = (start + offset) % count
+            host, port = session.upstreams[index]
+            try:
+                pool_reader, pool_writer = await asyncio.wait_for(
+                    asyncio.open_connection(host, port),
+                    timeout=self.config.POOL_CONNECT_TIMEOUT
+                )
+            except (asyncio.TimeoutError, OSError) as e:
+                log.warning(f"⚠️ Pool connect failed: {host}:{port} → {str(e) or 'timeout'}")
+                continue
+            
+            try:
+                to_miner = await asyncio.wait_for(
+                    self._pool_handshake(session, pool_reader, pool_writer, initial),
+                    timeout=self.config.POOL_HANDSHAKE_TIMEOUT
+                )
+            except (asyncio.TimeoutError, ConnectionError, OSError, ValueError) as e:
+                log.warning(f"⚠️ Pool handshake failed: {host}:{port} → {str(e) or 'timeout'}")
+                pool_writer.close()
+                continue
+            
+            session.pool_reader = pool_reader
+            session.pool_writer = pool_writer
+            session.upstream_index = index
+            session.target_pool, session.target_port = host, port
+            log.info(f"🔗 Connected to pool: {host}:{port}"
+                     f"{' (backup)' if index else ''}")
+            
+            # Handshake sırasında gelen job/difficulty mesajlarını miner'a ilet
+            if to_miner:
+                session.miner_writer.write(b''.join(to_miner))
+                await session.miner_writer.drain()
+            return True
+        
+        return False
+    
+    async def _pool_handshake(self, session: WorkerSession, pool_reader, pool_writer, initial: bool) -> list:
+        """
+        Pool'a subscribe+authorize (v1) veya login (CN) gönder, cevapları bekle.
+        Cevaplar miner'a iletilmez; miner'a gidecek satırları döndürür.
+        """
+        worker = f"{session.target_wallet}.{session.target_worker}"
+        if session.protocol == "cryptonote":
+            login_id = self._proxy_id()
+            waiting = {login_id: 'login'}
+            requests = [{"id": login_id, "jsonrpc": "2.0", "method": "login",
+                         "params": {"login": session.target_wallet, "pass": session.pool_password,
+                                    "agent": session.user_agent or "hashmarket-proxy"}}]
+        else:
+            subscribe_id, authorize_id = self._proxy_id(), self._proxy_id()
+            waiting = {subscribe_id: 'subscribe', authorize_id: 'authorize'}
+            requests = [
+                {"id": subscribe_id, "method": "mining.subscribe",
+                 "params": [session.user_agent] if session.user_agent else []},
+                {"id": authorize_id, "method": "mining.authorize",
+                 "params": [worker, session.pool_password]},
+            ]
+        pool_writer.write(b''.join(json.dumps(r).encode() + b'\n' for r in requests))
+        await pool_writer.drain()
+        
+        early = []       # cevaplardan önce gelen notify/set_difficulty vb.
+        to_miner = []
+        replies = {}     # miner'ın bekleyen subscribe/authorize'ına cevaplar
+        while waiting:
+            line = await pool_reader.readline()
+            if not line:
+                raise ConnectionError("pool closed connection")
+            if not line.strip():
+                continue
+            if not line.endswith(b'\n'):
+                line += b'\n'
+            
+            try:
+                msg = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                early.append(line)
+                continue
+            kind = waiting.pop(msg.get('id'), None) if isinstance(msg, dict) else None
+            if kind is None:
+                early.append(line)
+                continue
+            
+            result = msg.get('result')
+            if msg.get('error') or not result:
+                raise ConnectionError(f"{kind} rejected: {msg.get('error')}")
+            
+            if kind == 'subscribe':
+                if not isinstance(result, list) or len(result) < 3:
+                    raise ValueError(f"unexpected subscribe result: {result}")
+                extranonce = (result[1], result[2])
+                if initial and session.miner_subscribe_id is not None:
+                    # Miner'ın bekleyen subscribe'ına pool'un gerçek extranonce'u ile cevap
+                    session.extranonce1, session.extranonce2_size = extranonce
+                    replies['subscribe'] = {"id": session.miner_subscribe_id, "result": result, "error": None}
+                # Yedek pool: miner'a verilen extranonce'tan farklıysa miner'a bildir
+                elif extranonce != (session.extranonce1, session.extranonce2_size):
+                    session.extranonce1, session.extranonce2_size = extranonce
+                    to_miner.append(json.dumps({
+                        "id": None, "method": "mining.set_extranonce", "params": list(extranonce)
+                    }).encode() + b'\n')
+            
+            elif kind == 'authorize':
+                if initial and session.miner_authorize_id is not None:
+                    replies['authorize'] = {"id": session.miner_authorize_id, "result": True, "error": None}
+            
+            elif kind == 'login':
+                if not isinstance(result, dict):
+                    raise ValueError(f"unexpected login result: {result}")
+                self._inspect_pool_message(session, line)
+                session.upstream_session_id = result.get('id')
+                if initial:
+                    # Miner'ın kendi login'ine pool'un cevabı
+                    session.miner_session_id = session.upstream_session_id
+                    to_miner.append(json.dumps({
+                        "id": session.miner_login_id, "jsonrpc": "2.0", "error": None, "result": result
+                    }).encode() + b'\n')
+                elif result.get('job'):
+                    # Yeni pool'un job'ını miner'ın bildiği session id ile gönder
+                    job = dict(result['job'])
+                    if 'id' in job:
+                        job['id'] = session.miner_session_id
+                    to_miner.append(json.dumps({
+                        "jsonrpc": "2.0", "method": "job", "params": job
+                    }).encode() + b'\n')
+        
+        for line in early:
+            if needs_parse(line, POOL_PARSE_MARKERS):
+                self._inspect_pool_message(session, line)
+        # Sıra: subscribe cevabı, authorize cevabı, sonra job/difficulty
+        to_miner[:0] = [json.dumps(replies[kind]).encode() + b'\n'
+                        for kind in ('subscribe', 'authorize') if kind in replies]
+        return to_miner + early
+    
+    async def _failover(self, session: WorkerSession) -> bool:
+        """Upstream koptu: miner bağlantısını koruyarak sıradaki pool'a geç"""
+        failed = session.upstreams[session.upstream_index]
+        log.warning(f"🔁 {session.worker_id} lost pool {failed[0]}:{failed[1]}, failing over")
+        
+        if session.pool_writer:
+            try:
+                session.pool_writer.close()
+            except Exception:
+                pass
+        session.pool_reader = None
+        session.pool_writer = None
+        
+        # Eski pool'a gitmiş submit'lerin cevabı gelmeyecek
+        session.shares_stale += len(session.pending_submits)
+        session.pending_submits.clear()
+        
+        backoff = self.config.FAILOVER_BACKOFF
+        for attempt in range(self.config.FAILOVER_ROUNDS):
+            if not session.is_active:
+                return False
+            # Önce diğer pool'lar, düşen pool en son
+            if await self._connect_upstream(session, session.upstream_index + 1):
+                session.failovers += 1
+                self.failovers += 1
+                return True
+            await asyncio.sleep(backoff)
+            backoff *= 2
+        
+        log.error(f"❌ {session.worker_id}: no pool reachable after "
+                  f"{self.config.FAILOVER_ROUNDS} rounds")
+        return False
+    
+    def _inspect_pool_message(self, session: WorkerSession, line: bytes):
+        """Pool mesajından share sonucu / difficulty bilgisini oku"""
+        try:
+            msg = json.loads(line)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return
+        if not isinstance(msg, dict):
+            return
+        
+        # --- Share result (mining.submit cevabı) ---
+        difficulty = session.pop_pending_submit(str(msg.get('id', '')))
+        if difficulty is not None:
+            accepted = msg.get('result', False) is True or msg.get('result') is not None
+            error = msg.get('error')
+            
+            if error:
+                accepted = False
+            
+            share_type = 'accepted' if accepted else 'rejected'
+            session.record_share(difficulty, accepted)
+            if accepted:
+                self.shares_accepted += 1
+            else:
+                self.shares_rejected += 1
+            
+            status_icon = "✅" if accepted else "❌"
+            log.info(f"{status_icon} {session.worker_id} share {share_type} | "
+                     f"diff={difficulty:.0f} | HR={session.current_hashrate:.2f} H/s | "
+                     f"total={session.shares_accepted}A/{session.shares_rejected}R")
+            
+            # Kuyruğa ekle (toplu gönderilecek, bloklamaz)
+            self.shares.add(
+                session.worker_id, share_type,
+                difficulty, session.current_hashrate
+            )
+        
+        # --- mining.set_difficulty ---
+        if isinstance(msg.get('method'), str) and msg['method'] == 'mining.set_difficulty':
+            if msg.get('params') and len(msg['params']) > 0:
+                session.difficulty = float(msg['params'][0])
+                log.info(f"🎯 {session.worker_id} difficulty set to {session.difficulty}")
+        
+        # --- job notify (CN/RX result with job) ---
+        if 'result' in msg and isinstance(msg.get('result'), dict):
+            if 'job' in msg['result']:
+                job = msg['result']['job']
+                if 'target' in job:
+                    # target'tan difficulty hesapla
+                    try:
+                        target = int(job['target'], 16)
+                        if target > 0:
+                            session.difficulty = (2**256 - 1) / target / (2**32)
+                    except:
+                        pass
     
     async def _cleanup_session(self, worker_id: str, session: WorkerSession):
         """Session temizliği"""
@@ -691,23 +1788,137 @@ class StratumProxy:
 
 
 # ============================================================
-# EXTRA API ENDPOINT — Proxy'den sipariş bilgisi çekme
+# SUPERVISOR — --workers N modu
 # ============================================================
-# Bu endpoint main API'ye eklenmeli:
-#
-# @app.get("/api/proxy/order/{worker_id}")
-# def get_proxy_order(worker_id: str):
-#     """Proxy'nin sipariş bilgilerini alması için"""
-#     order = db_query("""
-#         SELECT o.pool_host, o.pool_port, o.pool_wallet, o.pool_worker,
-#                o.algorithm, o.hashrate_ordered, o.hashrate_unit,
-#                o.hours, o.status
-#         FROM orders o
-#         WHERE o.proxy_worker_id = %s AND o.status IN ('paid', 'active')
-#     """, (worker_id,), fetch_one=True)
-#     if not order:
-#         raise HTTPException(404, "Active order not found")
-#     return dict(order)
+def run_proxy(config: Config, worker_index: Optional[int] = None, stats_queue=None):
+    """Tek proxy process'i çalıştır (tekli mod veya supervisor'ın worker'ı)"""
+    if worker_index is not None:
+        # Ctrl+C'yi supervisor yönetir; worker'lar SIGTERM ile kapanır
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        for handler in logging.getLogger().handlers:
+            handler.setFormatter(logging.Formatter(
+                f'%(asctime)s [%(levelname)s] [w{worker_index}] %(message)s',
+                datefmt='%Y-%m-%d %H:%M:%S'
+            ))
+    
+    proxy = StratumProxy(config, worker_index, stats_queue)
+    
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    
+    stopping = []
+    def request_stop():
+        if not stopping:
+            stopping.append(loop.create_task(proxy.stop()))
+    
+    # Graceful shutdown
+    signals = (signal.SIGTERM,) if worker_index is not None else (signal.SIGINT, signal.SIGTERM)
+    for sig in signals:
+        try:
+            loop.add_signal_handler(sig, request_stop)
+        except NotImplementedError:
+            pass  # Windows
+    
+    try:
+        loop.run_until_complete(proxy.start())
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        request_stop()
+    finally:
+        if stopping:
+            loop.run_until_complete(stopping[0])
+        loop.close()
+
+
+class Supervisor:
+    """
+    N adet proxy process'ini aynı portta (SO_REUSEPORT) çalıştırır.
+    Her worker'ın kendi event loop'u ve APIClient'ı vardır; kernel gelen
+    bağlantıları worker'lara dağıtır. Supervisor worker istatistiklerini
+    toplar, düşen worker'ı yeniden başlatır ve SIGTERM/SIGINT'i hepsine iletir.
+    """
+    def __init__(self, config: Config):
+        self.config = config
+        self.ctx = multiprocessing.get_context("fork")
+        self.stats_queue = self.ctx.Queue()
+        self.workers: Dict[int, multiprocessing.Process] = {}
+        self.worker_stats: Dict[int, dict] = {}
+        self._running = True
+    
+    def _spawn(self, index: int):
+        proc = self.ctx.Process(
+            target=run_proxy,
+            args=(self.config, index, self.stats_queue),
+            name=f"stratum-proxy-w{index}",
+            daemon=False
+        )
+        proc.start()
+        self.workers[index] = proc
+        log.info(f"🚀 Worker {index} started (pid {proc.pid})")
+    
+    def _on_signal(self, signum, frame):
+        self._running = False
+    
+    def aggregate_stats(self) -> dict:
+        totals = {"workers": len(self.worker_stats)}
+        for stats in self.worker_stats.values():
+            for key, value in stats.items():
+                if key != "pid":
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+    
+    def run(self):
+        signal.signal(signal.SIGTERM, self._on_signal)
+        signal.signal(signal.SIGINT, self._on_signal)
+        
+        log.info(f"═══════════════════════════════════════════════")
+        log.info(f"  HashMarket Stratum Proxy supervisor (pid {os.getpid()})")
+        log.info(f"  Workers: {self.config.WORKERS} × {self.config.PROXY_HOST}:{self.config.PROXY_PORT} (SO_REUSEPORT)")
+        log.info(f"═══════════════════════════════════════════════")
+        
+        for index in range(self.config.WORKERS):
+            self._spawn(index)
+        
+        next_report = time.time() + self.config.STATS_INTERVAL
+        while self._running:
+            try:
+                index, stats = self.stats_queue.get(timeout=1)
+                self.worker_stats[index] = stats
+            except queue.Empty:
+                pass
+            except (EOFError, OSError, InterruptedError):
+                continue
+            
+            # Düşen worker'ı yeniden başlat
+            for index, proc in list(self.workers.items()):
+                if self._running and not proc.is_alive():
+                    log.error(f"💥 Worker {index} (pid {proc.pid}) exited with {proc.exitcode}, restarting")
+                    self.worker_stats.pop(index, None)
+                    self._spawn(index)
+            
+            if time.time() >= next_report:
+                next_report = time.time() + self.config.STATS_INTERVAL
+                t = self.aggregate_stats()
+                log.info(f"📊 {t['workers']} worker(s) | sessions={t.get('sessions', 0)} | "
+                         f"shares={t.get('shares_accepted', 0)}A/{t.get('shares_rejected', 0)}R | "
+                         f"HR={t.get('hashrate', 0):.2f} H/s | queue={t.get('share_queue', 0)}")
+        
+        self.shutdown()
+    
+    def shutdown(self):
+        """SIGTERM'i tüm worker'lara ilet, kapanmalarını bekle"""
+        log.info("Stopping workers...")
+        for proc in self.workers.values():
+            if proc.is_alive():
+                proc.terminate()
+        
+        deadline = time.time() + 30
+        for index, proc in self.workers.items():
+            proc.join(timeout=max(0, deadline - time.time()))
+            if proc.is_alive():
+                log.warning(f"Worker {index} did not stop in time, killing")
+                proc.kill()
+                proc.join()
+        log.info("Supervisor stopped.")
 
 
 # ============================================================
@@ -718,35 +1929,34 @@ def main():
     parser.add_argument('--host', default='0.0.0.0', help='Bind host')
     parser.add_argument('--port', type=int, default=3333, help='Bind port')
     parser.add_argument('--api', default='http://localhost:8000', help='API base URL')
+    parser.add_argument('--api-key', default=Config.API_KEY,
+                        help='Shared proxy key sent as X-Proxy-Key (default: $PROXY_API_KEY)')
     parser.add_argument('--region', default='eu', help='Region identifier')
     parser.add_argument('--report-interval', type=int, default=300, help='Hashrate report interval (seconds)')
+    parser.add_argument('--share-batch', type=int, default=50, help='Flush share queue at this many shares')
+    parser.add_argument('--share-flush', type=float, default=2.0, help='Flush share queue at least every N seconds')
+    parser.add_argument('--workers', type=int, default=1, help='Proxy processes sharing the port (SO_REUSEPORT)')
+    parser.add_argument('--spool-dir', default='proxy_spool', help='Directory for undelivered API events ("" disables)')
+    parser.add_argument('--max-connections', type=int, default=500, help='Max concurrent miner connections (whole box)')
     args = parser.parse_args()
     
     config = Config()
     config.PROXY_HOST = args.host
     config.PROXY_PORT = args.port
     config.API_BASE = args.api
+    config.API_KEY = args.api_key
     config.REGION = args.region
     config.HASHRATE_REPORT_INTERVAL = args.report_interval
+    config.SHARE_BUFFER_SIZE = args.share_batch
+    config.SHARE_FLUSH_INTERVAL = args.share_flush
+    config.WORKERS = max(1, args.workers)
+    config.MAX_CONNECTIONS = max(1, args.max_connections)
+    config.SPOOL_DIR = args.spool_dir
     
-    proxy = StratumProxy(config)
-    
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    
-    # Graceful shutdown
-    for sig in (signal.SIGINT, signal.SIGTERM):
-        try:
-            loop.add_signal_handler(sig, lambda: asyncio.create_task(proxy.stop()))
-        except NotImplementedError:
-            pass  # Windows
-    
-    try:
-        loop.run_until_complete(proxy.start())
-    except KeyboardInterrupt:
-        loop.run_until_complete(proxy.stop())
-    finally:
-        loop.close()
+    if config.WORKERS > 1:
+        Supervisor(config).run()
+    else:
+        run_proxy(config)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,75 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, "backend")
+
+# backend/ modules import their siblings by bare name (pool_config_cache, stratum_framing)
+sys.path.insert(0, BACKEND)
+
+
+def load_module(name, path):
+    """Import a file under a unique name - both APIs are called main.py"""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def marketplace_api():
+    """Root main.py (pools are created closed, nothing connects at import)"""
+    return load_module("marketplace_main", os.path.join(ROOT, "main.py"))
+
+
+def backend_api():
+    """backend/main.py (price/network/calculator API)"""
+    return load_module("backend_main", os.path.join(BACKEND, "main.py"))
+
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+requires_database = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set")
+
+
+@pytest.fixture(scope="session")
+def test_database():
+    """Throwaway database built from create_database.sql; yields its DSN
+
+    TEST_DATABASE_URL must point at a server where the user may CREATE DATABASE.
+    """
+    import psycopg2
+    from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT, make_dsn
+
+    name = f"hb_test_{os.getpid()}"
+    admin = psycopg2.connect(TEST_DATABASE_URL)
+    admin.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+    with admin.cursor() as cur:
+        cur.execute(f"DROP DATABASE IF EXISTS {name}")
+        cur.execute(f"CREATE DATABASE {name}")
+    dsn = make_dsn(TEST_DATABASE_URL, dbname=name)
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    with open(os.path.join(ROOT, "create_database.sql")) as f, conn.cursor() as cur:
+        cur.execute(f.read())
+        cur.execute("INSERT INTO users (wallet_address) VALUES ('0xbuyer'), ('0xseller')")
+        cur.execute("""
+            INSERT INTO listings (seller_id, title, algorithm, hashrate, hashrate_unit, price_per_hour)
+            VALUES (2, 'rig', 'SHA256', 100, 'TH/s', 1)
+        """)
+    conn.close()
+    try:
+        yield dsn
+    finally:
+        with admin.cursor() as cur:
+            cur.execute(f"DROP DATABASE IF EXISTS {name} WITH (FORCE)")
+        admin.close()
+
+
+def stratum_proxy():
+    """Root stratum_proxy.py (marketplace proxy)"""
+    return load_module("stratum_proxy", os.path.join(ROOT, "stratum_proxy.py"))
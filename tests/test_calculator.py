@@ -0,0 +1,94 @@
+"""Mining calculator maths + batch endpoint (backend/main.py)"""
+import pytest
+
+from conftest import backend_api
+
+api = backend_api()
+
+NETWORKS = {
+    # 1 block / 600s, 3.125 BTC, 600 EH/s
+    "BTC": {"hashrate": 600e18, "block_reward": 3.125, "block_time": 600, "source": "stub"},
+    "XMR": {"hashrate": 2.5e9, "block_reward": 0.6, "block_time": 120, "source": "stub"},
+}
+PRICES = {"BTC": 70000.0, "XMR": 165.0}
+
+
+@pytest.fixture(autouse=True)
+def live_data(monkeypatch):
+    async def network(sym):
+        return NETWORKS.get(sym)
+
+    async def price(sym):
+        return PRICES.get(sym, 0)
+
+    monkeypatch.setattr(api, "get_network_data", network)
+    monkeypatch.setattr(api, "get_coin_price", price)
+    monkeypatch.setenv("PLATFORM_FEE_PERCENT", "2.5")
+
+
+def test_coins_per_hs_day():
+    # 144 blocks/day * 3.125 BTC / 600e18 H/s
+    assert api._coins_per_hs_day(NETWORKS["BTC"]) == pytest.approx(144 * 3.125 / 600e18)
+    assert api._coins_per_hs_day(NETWORKS["XMR"]) == pytest.approx(720 * 0.6 / 2.5e9)
+
+
+def test_coins_per_hs_day_scales_inversely_with_network():
+    doubled = dict(NETWORKS["BTC"], hashrate=1200e18)
+    assert api._coins_per_hs_day(doubled) == pytest.approx(api._coins_per_hs_day(NETWORKS["BTC"]) / 2)
+
+
+def test_yields_rounding():
+    assert api._yields(12.3456789) == {
+        "hourly": 0.514403,
+        "daily": 12.3457,
+        "weekly": 86.42,
+        "monthly": 370.37,
+    }
+    assert api._yields(0) == {"hourly": 0, "daily": 0, "weekly": 0, "monthly": 0}
+
+
+def test_platform_fee_from_env(monkeypatch):
+    monkeypatch.setenv("PLATFORM_FEE_PERCENT", "4")
+    assert api._platform_fee() == pytest.approx(0.04)
+
+
+async def test_realtime_matches_hand_calculation():
+    result = await api.calculate_realtime("SHA256", 100, "TH/s")
+    daily_coins = 100e12 * 144 * 3.125 / 600e18
+    assert result["coins_per_day"] == round(daily_coins, 8)
+    assert result["daily"] == round(daily_coins * 70000 * 0.975, 4)
+    assert result["data_source"] == "stub"
+
+
+async def test_batch_rows_match_realtime():
+    batch = api.CalculatorBatch(
+        rows=[api.CalculatorRow(algorithm="SHA256", hashrate=100, unit="TH/s"),
+              api.CalculatorRow(algorithm="RandomX", hashrate=15, unit="KH/s")],
+        grids=[api.CalculatorGrid(algorithm="RandomX", hashrates=[1, 10], unit="KH/s")],
+    )
+    result = await api.calculate_batch(batch)
+    assert [r["coin"] for r in result["results"]] == ["BTC", "XMR", "XMR", "XMR"]
+    for row in result["results"]:
+        single = await api.calculate_realtime(row["algorithm"], row["hashrate"], row["unit"])
+        for key in ("hourly", "daily", "weekly", "monthly", "coins_per_day"):
+            assert row[key] == pytest.approx(single[key])
+    assert result["coins"]["XMR"] == {"coin_price": 165.0, "network_hashrate": 2.5e9, "data_source": "stub"}
+
+
+async def test_batch_row_errors():
+    batch = api.CalculatorBatch(rows=[
+        api.CalculatorRow(algorithm="Nope", hashrate=1),
+        api.CalculatorRow(algorithm="SHA256", hashrate=0),
+        api.CalculatorRow(algorithm="KawPow", hashrate=1),   # no network data stubbed
+    ])
+    result = await api.calculate_batch(batch)
+    assert [r["error"] for r in result["results"]] == [
+        "Unknown algorithm", "Hashrate must be positive", "Network data not available"
+    ]
+
+
+async def test_batch_limits(monkeypatch):
+    assert await api.calculate_batch(api.CalculatorBatch()) == {"error": "No rows"}
+    monkeypatch.setattr(api, "CALCULATOR_BATCH_MAX", 2)
+    grid = api.CalculatorGrid(algorithm="SHA256", hashrates=[1, 2, 3])
+    assert await api.calculate_batch(api.CalculatorBatch(grids=[grid])) == {"error": "Too many rows (max 2)"}
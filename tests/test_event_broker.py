@@ -0,0 +1,101 @@
+"""In-process realtime EventBroker (root main.py)"""
+import asyncio
+import json
+import threading
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+
+from conftest import marketplace_api
+
+api = marketplace_api()
+
+
+@pytest.fixture
+async def broker():
+    broker = api.EventBroker()
+    broker.loop = asyncio.get_running_loop()
+    return broker
+
+
+async def test_publish_reaches_only_subscribed_users(broker):
+    alice = broker.subscribe(1)
+    bob = broker.subscribe(2)
+    broker.publish([1], "order", {"order_id": 7, "amount": Decimal("1.50")})
+
+    event, payload = alice.get_nowait()
+    assert event == "order"
+    assert json.loads(payload) == {"order_id": 7, "amount": 1.5}
+    assert bob.empty()
+    assert broker.stats() == {"users": 2, "streams": 2, "published": 1, "dropped": 0}
+
+
+async def test_every_stream_of_a_user_gets_the_event(broker):
+    tabs = [broker.subscribe(1) for _ in range(3)]
+    broker.publish([1, 1], "message", {"id": 1})     # duplicate ids: delivered once
+    assert [q.qsize() for q in tabs] == [1, 1, 1]
+
+
+async def test_publish_without_subscribers_or_loop_is_a_noop():
+    broker = api.EventBroker()
+    broker.publish([1], "order", {"id": 1})          # no loop yet (before startup)
+    broker.loop = asyncio.get_running_loop()
+    broker.publish([1], "order", {"id": 1})
+    assert broker.published == 0
+
+
+async def test_stream_limit_per_user(broker, monkeypatch):
+    monkeypatch.setattr(api, "EVENT_MAX_STREAMS_PER_USER", 2)
+    first = broker.subscribe(1)
+    broker.subscribe(1)
+    with pytest.raises(HTTPException) as exc:
+        broker.subscribe(1)
+    assert exc.value.status_code == 429
+
+    broker.unsubscribe(1, first)
+    broker.subscribe(1)
+    broker.subscribe(2)
+
+
+async def test_unsubscribe_forgets_user(broker):
+    queue = broker.subscribe(1)
+    broker.unsubscribe(1, queue)
+    broker.unsubscribe(1, queue)                     # twice is harmless
+    assert broker.subscribers == {}
+    broker.publish([1], "order", {"id": 1})
+    assert queue.empty()
+
+
+async def test_slow_consumer_drops_oldest(broker, monkeypatch):
+    monkeypatch.setattr(api, "EVENT_QUEUE_SIZE", 3)
+    slow = broker.subscribe(1)
+    fast = broker.subscribe(2)
+    for i in range(5):
+        broker.publish([1, 2], "tick", {"i": i})
+        fast.get_nowait()
+
+    received = [json.loads(slow.get_nowait()[1])["i"] for _ in range(slow.qsize())]
+    assert received == [2, 3, 4]
+    assert broker.dropped == 2
+    assert broker.published == 10
+
+
+async def test_publish_from_worker_thread(broker):
+    queue = broker.subscribe(1)
+    # Sync endpoints run in the threadpool; delivery hops onto the loop
+    thread = threading.Thread(target=broker.publish, args=([1], "order", {"id": 9}))
+    thread.start()
+    thread.join()
+    event, payload = await asyncio.wait_for(queue.get(), 1)
+    assert (event, json.loads(payload)) == ("order", {"id": 9})
+
+
+async def test_publish_notifications_routes_by_owner(broker, monkeypatch):
+    monkeypatch.setattr(api, "event_broker", broker)
+    queue = broker.subscribe(5)
+    api.publish_notifications([{"id": 1, "user_id": 5, "title": "x"},
+                               {"id": 2, "user_id": 6, "title": "y"}])
+    event, payload = queue.get_nowait()
+    assert event == "notification" and json.loads(payload)["id"] == 1
+    assert queue.empty()
@@ -0,0 +1,132 @@
+"""Listing keyset cursors + result cache (root main.py)"""
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+
+from conftest import marketplace_api
+
+api = marketplace_api()
+
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    api.invalidate_listings_cache()
+    yield
+    api.invalidate_listings_cache()
+
+
+@pytest.mark.parametrize("value, expected", [
+    (Decimal("0.00012345"), "0.00012345"),
+    (12.5, "12.5"),
+    (0, "0"),
+    (None, "0"),
+    (datetime(2026, 3, 1, 12, 30, 5, 123456), "2026-03-01T12:30:05.123456"),
+])
+def test_cursor_round_trip(value, expected):
+    cursor = api._encode_listing_cursor(value, 4242, "created_at", True)
+    assert "=" not in cursor
+    assert api._decode_listing_cursor(cursor, "created_at", True) == (expected, 4242)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-base64!", "W10", "WyIxIl0"])
+def test_bad_cursor_is_400(cursor):
+    # "W10" = [] and "WyIxIl0" = ["1"]: valid base64, wrong shape
+    with pytest.raises(HTTPException) as exc:
+        api._decode_listing_cursor(cursor, "price_per_hour", False)
+    assert exc.value.status_code == 400
+
+
+@pytest.mark.parametrize("sort_by, sort_desc", [("created_at", False), ("price_per_hour", True)])
+def test_cursor_from_another_sort_is_400(sort_by, sort_desc):
+    cursor = api._encode_listing_cursor(Decimal("1.5"), 2, "price_per_hour", False)
+    with pytest.raises(HTTPException) as exc:
+        api._decode_listing_cursor(cursor, sort_by, sort_desc)
+    assert exc.value.status_code == 400
+
+
+def test_invalidate_bumps_generation_and_clears():
+    gen = api._listings_cache_gen
+    api._listings_cache_put("k", {"x": 1}, gen)
+    assert api._listings_cache_get("k") == {"x": 1}
+
+    api.invalidate_listings_cache()
+    assert api._listings_cache_gen == gen + 1
+    assert api._listings_cache_get("k") is None
+
+
+def test_result_from_before_invalidation_is_not_cached():
+    gen = api._listings_cache_gen      # query starts...
+    api.invalidate_listings_cache()    # ...an order lands meanwhile
+    api._listings_cache_put("k", {"stale": True}, gen)
+    assert api._listings_cache_get("k") is None
+
+
+class FakeDB:
+    """Stands in for db_query: records SQL, returns canned listing rows"""
+
+    def __init__(self, rows, total):
+        self.rows = rows
+        self.total = total
+        self.calls = []
+
+    def __call__(self, sql, params=None, fetch_one=False):
+        self.calls.append((sql, params))
+        if fetch_one:
+            return {"total": self.total}
+        limit = params[-2]
+        return [dict(r) for r in self.rows[:limit]]
+
+
+def listing(i, price):
+    return {"id": i, "price_per_hour": Decimal(price), "sort_key": Decimal(price)}
+
+
+def test_keyset_pages_and_cache(monkeypatch):
+    db = FakeDB([listing(1, "1.0"), listing(2, "1.5"), listing(3, "2.0")], total=3)
+    monkeypatch.setattr(api, "db_query", db)
+
+    first = api.get_listings(limit=2)
+    assert [l["id"] for l in first["listings"]] == [1, 2]
+    assert "sort_key" not in first["listings"][0]
+    assert api._decode_listing_cursor(first["next_cursor"], "price_per_hour", False) == ("1.5", 2)
+    assert len(db.calls) == 2          # page + count
+
+    # Same filters: served from cache
+    assert api.get_listings(limit=2) == first
+    assert len(db.calls) == 2
+
+    db.rows = [listing(3, "2.0")]
+    second = api.get_listings(limit=2, cursor=first["next_cursor"])
+    sql, params = db.calls[-1]
+    assert "(l.price_per_hour, l.id) > (%s::numeric, %s)" in sql
+    assert "OFFSET" in sql and params[-2:] == [3, 0]
+    assert params[-4:-2] == ["1.5", 2]
+    assert second["next_cursor"] is None
+    # Count is cached per filter, not per page
+    assert len(db.calls) == 3
+
+    api.invalidate_listings_cache()
+    api.get_listings(limit=2)
+    assert len(db.calls) == 5
+
+
+def test_descending_cursor_compares_less_than(monkeypatch):
+    db = FakeDB([], total=0)
+    monkeypatch.setattr(api, "db_query", db)
+    cursor = api._encode_listing_cursor(Decimal("9"), 7, "hashrate", True)
+    api.get_listings(sort_by="hashrate", sort_dir="desc", cursor=cursor)
+    sql, _ = db.calls[0]
+    assert "(l.hashrate, l.id) < (%s::numeric, %s)" in sql
+    assert "ORDER BY l.hashrate DESC, l.id DESC" in sql
+
+
+def test_reusing_cursor_with_new_sort_is_400(monkeypatch):
+    db = FakeDB([], total=0)
+    monkeypatch.setattr(api, "db_query", db)
+    cursor = api._encode_listing_cursor(Decimal("9"), 7, "price_per_hour", False)
+    with pytest.raises(HTTPException) as exc:
+        api.get_listings(sort_by="created_at", cursor=cursor)
+    assert exc.value.status_code == 400
+    assert db.calls == []
@@ -0,0 +1,221 @@
+"""PoolConfigCache reload coalescing + LISTEN path (backend/pool_config_cache.py)"""
+import asyncio
+import socket
+import threading
+
+import pytest
+
+from pool_config_cache import PoolConfigCache
+
+
+def config_row(port, host):
+    return (port, host, 3333, "wallet", "worker", "x", "RandomX")
+
+
+class FakeConn:
+    """psycopg2 connection stand-in; a socketpair provides a real fileno for add_reader"""
+
+    def __init__(self, db):
+        self.db = db
+        self.closed = False
+        self.autocommit = False
+        self.notifies = []
+        self.sock, self.peer = socket.socketpair()
+        self.sock.setblocking(False)
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def notify(self):
+        self.peer.send(b"!")
+
+    def poll(self):
+        if self.db.poll_error:
+            raise self.db.poll_error
+        while True:
+            try:
+                if not self.sock.recv(64):
+                    break
+            except BlockingIOError:
+                break
+            self.notifies.append("pool_configs_changed")
+
+    def close(self):
+        self.closed = True
+        self.sock.close()
+        self.peer.close()
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+
+    def execute(self, sql):
+        db = self.conn.db
+        if sql.startswith("LISTEN"):
+            if db.listen_error:
+                raise db.listen_error
+            db.listening.append(sql)
+            return
+        db.loads += 1
+        db.load_started.set()
+        db.gate.wait(5)
+        if db.load_error:
+            raise db.load_error
+        self.rows = list(db.rows)
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeDB:
+    def __init__(self):
+        self.rows = [config_row(3333, "pool-a")]
+        self.loads = 0
+        self.load_error = None
+        self.listen_error = None
+        self.poll_error = None
+        self.listening = []
+        self.conns = []
+        self.gate = threading.Event()
+        self.gate.set()
+        self.load_started = threading.Event()
+
+    def connect(self):
+        conn = FakeConn(self)
+        self.conns.append(conn)
+        return conn
+
+
+@pytest.fixture
+def db():
+    db = FakeDB()
+    yield db
+    db.gate.set()
+    for conn in db.conns:
+        if not conn.closed:
+            conn.close()
+
+
+async def wait_for(predicate, timeout=2):
+    for _ in range(int(timeout / 0.01)):
+        if predicate():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not reached")
+
+
+async def test_load_keys_first_config_per_port(db):
+    db.rows = [config_row(3333, "pool-a"), config_row(3333, "pool-b"), config_row(4444, "pool-c")]
+    cache = PoolConfigCache(db.connect)
+    await cache.refresh()
+    assert cache.get(3333)["pool_host"] == "pool-a"
+    assert cache.get(4444)["algorithm"] == "RandomX"
+    assert cache.get(5555) is None
+    assert all(conn.closed for conn in db.conns)
+
+
+async def test_refreshes_during_a_reload_coalesce_into_one(db):
+    cache = PoolConfigCache(db.connect)
+    db.gate.clear()
+    first = cache.refresh()
+    await asyncio.get_running_loop().run_in_executor(None, db.load_started.wait, 5)
+
+    # Burst of notifications while the first reload is blocked
+    assert all(cache.refresh() is first for _ in range(5))
+    db.rows = [config_row(3333, "pool-new")]
+    db.gate.set()
+    await first
+    assert db.loads == 2
+    assert cache.get(3333)["pool_host"] == "pool-new"
+    assert cache.refresh_task is None
+
+
+async def test_refresh_after_completion_starts_a_new_reload(db):
+    cache = PoolConfigCache(db.connect)
+    await cache.refresh()
+    db.rows = [config_row(3333, "pool-b")]
+    await cache.refresh()
+    assert db.loads == 2
+    assert cache.get(3333)["pool_host"] == "pool-b"
+
+
+async def test_failed_reload_keeps_old_configs(db):
+    cache = PoolConfigCache(db.connect)
+    await cache.refresh()
+    loaded_at = cache.loaded_at
+
+    db.load_error = RuntimeError("connection refused")
+    assert await cache.refresh() == {3333: cache.get(3333)}
+    assert cache.get(3333)["pool_host"] == "pool-a"
+    assert cache.loaded_at == loaded_at
+    assert cache.refresh_task is None
+
+
+async def test_notify_triggers_reload(db):
+    cache = PoolConfigCache(db.connect, refresh_interval=60)
+    await cache.start()
+    try:
+        await wait_for(lambda: cache.listen_conn is not None)
+        assert db.listening == ["LISTEN pool_configs_changed"]
+        assert cache.listen_conn.autocommit
+
+        db.rows = [config_row(3333, "pool-b")]
+        cache.listen_conn.notify()
+        await wait_for(lambda: cache.get(3333)["pool_host"] == "pool-b")
+        assert cache.listen_conn.notifies == []
+    finally:
+        await cache.stop()
+    assert cache.listen_conn is None
+
+
+async def test_notify_during_initial_load_is_not_lost(db):
+    cache = PoolConfigCache(db.connect, refresh_interval=60)
+    db.gate.clear()
+    starting = asyncio.create_task(cache.start())
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, db.load_started.wait, 5)
+        # Already listening while the first load is still running
+        assert cache.listen_conn is not None
+
+        db.rows = [config_row(3333, "pool-b")]
+        cache.listen_conn.notify()
+        await wait_for(lambda: cache.refresh_again)
+        db.gate.set()
+        await starting
+        await wait_for(lambda: cache.get(3333)["pool_host"] == "pool-b")
+        assert db.listening == ["LISTEN pool_configs_changed"]
+    finally:
+        db.gate.set()
+        await starting
+        await cache.stop()
+
+
+async def test_lost_listener_is_closed(db):
+    cache = PoolConfigCache(db.connect, refresh_interval=60)
+    await cache.start()
+    try:
+        await wait_for(lambda: cache.listen_conn is not None)
+        conn = cache.listen_conn
+        db.poll_error = RuntimeError("server closed the connection")
+        conn.notify()
+        await wait_for(lambda: cache.listen_conn is None)
+        assert conn.closed
+    finally:
+        await cache.stop()
+
+
+async def test_listen_failure_closes_connection(db):
+    cache = PoolConfigCache(db.connect)
+    db.listen_error = RuntimeError("permission denied")
+    with pytest.raises(RuntimeError):
+        await cache._listen(asyncio.get_running_loop())
+    assert db.conns[-1].closed
+    assert cache.listen_conn is None
@@ -0,0 +1,141 @@
+"""Keyed SWRCache behind prices / network data (backend/main.py)"""
+import asyncio
+
+import pytest
+
+from conftest import backend_api
+
+api = backend_api()
+
+
+class Loader:
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.down = set()
+        self.calls = []
+        self.version = 1
+
+    async def __call__(self, key):
+        self.calls.append(key)
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if key in self.down:
+            raise LookupError(f"no price for {key}")
+        return f"{key}-v{self.version}"
+
+
+def make_cache(loader, **kwargs):
+    return api.SWRCache("test", loader, ttl=60, max_stale=3600, **kwargs)
+
+
+def age(cache, key, seconds):
+    value, loaded_at = cache.entries[key]
+    cache.entries[key] = (value, loaded_at - seconds)
+
+
+async def settle(cache):
+    await asyncio.sleep(0)
+    await asyncio.gather(*cache.inflight.values(), return_exceptions=True)
+
+
+async def test_single_flight_per_key():
+    loader = Loader(delay=0.05)
+    cache = make_cache(loader)
+    results = await asyncio.gather(*[cache.get(k) for k in ["BTC", "XMR"] * 5])
+    assert sorted(loader.calls) == ["BTC", "XMR"]
+    assert results[:2] == ["BTC-v1", "XMR-v1"]
+
+
+async def test_fresh_then_stale_then_refreshed():
+    loader = Loader()
+    cache = make_cache(loader)
+    assert await cache.get("BTC") == "BTC-v1"
+    assert await cache.get("BTC") == "BTC-v1"
+    assert cache.hits == 1
+
+    age(cache, "BTC", 120)
+    loader.version = 2
+    assert await cache.get("BTC") == "BTC-v1"    # stale, no waiting
+    assert cache.stale_hits == 1
+    await settle(cache)
+    assert await cache.get("BTC") == "BTC-v2"
+
+
+async def test_too_old_entry_is_reloaded():
+    loader = Loader()
+    cache = make_cache(loader)
+    await cache.get("BTC")
+    age(cache, "BTC", 60 + 3600)
+    loader.version = 2
+    assert await cache.get("BTC") == "BTC-v2"
+    assert cache.misses == 2
+
+
+async def test_failed_reload_serves_old_entry_over_fallback():
+    loader = Loader()
+    cache = make_cache(loader, fallback=lambda key: "fallback")
+    await cache.get("BTC")
+    age(cache, "BTC", 60 + 3600)
+    loader.down.add("BTC")
+    assert await cache.get("BTC") == "BTC-v1"
+    assert cache.fallbacks == {}
+
+
+async def test_no_fallback_propagates_error():
+    loader = Loader()
+    loader.down.add("BTC")
+    cache = make_cache(loader)
+    with pytest.raises(LookupError):
+        await cache.get("BTC")
+    assert cache.errors == 1
+
+
+async def test_fallback_is_cached_for_fallback_ttl():
+    loader = Loader()
+    loader.down.add("BTC")
+    cache = make_cache(loader, fallback=lambda key: f"{key}-fallback", fallback_ttl=30)
+    assert await cache.get("BTC") == "BTC-fallback"
+    assert await cache.get("BTC") == "BTC-fallback"
+    assert loader.calls == ["BTC"]               # dead upstream asked once
+    assert cache.fallback_hits == 1
+
+    # Expired negative entry: upstream is tried again
+    value, expires_at = cache.fallbacks["BTC"]
+    cache.fallbacks["BTC"] = (value, expires_at - 31)
+    loader.down.clear()
+    assert await cache.get("BTC") == "BTC-v1"
+    assert "BTC" not in cache.fallbacks
+
+
+async def test_refresher_retries_negatively_cached_keys():
+    loader = Loader()
+    loader.down.add("BTC")
+    cache = make_cache(loader, fallback=lambda key: "fallback", fallback_ttl=30)
+    await cache.get("BTC")
+    await cache.get("XMR")
+
+    loader.down.clear()
+    tasks = cache.refresh_due(["BTC", "XMR"], ahead=0.8)
+    assert len(tasks) == 1                       # XMR is still fresh
+    await asyncio.gather(*tasks)
+    assert await cache.get("BTC") == "BTC-v1"
+
+    age(cache, "XMR", 50)                        # past 80% of the TTL
+    assert len(cache.refresh_due(["BTC", "XMR"], ahead=0.8)) == 1
+    await settle(cache)
+
+
+async def test_stats():
+    cache = make_cache(Loader())
+    await cache.get("BTC")
+    await cache.get("BTC")
+    stats = cache.stats()
+    assert {k: stats[k] for k in ("hits", "misses", "refreshes", "errors", "inflight")} == \
+        {"hits": 1, "misses": 1, "refreshes": 1, "errors": 0, "inflight": 0}
+    assert list(stats["age_seconds"]) == ["BTC"]
+
+
+async def test_price_and_network_caches_have_fallbacks():
+    assert api.PRICE_CACHE.fallback("XMR") == api.PRICE_FALLBACK["XMR"]
+    assert api.NETWORK_CACHE.fallback("BTC")["source"]
+    assert api.PRICE_CACHE.fallback_ttl == api.CACHE_FALLBACK_TTL
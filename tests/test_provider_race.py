@@ -0,0 +1,194 @@
+"""backend/main.py provider race + circuit breakers against local aiohttp stubs
+
+Every *_API override points at one stub server, each provider under its own
+path prefix; a fresh copy of the module is imported per test so the env
+overrides (and BREAKERS) start clean.
+"""
+import asyncio
+import os
+
+import pytest
+from aiohttp import web
+
+from conftest import BACKEND, load_module
+
+PROVIDERS = {
+    "COINGECKO_API": "coingecko",
+    "CRYPTOCOMPARE_API": "cryptocompare",
+    "COINCAP_API": "coincap",
+    "MEMPOOL_API": "mempool",
+    "BLOCKCHAIN_INFO_API": "blockchaininfo",
+}
+
+
+class StubServer:
+    """Serves canned answers by path; unknown paths are 404"""
+
+    def __init__(self):
+        self.routes = {}    # path -> (status, body, delay)
+        self.hits = {}      # path -> request count
+        self.base = None
+        self.runner = None
+
+    def route(self, path, body, status=200, delay=0):
+        self.routes[path] = (status, body, delay)
+
+    async def handle(self, request):
+        self.hits[request.path] = self.hits.get(request.path, 0) + 1
+        status, body, delay = self.routes.get(request.path, (404, "not found", 0))
+        if delay:
+            await asyncio.sleep(delay)
+        if isinstance(body, str):
+            return web.Response(status=status, text=body)
+        return web.json_response(body, status=status)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_route("GET", "/{tail:.*}", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        self.base = f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+@pytest.fixture
+async def stub():
+    server = StubServer()
+    await server.start()
+    yield server
+    await server.stop()
+
+
+@pytest.fixture
+async def api(stub, monkeypatch):
+    for env, prefix in PROVIDERS.items():
+        monkeypatch.setenv(env, f"{stub.base}/{prefix}")
+    monkeypatch.setenv("PROVIDER_TIMEOUT_SECONDS", "2")
+    monkeypatch.setenv("PROVIDER_BREAKER_FAILURES", "3")
+    monkeypatch.setenv("PROVIDER_BREAKER_RESET_SECONDS", "0.2")
+    monkeypatch.setenv("FALLBACK_CACHE_SECONDS", "30")
+    module = load_module(f"backend_main_stubbed_{id(stub)}", os.path.join(BACKEND, "main.py"))
+    yield module
+    if module.http_session is not None:
+        await module.http_session.close()
+
+
+def btc_prices(stub, coingecko=None, cryptocompare=None, coincap=None, delays=(0, 0, 0)):
+    stub.route("/coingecko/simple/price", coingecko, delay=delays[0])
+    stub.route("/cryptocompare/price", cryptocompare, delay=delays[1])
+    stub.route("/coincap/assets/bitcoin", coincap, delay=delays[2])
+
+
+async def test_first_valid_answer_wins(api, stub):
+    btc_prices(stub,
+               coingecko={"bitcoin": {"usd": 100.0}},
+               cryptocompare={"USD": 101.0},
+               coincap={"data": {"priceUsd": "102.0"}},
+               delays=(0.5, 0, 0.5))
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    assert await api._fetch_coin_price("BTC") == 101.0
+    # Slow providers are cancelled, not awaited
+    assert loop.time() - started < 0.4
+    # Losing the race does not count against a provider
+    assert api.get_breaker("CoinGecko").failures == 0
+    assert api.get_breaker("CoinCap").failures == 0
+    assert api.get_breaker("CryptoCompare").state == "closed"
+
+
+async def test_fast_invalid_answer_does_not_win(api, stub):
+    btc_prices(stub,
+               coingecko={"bitcoin": {"usd": 100.0}},
+               cryptocompare={"USD": 0},
+               delays=(0.1, 0, 0))
+    stub.route("/coincap/assets/bitcoin", "upstream error", status=500)
+    assert await api._fetch_coin_price("BTC") == 100.0
+    assert api.get_breaker("CryptoCompare").failures == 1
+    assert api.get_breaker("CoinCap").failures == 1
+
+
+@pytest.mark.parametrize("coingecko, cryptocompare, coincap", [
+    # zero prices
+    ({"bitcoin": {"usd": 0}}, {"USD": 0}, {"data": {"priceUsd": "0"}}),
+    # negative / missing fields
+    ({"bitcoin": {"usd": -5}}, {}, {"data": {}}),
+    # not JSON at all
+    ("<html>rate limited</html>", "<html>", "oops"),
+])
+async def test_malformed_or_zero_answers_rejected(api, stub, coingecko, cryptocompare, coincap):
+    btc_prices(stub, coingecko=coingecko, cryptocompare=cryptocompare, coincap=coincap)
+    with pytest.raises(LookupError):
+        await api._fetch_coin_price("BTC")
+    for name in ("CoinGecko", "CryptoCompare", "CoinCap"):
+        assert api.get_breaker(name).failures == 1
+
+
+async def test_zero_network_hashrate_rejected(api, stub):
+    stub.route("/mempool/v1/mining/hashrate/1d", {"hashrates": [{"avgHashrate": 0}]})
+    stub.route("/blockchaininfo/q/hashrate", "650000000")
+    network = await api._fetch_network_data("BTC")
+    assert network["source"] == "Blockchain.info"
+    assert network["hashrate"] == 650000000 * 1_000_000_000
+
+
+async def test_all_providers_down_serves_cached_fallback(api, stub):
+    btc_prices(stub, coingecko={}, cryptocompare={}, coincap={})
+    assert await api.get_coin_price("BTC") == api.PRICE_FALLBACK["BTC"]
+    hits = dict(stub.hits)
+    # Fallback is cached for FALLBACK_CACHE_SECONDS: no new upstream calls
+    assert await api.get_coin_price("BTC") == api.PRICE_FALLBACK["BTC"]
+    assert stub.hits == hits
+    assert api.PRICE_CACHE.fallback_hits == 1
+
+
+async def test_breaker_open_half_open_closed(api, stub):
+    url = f"{stub.base}/cryptocompare/price"
+    path = "/cryptocompare/price"
+    parse = lambda d: api._positive(d.get("USD", 0))
+    breaker = api.get_breaker("CryptoCompare")
+
+    stub.route(path, "down", status=503)
+    for _ in range(api.BREAKER_FAILURES):
+        with pytest.raises(RuntimeError, match="HTTP 503"):
+            await api.fetch_provider("CryptoCompare", url, parse)
+    assert breaker.state == "open"
+
+    # Open: rejected without touching the upstream
+    with pytest.raises(RuntimeError, match="circuit open"):
+        await api.fetch_provider("CryptoCompare", url, parse)
+    assert stub.hits[path] == api.BREAKER_FAILURES
+
+    await asyncio.sleep(api.BREAKER_RESET + 0.05)
+    assert breaker.state == "half-open"
+
+    # Half-open: exactly one trial request at a time
+    stub.route(path, {"USD": 42.0}, delay=0.1)
+    trial = asyncio.ensure_future(api.fetch_provider("CryptoCompare", url, parse))
+    await asyncio.sleep(0.02)
+    with pytest.raises(RuntimeError, match="circuit open"):
+        await api.fetch_provider("CryptoCompare", url, parse)
+    assert await trial == 42.0
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+
+
+async def test_failed_half_open_trial_reopens(api, stub):
+    url = f"{stub.base}/cryptocompare/price"
+    parse = lambda d: api._positive(d.get("USD", 0))
+    breaker = api.get_breaker("CryptoCompare")
+
+    stub.route("/cryptocompare/price", "down", status=503)
+    for _ in range(api.BREAKER_FAILURES):
+        with pytest.raises(RuntimeError):
+            await api.fetch_provider("CryptoCompare", url, parse)
+    await asyncio.sleep(api.BREAKER_RESET + 0.05)
+    assert breaker.state == "half-open"
+
+    with pytest.raises(RuntimeError, match="HTTP 503"):
+        await api.fetch_provider("CryptoCompare", url, parse)
+    assert breaker.state == "open"
@@ -0,0 +1,44 @@
+"""Shared-key check on /api/proxy/* (root main.py)"""
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import marketplace_api
+
+api = marketplace_api()
+
+ROUTE = {"worker_id": "hb_ord_1", "pool_host": "pool", "pool_port": 3333,
+         "pool_wallet": "buyer-wallet", "pool_worker": "w", "pool_password": "secret"}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def fake_query(sql, params=None, fetch_one=False):
+        return ROUTE if fetch_one else [ROUTE]
+
+    monkeypatch.setattr(api, "adb_query", fake_query)
+    monkeypatch.setattr(api, "PROXY_API_KEY", "s3cret")
+    # No context manager: startup hooks (DB pools, background jobs) are not run
+    return TestClient(api.app)
+
+
+@pytest.mark.parametrize("path", ["/api/proxy/routes", "/api/proxy/order/hb_ord_1"])
+def test_route_lookups_need_the_key(client, path):
+    assert client.get(path).status_code == 401
+    assert client.get(path, headers={"X-Proxy-Key": "wrong"}).status_code == 401
+    res = client.get(path, headers={"X-Proxy-Key": "s3cret"})
+    assert res.status_code == 200
+    assert "buyer-wallet" in res.text
+
+
+@pytest.mark.parametrize("path", ["/api/proxy/connect?worker_id=x&miner_ip=1.2.3.4",
+                                  "/api/proxy/disconnect?worker_id=x",
+                                  "/api/proxy/hashrate?worker_id=x&hashrate=1&hashrate_unit=H/s"])
+def test_callbacks_need_the_key(client, path):
+    assert client.post(path).status_code == 401
+    assert client.post("/api/proxy/shares/bulk", json={"shares": []}).status_code == 401
+
+
+def test_unconfigured_key_closes_proxy_endpoints(client, monkeypatch):
+    monkeypatch.setattr(api, "PROXY_API_KEY", "")
+    res = client.get("/api/proxy/routes", headers={"X-Proxy-Key": ""})
+    assert res.status_code == 503
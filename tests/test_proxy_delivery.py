@@ -0,0 +1,144 @@
+"""stratum_proxy.py: event ids survive retries, spool offsets survive crashes"""
+import os
+
+import pytest
+
+from conftest import stratum_proxy
+
+proxy = stratum_proxy()
+
+
+class FakeAPI(proxy.APIClient):
+    """APIClient whose HTTP layer is a scripted list of (result, retryable)"""
+
+    def __init__(self, answers, spool=None):
+        super().__init__("http://api.invalid", spool)
+        self.answers = list(answers)
+        self.requests = []
+
+    async def _request(self, path, params=None, payload=None):
+        self.requests.append((path, params, payload))
+        return self.answers.pop(0) if self.answers else ({"status": "ok", "inactive": []}, False)
+
+
+def make_spool(tmp_path):
+    return proxy.EventSpool(str(tmp_path / "spool"), proxy.Config())
+
+
+async def test_spooled_event_keeps_its_id_on_replay(tmp_path):
+    spool = make_spool(tmp_path)
+    spool._disk_depth = await spool._run_io(spool._io_open)
+    api = FakeAPI([(None, True)], spool)
+
+    await api.notify_disconnect("hb_ord_1")
+    sent_id = api.requests[0][1]["event_id"]
+    assert sent_id and spool.depth == 1
+
+    await spool._sync()
+    assert await spool._replay(api.deliver_spooled)
+    assert api.requests[1][1]["event_id"] == sent_id
+    await spool.stop()
+
+
+async def test_committed_offset_is_not_replayed_after_restart(tmp_path):
+    spool = make_spool(tmp_path)
+    spool._disk_depth = await spool._run_io(spool._io_open)
+    for i in range(3):
+        spool.append({"path": "/api/proxy/disconnect", "params": {"event_id": str(i)}, "json": None})
+    await spool._sync()
+
+    delivered = []
+
+    async def deliver(event):
+        delivered.append(event["params"]["event_id"])
+        return len(delivered) < 2           # API goes away after the first event
+
+    assert not await spool._replay(deliver)
+    await spool.stop()
+    names = os.listdir(tmp_path / "spool")
+    assert not [n for n in names if n.endswith(".tmp")]
+
+    restarted = make_spool(tmp_path)
+    restarted._disk_depth = await restarted._run_io(restarted._io_open)
+    assert restarted._disk_depth == 2
+    delivered.clear()
+
+    async def deliver_all(event):
+        delivered.append(event["params"]["event_id"])
+        return True
+
+    assert await restarted._replay(deliver_all)
+    assert delivered == ["1", "2"]
+    await restarted.stop()
+
+
+async def test_stale_offset_temp_file_is_ignored(tmp_path):
+    spool = make_spool(tmp_path)
+    await spool._run_io(spool._io_open)
+    spool.append({"path": "/x", "params": {"event_id": "a"}, "json": None})
+    spool.append({"path": "/x", "params": {"event_id": "b"}, "json": None})
+    await spool._sync()
+    line = len(b'{"path":"/x","params":{"event_id":"a"},"json":null}\n')
+    await spool._run_io(spool._io_commit, line)
+    await spool.stop()
+
+    # Crash while writing the next offset: only the temp file is half written
+    (tmp_path / "spool" / "00000001.offset.tmp").write_text("99")
+    assert (tmp_path / "spool" / "00000001.offset").read_text() == str(line)
+    restarted = make_spool(tmp_path)
+    assert await restarted._run_io(restarted._io_open) == 1
+    await restarted.stop()
+
+
+async def test_failed_share_batch_is_resent_with_the_same_id():
+    api = FakeAPI([(None, True)])
+    buffer = proxy.ShareBuffer(api, proxy.Config())
+    for i in range(3):
+        buffer.add("hb_ord_1", "accepted", 1000, 5e12)
+
+    await buffer.flush()
+    assert len(buffer) == 3
+    buffer.add("hb_ord_1", "accepted", 1000, 5e12)
+    await buffer.flush()
+
+    first, retry, new = [payload for _, _, payload in api.requests]
+    assert retry == first                   # same batch, same batch_id
+    assert new["batch_id"] != first["batch_id"] and len(new["shares"]) == 1
+    assert len(buffer) == 0 and buffer.sent_events == 4
+
+
+async def test_queue_overflow_drops_oldest_retry_shares():
+    config = proxy.Config()
+    config.SHARE_QUEUE_MAX = 4
+    config.SHARE_BATCH_MAX = 3
+    api = FakeAPI([(None, True)] * 2)
+    buffer = proxy.ShareBuffer(api, config)
+    for _ in range(3):
+        buffer.add("old", "accepted", 1, 1)
+    await buffer.flush()
+    for _ in range(3):
+        buffer.add("new", "accepted", 1, 1)
+    await buffer.flush()
+    assert len(buffer) == 4 and buffer.dropped_events == 2
+    await buffer.flush()
+    sent = [s["worker_id"] for _, _, p in api.requests[2:] for s in p["shares"]]
+    assert sent == ["old", "new", "new", "new"]
+
+
+@pytest.mark.parametrize("spool_dir", [None, "spool"])
+async def test_rejected_share_batch_does_not_block_the_queue(tmp_path, spool_dir):
+    spool = make_spool(tmp_path) if spool_dir else None
+    api = FakeAPI([(None, False)], spool)   # 4xx: not retryable
+    config = proxy.Config()
+    config.SHARE_BATCH_MAX = 2
+    buffer = proxy.ShareBuffer(api, config)
+    for worker in ("bad", "bad", "good"):
+        buffer.add(worker, "accepted", 1000, 5e12)
+
+    await buffer.flush()
+    assert len(buffer) == 0
+    assert buffer.rejected_events == 2 and buffer.sent_events == 1
+    assert [s["worker_id"] for s in api.requests[-1][2]["shares"]] == ["good"]
+    if spool:
+        assert spool.depth == 0
+        await spool.stop()
@@ -0,0 +1,126 @@
+"""stratum_proxy.py: miner gets the pool's real extranonce, mid-swap submits are answered"""
+import asyncio
+import json
+
+from conftest import stratum_proxy
+
+proxy = stratum_proxy()
+
+
+class FakeAPI:
+    async def notify_connect(self, worker_id, miner_ip, user_agent):
+        pass
+
+    async def notify_disconnect(self, worker_id):
+        pass
+
+
+class FakeRoutes:
+    def __init__(self, port):
+        self.order = {"pool_host": "127.0.0.1", "pool_port": port,
+                      "pool_wallet": "wallet", "pool_worker": "rig"}
+
+    async def get(self, worker_id):
+        return self.order
+
+
+async def start_pool(extranonce1="f00dcafe"):
+    """Minimal v1 pool: answers subscribe/authorize, then sends a job"""
+    async def handle(reader, writer):
+        while line := await reader.readline():
+            msg = json.loads(line)
+            if msg["method"] == "mining.subscribe":
+                result = [[["mining.notify", "pool_sub"]], extranonce1, 8]
+            else:
+                result = True
+            writer.write(json.dumps({"id": msg["id"], "result": result, "error": None}).encode() + b"\n")
+            if msg["method"] == "mining.authorize":
+                writer.write(b'{"id": null, "method": "mining.notify", "params": ["job1"]}\n')
+            await writer.drain()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+def make_proxy(pool_port, **overrides):
+    config = proxy.Config()
+    config.SPOOL_DIR = ""
+    for key, value in overrides.items():
+        setattr(config, key, value)
+    stratum = proxy.StratumProxy(config)
+    stratum.api = FakeAPI()
+    stratum.routes = FakeRoutes(pool_port)
+    return stratum
+
+
+async def open_miner(stratum):
+    server = await asyncio.start_server(stratum.handle_miner, "127.0.0.1", 0)
+    reader, writer = await asyncio.open_connection("127.0.0.1", server.sockets[0].getsockname()[1])
+    return server, reader, writer
+
+
+async def read_msg(reader):
+    return json.loads(await asyncio.wait_for(reader.readline(), timeout=5))
+
+
+async def test_subscribe_answered_with_pool_extranonce():
+    pool = await start_pool()
+    stratum = make_proxy(pool.sockets[0].getsockname()[1])
+    server, reader, writer = await open_miner(stratum)
+
+    writer.write(b'{"id": 1, "method": "mining.subscribe", "params": ["miner/1.0"]}\n'
+                 b'{"id": 2, "method": "mining.authorize", "params": ["hb_ord_abc.rig1", "x"]}\n')
+    await writer.drain()
+
+    subscribe = await read_msg(reader)
+    assert subscribe["id"] == 1 and subscribe["result"][1:] == ["f00dcafe", 8]
+    assert await read_msg(reader) == {"id": 2, "result": True, "error": None}
+    assert (await read_msg(reader))["method"] == "mining.notify"
+
+    writer.close()
+    server.close()
+    pool.close()
+
+
+async def test_miner_waiting_for_subscribe_reply_gets_set_extranonce():
+    pool = await start_pool()
+    stratum = make_proxy(pool.sockets[0].getsockname()[1], SUBSCRIBE_REPLY_WAIT=0.1)
+    server, reader, writer = await open_miner(stratum)
+
+    writer.write(b'{"id": 1, "method": "mining.subscribe", "params": []}\n')
+    await writer.drain()
+    subscribe = await read_msg(reader)
+    assert subscribe["result"][1] == proxy.PLACEHOLDER_EXTRANONCE1
+
+    writer.write(b'{"id": 2, "method": "mining.authorize", "params": ["hb_ord_abc", "x"]}\n')
+    await writer.drain()
+    assert (await read_msg(reader))["id"] == 2
+    assert await read_msg(reader) == {"id": None, "method": "mining.set_extranonce",
+                                      "params": ["f00dcafe", 8]}
+
+    writer.close()
+    server.close()
+    pool.close()
+
+
+async def test_submit_during_pool_swap_gets_error():
+    stratum = make_proxy(0)
+    session = proxy.WorkerSession("hb_ord_abc", "127.0.0.1")
+    session.target_wallet, session.target_worker = "wallet", "rig"
+
+    reader = asyncio.StreamReader()
+    reader.feed_data(b'{"id": 7, "method": "mining.submit", "params": ["hb_ord_abc", "j", "0", "0", "0"]}\n')
+    reader.feed_eof()
+
+    sent = []
+
+    class Writer:
+        def write(self, data):
+            sent.append(json.loads(data))
+
+        async def drain(self):
+            pass
+
+    await stratum._miner_to_pool(session, reader, Writer())
+
+    assert sent[0]["id"] == 7 and sent[0]["error"][0] == 21
+    assert session.shares_stale == 1 and not session.pending_submits
@@ -0,0 +1,128 @@
+"""Proxy callbacks against a real Postgres: replayed events are applied once
+
+Skipped unless TEST_DATABASE_URL is set (see conftest.test_database).
+"""
+import itertools
+import time
+
+import pytest
+
+from conftest import marketplace_api, requires_database
+
+psycopg_pool = pytest.importorskip("psycopg_pool")
+from psycopg.rows import dict_row  # noqa: E402
+
+pytestmark = requires_database
+
+api = marketplace_api()
+_codes = itertools.count(1)
+
+
+@pytest.fixture
+async def pool(test_database, monkeypatch):
+    pool = psycopg_pool.AsyncConnectionPool(test_database, min_size=1, max_size=4,
+                                            kwargs={"row_factory": dict_row}, open=False)
+    await pool.open()
+    monkeypatch.setattr(api, "adb_pool", pool)
+    yield pool
+    await pool.close()
+
+
+@pytest.fixture
+async def worker(pool):
+    worker_id = f"hb_ord_i{next(_codes)}_{int(time.time()) % 100000}"
+    async with pool.connection() as conn:
+        await conn.execute("""
+            INSERT INTO orders (order_code, listing_id, buyer_id, seller_id, algorithm,
+                                hashrate_ordered, hashrate_unit, hours, price_per_hour,
+                                subtotal, commission, total_paid, pool_host, pool_port,
+                                pool_wallet, status, proxy_worker_id)
+            VALUES (%s, 1, 1, 2, 'SHA256', 100, 'TH/s', 2, 1, 2, 0.06, 2.06, 'pool', 3333,
+                    'w', 'paid', %s)
+        """, (worker_id, worker_id))
+        await conn.execute("""
+            INSERT INTO proxy_sessions (proxy_server, proxy_port, worker_id) VALUES ('eu', 3333, %s)
+        """, (worker_id,))
+    return worker_id
+
+
+async def fetch_order(pool, worker_id):
+    async with pool.connection() as conn:
+        cur = await conn.execute("""
+            SELECT o.id, o.status, o.shares_accepted, o.shares_rejected, o.current_hashrate,
+                   o.hashrate_samples, o.is_online,
+                   (SELECT COUNT(*) FROM share_logs s WHERE s.order_id = o.id) AS logged,
+                   (SELECT COALESCE(SUM(shares_accepted), 0) FROM order_minute_stats m
+                    WHERE m.order_id = o.id) AS minute_accepted
+            FROM orders o WHERE o.proxy_worker_id = %s
+        """, (worker_id,))
+        return await cur.fetchone()
+
+
+def shares(worker_id, n, ts):
+    return [api.ShareEvent(worker_id=worker_id, share_type="accepted", difficulty=1000,
+                           hashrate=5e12, ts=ts + i) for i in range(n)]
+
+
+async def test_replayed_share_batch_counts_once(pool, worker):
+    await api.proxy_worker_connected(worker, "1.2.3.4", event_id=f"{worker}-c")
+    now = time.time()
+    batch = api.ShareBatch(shares=shares(worker, 3, now), batch_id=f"{worker}-b1")
+
+    first = await api.proxy_shares_bulk(batch)
+    assert first["inserted"] == 3
+    again = await api.proxy_shares_bulk(batch)
+    assert again["inserted"] == 0 and again["duplicate"]
+
+    order = await fetch_order(pool, worker)
+    assert (order["shares_accepted"], order["logged"], order["minute_accepted"]) == (3, 3, 3)
+
+    # A new batch id is new work
+    await api.proxy_shares_bulk(api.ShareBatch(shares=shares(worker, 2, now + 10), batch_id=f"{worker}-b2"))
+    order = await fetch_order(pool, worker)
+    assert (order["shares_accepted"], order["logged"], order["minute_accepted"]) == (5, 5, 5)
+
+
+async def test_batches_without_id_are_always_applied(pool, worker):
+    await api.proxy_worker_connected(worker, "1.2.3.4", event_id=None)
+    batch = api.ShareBatch(shares=shares(worker, 1, time.time()))
+    await api.proxy_shares_bulk(batch)
+    await api.proxy_shares_bulk(batch)
+    assert (await fetch_order(pool, worker))["shares_accepted"] == 2
+
+
+async def test_replayed_connect_hashrate_disconnect(pool, worker):
+    now = time.time()
+    await api.proxy_worker_connected(worker, "1.2.3.4", ts=now - 60, event_id=f"{worker}-c")
+    res = await api.proxy_worker_connected(worker, "1.2.3.4", ts=now - 60, event_id=f"{worker}-c")
+    assert res["duplicate"]
+    assert (await fetch_order(pool, worker))["status"] == "active"
+
+    for _ in range(2):
+        await api.proxy_hashrate_update(worker, 5e12, "H/s", ts=now - 30, event_id=f"{worker}-h")
+    assert (await fetch_order(pool, worker))["hashrate_samples"] == 1
+
+    for _ in range(2):
+        await api.proxy_worker_disconnected(worker, ts=now, event_id=f"{worker}-d")
+    async with pool.connection() as conn:
+        cur = await conn.execute("""
+            SELECT COUNT(*) AS n FROM notifications n
+            JOIN orders o ON o.id = n.related_id
+            WHERE o.proxy_worker_id = %s AND n.type = 'rig_offline'
+        """, (worker,))
+        assert (await cur.fetchone())["n"] == 2      # buyer + seller, once
+
+
+async def test_older_batch_does_not_overwrite_hashrate(pool, worker):
+    await api.proxy_worker_connected(worker, "1.2.3.4", event_id=None)
+    now = time.time()
+    newer = [api.ShareEvent(worker_id=worker, share_type="accepted", difficulty=1000,
+                            hashrate=7e12, ts=now)]
+    older = [api.ShareEvent(worker_id=worker, share_type="accepted", difficulty=1000,
+                            hashrate=3e12, ts=now - 120)]
+
+    await api.proxy_shares_bulk(api.ShareBatch(shares=newer))
+    await api.proxy_shares_bulk(api.ShareBatch(shares=older))    # replayed late
+    order = await fetch_order(pool, worker)
+    assert order["current_hashrate"] == 7e12
+    assert order["shares_accepted"] == 2
@@ -0,0 +1,144 @@
+"""ShareWriter buffering / bulk insert (backend/stratum_with_tracking.py)"""
+import asyncio
+
+import pytest
+
+import stratum_with_tracking as stratum
+
+
+class FakeConn:
+    def __init__(self, db):
+        self.db = db
+        self.closed = False
+        self.pending = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.db.committed += self.pending
+        self.pending = []
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeDB:
+    """get_db + execute_values stand-in; fail_next makes the next insert(s) raise"""
+
+    def __init__(self):
+        self.connects = []
+        self.committed = []
+        self.fail_next = 0
+
+    def connect(self):
+        conn = FakeConn(self)
+        self.connects.append(conn)
+        return conn
+
+    def execute_values(self, cursor, sql, rows, template=None, page_size=None):
+        assert "INSERT INTO revenue_snapshots" in sql
+        if self.fail_next:
+            self.fail_next -= 1
+            raise RuntimeError("server closed the connection unexpectedly")
+        cursor.conn.pending += rows
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeDB()
+    monkeypatch.setattr(stratum, "get_db", db.connect)
+    monkeypatch.setattr(stratum, "execute_values", db.execute_values)
+    return db
+
+
+@pytest.fixture
+async def writer():
+    writer = stratum.ShareWriter()
+    yield writer
+    writer.executor.shutdown(wait=True)
+
+
+def row(i):
+    return (f"wallet{i}", "rig", None, "RandomX", 1000, 165.0, 0.0001)
+
+
+async def test_flush_inserts_and_reuses_connection(db, writer):
+    writer.add(row(1))
+    writer.add(row(2))
+    await writer.flush()
+    writer.add(row(3))
+    await writer.flush()
+    await writer.flush()                  # empty buffer: nothing to do
+    assert db.committed == [row(1), row(2), row(3)]
+    assert len(db.connects) == 1
+    assert writer.buffer == []
+
+
+async def test_failed_flush_keeps_rows_and_reconnects(db, writer):
+    writer.add(row(1))
+    db.fail_next = 1
+    await writer.flush()
+    assert db.committed == []
+    assert db.connects[0].closed and writer.conn is None
+
+    writer.add(row(2))
+    await writer.flush()
+    # Retried rows go first, in their original order
+    assert db.committed == [row(1), row(2)]
+    assert len(db.connects) == 2
+
+
+async def test_buffer_overflow_drops_oldest(db, writer, monkeypatch):
+    monkeypatch.setattr(stratum, "SHARE_BUFFER_MAX", 5)
+    for i in range(4):
+        writer.add(row(i))
+    db.fail_next = 2
+    await writer.flush()
+    for i in range(4, 7):
+        writer.add(row(i))
+    await writer.flush()
+    assert writer.buffer == [row(i) for i in range(2, 7)]
+    assert writer.dropped == 2
+
+    await writer.flush()
+    assert db.committed == [row(i) for i in range(2, 7)]
+
+
+async def test_full_batch_wakes_the_writer(db, writer, monkeypatch):
+    monkeypatch.setattr(stratum, "SHARE_FLUSH_BATCH", 3)
+    monkeypatch.setattr(stratum, "SHARE_FLUSH_INTERVAL", 60)
+    task = asyncio.create_task(writer.run())
+    for i in range(3):
+        writer.add(row(i))
+    for _ in range(100):
+        if db.committed:
+            break
+        await asyncio.sleep(0.01)
+    assert db.committed == [row(0), row(1), row(2)]
+
+    # Shutdown flushes whatever is left
+    writer.add(row(3))
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert db.committed[-1] == row(3)
+
+
+async def test_save_share_enqueues(monkeypatch, writer):
+    monkeypatch.setattr(stratum, "share_writer", writer)
+    stratum.save_share("wallet", "rig", "RandomX", 1234.9, 165.0, 0.5)
+    (wallet, worker, timestamp, algorithm, difficulty, price, net), = writer.buffer
+    assert (wallet, worker, algorithm, difficulty, price, net) == ("wallet", "rig", "RandomX", 1234, 165.0, 0.5)
+    assert timestamp is not None
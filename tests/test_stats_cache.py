@@ -0,0 +1,136 @@
+"""Public stats SWRCache + ETag responses (root main.py)"""
+import asyncio
+
+import pytest
+from starlette.requests import Request
+
+from conftest import marketplace_api
+
+api = marketplace_api()
+
+
+class Loader:
+    def __init__(self, value=None, delay=0):
+        self.value = value if value is not None else {"total_listings": 3}
+        self.delay = delay
+        self.fail = False
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("db down")
+        return self.value
+
+
+def make_cache(loader):
+    return api.SWRCache("test", api.json_body(loader), ttl=30, max_stale=300)
+
+
+def age(cache, seconds):
+    """Pretend the value was loaded `seconds` ago"""
+    cache.loaded_at -= seconds
+
+
+def request(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def max_age(response):
+    directive = response.headers["cache-control"].split(", ")[1]
+    assert directive.startswith("max-age=")
+    return int(directive[len("max-age="):])
+
+
+async def test_concurrent_misses_share_one_load():
+    loader = Loader(delay=0.05)
+    cache = make_cache(loader)
+    results = await asyncio.gather(*[cache.get() for _ in range(10)])
+    assert loader.calls == 1
+    assert len(set(results)) == 1
+
+
+async def test_fresh_entry_is_served_without_loading():
+    loader = Loader()
+    cache = make_cache(loader)
+    first = await cache.get()
+    assert await cache.get() == first
+    assert loader.calls == 1
+
+
+async def test_stale_entry_served_while_refreshing():
+    loader = Loader()
+    cache = make_cache(loader)
+    body, _ = await cache.get()
+    age(cache, 60)
+    loader.value = {"total_listings": 4}
+    assert (await cache.get())[0] == body      # old value, immediately
+    assert cache.task is not None
+    await cache.task
+    assert (await cache.get())[0] == b'{"total_listings":4}'
+    assert loader.calls == 2
+
+
+async def test_expired_entry_reloads_but_survives_failure():
+    loader = Loader()
+    cache = make_cache(loader)
+    body, _ = await cache.get()
+    age(cache, 1000)                          # past ttl + max_stale
+    loader.fail = True
+    assert (await cache.get())[0] == body
+    assert loader.calls == 2
+
+
+async def test_failure_without_value_raises():
+    loader = Loader()
+    loader.fail = True
+    cache = make_cache(loader)
+    with pytest.raises(RuntimeError):
+        await cache.get()
+    with pytest.raises(RuntimeError):
+        await cache.get()
+    assert loader.calls == 2                  # nothing negatively cached
+
+
+async def test_response_sets_etag_and_cache_control():
+    cache = make_cache(Loader())
+    res = await api.cached_json_response(cache, request())
+    assert res.status_code == 200
+    assert res.body == b'{"total_listings":3}'
+    assert res.headers["etag"].startswith('"') and len(res.headers["etag"]) == 22
+    assert max_age(res) in (29, 30)
+    assert res.headers["cache-control"].endswith(", stale-while-revalidate=300")
+
+    age(cache, 20)
+    res = await api.cached_json_response(cache, request())
+    assert max_age(res) in (9, 10)
+
+    age(cache, 60)                            # stale: clients must revalidate
+    res = await api.cached_json_response(cache, request())
+    assert max_age(res) == 0
+
+
+async def test_matching_if_none_match_is_304():
+    cache = make_cache(Loader())
+    etag = (await api.cached_json_response(cache, request())).headers["etag"]
+
+    res = await api.cached_json_response(cache, request(f'"other", {etag}'))
+    assert res.status_code == 304
+    assert res.body == b""
+    assert res.headers["etag"] == etag
+
+    assert (await api.cached_json_response(cache, request("*"))).status_code == 304
+    assert (await api.cached_json_response(cache, request('"other"'))).status_code == 200
+
+
+async def test_etag_changes_with_content():
+    loader = Loader()
+    cache = make_cache(loader)
+    _, etag = await cache.get()
+    loader.value = {"total_listings": 5}
+    await cache.refresh()
+    _, new_etag = await cache.get()
+    assert new_etag != etag
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from stratum_framing import FrameTooLarge, LineFramer, read_lines
+
+
+def test_message_split_across_chunks():
+    framer = LineFramer()
+    message = b'{"id":1,"method":"mining.subscribe","params":[]}\n'
+    lines = []
+    for i in range(len(message)):
+        lines += framer.feed(message[i:i + 1])
+    assert lines == [message.rstrip(b'\n')]
+    assert framer.pending() == 0
+
+
+def test_several_messages_in_one_chunk():
+    framer = LineFramer()
+    assert framer.feed(b'{"id":1}\n{"id":2}\n{"id":3') == [b'{"id":1}', b'{"id":2}']
+    assert framer.pending() == len(b'{"id":3')
+    assert framer.feed(b'}\n') == [b'{"id":3}']
+
+
+def test_crlf_line_endings():
+    framer = LineFramer()
+    assert framer.feed(b'{"id":1}\r\n{"id":2}\r') == [b'{"id":1}']
+    assert framer.feed(b'\n') == [b'{"id":2}']
+
+
+def test_empty_lines_are_skipped():
+    framer = LineFramer()
+    assert framer.feed(b'\n\r\n{"id":1}\n\n  \n') == [b'{"id":1}']
+
+
+def test_oversized_tail_without_newline():
+    framer = LineFramer(max_line=16)
+    assert framer.feed(b'x' * 16) == []
+    with pytest.raises(FrameTooLarge):
+        framer.feed(b'x')
+
+
+def test_oversized_tail_after_complete_line():
+    framer = LineFramer(max_line=16)
+    with pytest.raises(FrameTooLarge):
+        framer.feed(b'{"id":1}\n' + b'x' * 17)
+
+
+def test_line_at_limit_is_accepted():
+    framer = LineFramer(max_line=16)
+    assert framer.feed(b'x' * 16 + b'\n') == [b'x' * 16]
+
+
+async def _collect(reader, max_line=1024):
+    return [line async for line in read_lines(reader, max_line)]
+
+
+async def test_read_lines_from_stream_reader():
+    reader = asyncio.StreamReader()
+    reader.feed_data(b'{"id":1}\r\n{"id"')
+    reader.feed_data(b':2}\n\n{"id":3}\n')
+    reader.feed_data(b'{"id":4}')     # unterminated at EOF: dropped
+    reader.feed_eof()
+    assert await _collect(reader) == [b'{"id":1}', b'{"id":2}', b'{"id":3}']
+
+
+async def test_read_lines_yields_before_eof():
+    reader = asyncio.StreamReader()
+    lines = read_lines(reader)
+    reader.feed_data(b'{"id":1}\n')
+    assert await asyncio.wait_for(lines.__anext__(), 1) == b'{"id":1}'
+    reader.feed_eof()
+    with pytest.raises(StopAsyncIteration):
+        await lines.__anext__()
+
+
+async def test_read_lines_oversized_raises():
+    reader = asyncio.StreamReader()
+    reader.feed_data(b'x' * 64)
+    reader.feed_eof()
+    with pytest.raises(FrameTooLarge):
+        await _collect(reader, max_line=32)
@@ -0,0 +1,154 @@
+"""order_uptime_event / order_uptime_sweep (create_database.sql) on a real Postgres
+
+Runs against the throwaway test_database (see conftest); skipped unless
+TEST_DATABASE_URL is set.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import marketplace_api, requires_database
+
+psycopg2 = pytest.importorskip("psycopg2")
+from psycopg2.extras import RealDictCursor  # noqa: E402
+
+pytestmark = requires_database
+
+T0 = datetime(2026, 1, 1, 12, 0, 0)
+
+
+@pytest.fixture(scope="module")
+def db(test_database):
+    conn = psycopg2.connect(test_database)
+    conn.autocommit = True
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def order(db):
+    with db.cursor() as cur:
+        cur.execute("""
+            INSERT INTO orders (order_code, listing_id, buyer_id, seller_id, algorithm,
+                                hashrate_ordered, hashrate_unit, hours, price_per_hour,
+                                subtotal, commission, total_paid, pool_host, pool_port,
+                                pool_wallet, status, started_at, expected_end_at)
+            SELECT 'hb_ord_' || (COUNT(*) + 1), 1, 1, 2, 'SHA256', 100, 'TH/s', 2, 1,
+                   2, 0.06, 2.06, 'pool', 3333, 'w', 'active', %s, %s
+            FROM orders
+            RETURNING id
+        """, (T0, T0 + timedelta(hours=2)))
+        return cur.fetchone()[0]
+
+
+def event(db, order_id, seconds, online, reason=None):
+    with db.cursor() as cur:
+        cur.execute("SELECT order_uptime_event(%s, %s, %s, %s)",
+                    (order_id, T0 + timedelta(seconds=seconds), online, reason))
+
+
+def totals(db, order_id):
+    with db.cursor() as cur:
+        cur.execute("""
+            SELECT uptime_seconds, downtime_seconds, uptime_percent, is_online
+            FROM orders WHERE id = %s
+        """, (order_id,))
+        up, down, percent, online = cur.fetchone()
+        return up, down, float(percent), online
+
+
+def intervals(db, order_id):
+    with db.cursor() as cur:
+        cur.execute("""
+            SELECT started_at, ended_at, end_reason FROM order_uptime_intervals
+            WHERE order_id = %s ORDER BY started_at
+        """, (order_id,))
+        return cur.fetchall()
+
+
+def at(seconds):
+    return T0 + timedelta(seconds=seconds)
+
+
+def test_online_offline_online(db, order):
+    event(db, order, 0, True)
+    event(db, order, 600, False, "disconnect")
+    event(db, order, 900, True)
+    event(db, order, 1200, True)
+    assert totals(db, order) == (900, 300, 75.0, True)
+    assert intervals(db, order) == [(at(0), at(600), "disconnect"), (at(900), None, None)]
+
+
+def test_backdated_offline_moves_uptime_to_downtime(db, order):
+    event(db, order, 0, True)
+    event(db, order, 1200, True)              # sweep accounted up to 1200
+    event(db, order, 900, False, "no_shares")  # last share was at 900
+    assert totals(db, order) == (900, 300, 75.0, False)
+    assert intervals(db, order) == [(at(0), at(900), "no_shares")]
+
+
+def test_backdated_offline_stops_at_open_interval(db, order):
+    # Offline from the start, online at 600; the correction must not reach
+    # back past 600 (that downtime was already counted)
+    event(db, order, 600, True)
+    event(db, order, 1200, True)
+    event(db, order, 300, False, "no_shares")
+    assert totals(db, order) == (0, 1200, 0.0, False)
+    assert intervals(db, order) == [(at(600), at(600), "no_shares")]
+
+
+def test_backdated_online_is_not_applied(db, order):
+    event(db, order, 900, False)              # downtime accounted up to 900
+    event(db, order, 300, True)               # late "online since 300"
+    event(db, order, 1200, True)
+    assert totals(db, order) == (300, 900, 25.0, True)
+    assert intervals(db, order) == [(at(900), None, None)]
+
+
+def test_events_clamped_to_order_window(db, order):
+    event(db, order, -600, True)              # before started_at
+    event(db, order, 3 * 3600, False, "order_end")  # after expected_end_at
+    assert totals(db, order) == (7200, 0, 100.0, False)
+    assert intervals(db, order) == [(at(0), at(7200), "order_end")]
+
+
+def sweep(db, order_id, last_share_seconds):
+    with db.cursor() as cur:
+        cur.execute("UPDATE orders SET last_share_at = %s WHERE id = %s",
+                    (at(last_share_seconds), order_id))
+        cur.execute("SELECT order_uptime_sweep(10)")
+        return cur.fetchone()[0]
+
+
+def test_sweep_closes_silent_order_at_last_share(db, order):
+    # The order window (T0 .. T0+2h) is long past
+    event(db, order, 0, True)
+    assert sweep(db, order, 1800) >= 1
+    assert totals(db, order) == (1800, 5400, 25.0, False)
+    assert intervals(db, order) == [(at(0), at(1800), "no_shares")]
+
+
+def test_sweep_ends_order_mining_until_expiry(db, order):
+    event(db, order, 0, True)
+    assert sweep(db, order, 7000) >= 1
+    assert totals(db, order) == (7200, 0, 100.0, False)
+    assert intervals(db, order) == [(at(0), at(7200), "order_end")]
+
+
+def test_admin_action_closes_open_interval(db, order, test_database, monkeypatch):
+    api = marketplace_api()
+    monkeypatch.setattr(api, "get_db", lambda: psycopg2.connect(test_database, cursor_factory=RealDictCursor))
+    monkeypatch.setattr(api, "return_db", lambda conn: conn.close())
+    now = datetime.now().replace(microsecond=0)
+    with db.cursor() as cur:
+        cur.execute("UPDATE orders SET started_at = %s, expected_end_at = %s WHERE id = %s",
+                    (now - timedelta(hours=1), now + timedelta(hours=1), order))
+        cur.execute("UPDATE users SET balance_escrow = balance_escrow + 2.06 WHERE id = 1")
+        cur.execute("SELECT order_uptime_event(%s, %s, true)", (order, now - timedelta(minutes=30)))
+
+    api.admin_order_action(order, api.AdminOrderAction(action="approve"))
+
+    (started, ended, reason), = intervals(db, order)
+    assert ended is not None and reason == "admin_action"
+    up, down, _, online = totals(db, order)
+    assert not online and up >= 1800 and down == 1800
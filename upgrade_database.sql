@@ -0,0 +1,388 @@
+-- ============================================================
+-- HASHMARKET DATABASE UPGRADE
+-- Mevcut veritabanını create_database.sql'deki son şemaya getirir.
+-- Tekrar çalıştırılabilir (IF NOT EXISTS / idempotent backfill).
+-- ============================================================
+
+-- ============================================================
+-- 1. ORDERS — Çalışan hashrate ortalaması
+-- ============================================================
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS hashrate_sum DECIMAL(30,4) NOT NULL DEFAULT 0;
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS hashrate_samples INTEGER NOT NULL DEFAULT 0;
+
+-- Mevcut snapshot'lardan doldur (sadece henüz doldurulmamış siparişler)
+UPDATE orders o SET
+    hashrate_sum = s.total,
+    hashrate_samples = s.samples
+FROM (
+    SELECT order_id, SUM(hashrate) AS total, COUNT(*) AS samples
+    FROM hashrate_snapshots
+    GROUP BY order_id
+) s
+WHERE o.id = s.order_id AND o.hashrate_samples = 0;
+
+-- ============================================================
+-- 2. SHARE_LOGS — Günlük partition'lara geçiş + sipariş/dakika özeti
+-- ============================================================
+CREATE TABLE IF NOT EXISTS order_minute_stats (
+    order_id INTEGER NOT NULL REFERENCES orders(id),
+    minute TIMESTAMP NOT NULL,
+    shares_accepted INTEGER NOT NULL DEFAULT 0,
+    shares_rejected INTEGER NOT NULL DEFAULT 0,
+    difficulty_sum DECIMAL(40,0) NOT NULL DEFAULT 0,
+    reported_hashrate DECIMAL(20,4),
+    online BOOLEAN NOT NULL DEFAULT false,
+    PRIMARY KEY (order_id, minute)
+);
+ALTER TABLE order_minute_stats ADD COLUMN IF NOT EXISTS reported_hashrate DECIMAL(20,4);
+ALTER TABLE order_minute_stats ADD COLUMN IF NOT EXISTS online BOOLEAN NOT NULL DEFAULT false;
+
+-- Mevcut tablo kopyalanmaz: yeniden adlandırılıp yeni tablonun partition'ı
+-- olarak bağlanır (yarına kadarki tüm aralık). Retention süresi dolunca
+-- share_log_maintenance() satırlarını özetleyip siler, boşalınca tabloyu kaldırır.
+DO $$
+BEGIN
+    IF to_regclass('share_logs') IS NOT NULL AND NOT EXISTS (
+        SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'share_logs'::regclass
+    ) THEN
+        ALTER TABLE share_logs RENAME TO share_logs_legacy;
+        DROP INDEX IF EXISTS idx_shares_order;
+        DROP INDEX IF EXISTS idx_shares_time;
+        ALTER INDEX IF EXISTS idx_shares_order_time RENAME TO share_logs_legacy_order_time_idx;
+        
+        UPDATE share_logs_legacy SET submitted_at = NOW() WHERE submitted_at IS NULL;
+        ALTER TABLE share_logs_legacy ALTER COLUMN submitted_at SET NOT NULL;
+        ALTER TABLE share_logs_legacy DROP CONSTRAINT share_logs_pkey;
+        ALTER TABLE share_logs_legacy ADD CONSTRAINT share_logs_legacy_pkey PRIMARY KEY (id, submitted_at);
+        
+        CREATE TABLE share_logs (
+            id BIGINT NOT NULL DEFAULT nextval('share_logs_id_seq'),
+            order_id INTEGER NOT NULL REFERENCES orders(id),
+            session_id BIGINT REFERENCES proxy_sessions(id),
+            share_type VARCHAR(10) NOT NULL,
+            difficulty DECIMAL(30,0),
+            calculated_hashrate DECIMAL(20,4),
+            submitted_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (id, submitted_at)
+        ) PARTITION BY RANGE (submitted_at);
+        ALTER SEQUENCE share_logs_id_seq OWNED BY share_logs.id;
+        
+        EXECUTE format('ALTER TABLE share_logs ATTACH PARTITION share_logs_legacy FOR VALUES FROM (MINVALUE) TO (%L)',
+                       CURRENT_DATE + 1);
+        CREATE TABLE share_logs_default PARTITION OF share_logs DEFAULT;
+        CREATE INDEX idx_shares_order_time ON share_logs(order_id, submitted_at DESC);
+    END IF;
+END $$;
+
+-- share_logs bakımı: ileriye dönük günlük partition'lar oluştur, retention'ı
+-- geçen partition'ları sil. order_minute_stats ingest sırasında tutulur; burada
+-- sadece özeti olmayan dakikalar (ör. özet tablosundan önceki veriler) eklenir.
+-- main.py her saat çağırır; birden fazla process aynı anda çalıştırmaz.
+CREATE OR REPLACE FUNCTION share_log_maintenance(
+    p_retention_days INTEGER DEFAULT 30,
+    p_days_ahead INTEGER DEFAULT 7
+) RETURNS TABLE(created INTEGER, dropped INTEGER, rolled_up BIGINT) AS $$
+DECLARE
+    v_day DATE;
+    v_cutoff DATE := CURRENT_DATE - p_retention_days;
+    v_name TEXT;
+    v_rows BIGINT;
+    v_empty BOOLEAN;
+BEGIN
+    created := 0;
+    dropped := 0;
+    rolled_up := 0;
+    
+    IF NOT pg_try_advisory_xact_lock(hashtext('share_log_maintenance')) THEN
+        RETURN NEXT;
+        RETURN;
+    END IF;
+    
+    -- 1. Süresi dolan günlük partition'lar: eksik dakikaları özete yaz, sonra sil
+    FOR v_name IN
+        SELECT c.relname::TEXT FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'share_logs'::regclass
+          AND c.relname ~ '^share_logs_[0-9]{8}$'
+          AND to_date(right(c.relname, 8), 'YYYYMMDD') < v_cutoff
+        ORDER BY c.relname
+    LOOP
+        EXECUTE format($sql$
+            INSERT INTO order_minute_stats
+                (order_id, minute, shares_accepted, shares_rejected, difficulty_sum, reported_hashrate, online)
+            SELECT order_id, date_trunc('minute', submitted_at),
+                   COUNT(*) FILTER (WHERE share_type = 'accepted'),
+                   COUNT(*) FILTER (WHERE share_type <> 'accepted'),
+                   COALESCE(SUM(difficulty) FILTER (WHERE share_type = 'accepted'), 0),
+                   MAX(calculated_hashrate),
+                   bool_or(share_type = 'accepted')
+            FROM %I
+            GROUP BY 1, 2
+            ON CONFLICT (order_id, minute) DO NOTHING
+        $sql$, v_name);
+        GET DIAGNOSTICS v_rows = ROW_COUNT;
+        rolled_up := rolled_up + v_rows;
+        EXECUTE format('DROP TABLE %I', v_name);
+        dropped := dropped + 1;
+    END LOOP;
+    
+    -- 2. Günlük aralık dışındaki partition'lardaki (default / legacy) eski satırlar
+    FOREACH v_name IN ARRAY ARRAY['share_logs_default', 'share_logs_legacy'] LOOP
+        CONTINUE WHEN to_regclass(v_name) IS NULL;
+        EXECUTE format($sql$
+            WITH old AS (
+                DELETE FROM %I WHERE submitted_at < %L
+                RETURNING order_id, submitted_at, share_type, difficulty, calculated_hashrate
+            )
+            INSERT INTO order_minute_stats
+                (order_id, minute, shares_accepted, shares_rejected, difficulty_sum, reported_hashrate, online)
+            SELECT order_id, date_trunc('minute', submitted_at),
+                   COUNT(*) FILTER (WHERE share_type = 'accepted'),
+                   COUNT(*) FILTER (WHERE share_type <> 'accepted'),
+                   COALESCE(SUM(difficulty) FILTER (WHERE share_type = 'accepted'), 0),
+                   MAX(calculated_hashrate),
+                   bool_or(share_type = 'accepted')
+            FROM old
+            GROUP BY 1, 2
+            ON CONFLICT (order_id, minute) DO NOTHING
+        $sql$, v_name, v_cutoff);
+        GET DIAGNOSTICS v_rows = ROW_COUNT;
+        rolled_up := rolled_up + v_rows;
+    END LOOP;
+    
+    -- Eski (partition öncesi) tablo boşaldıysa kaldır
+    IF to_regclass('share_logs_legacy') IS NOT NULL THEN
+        EXECUTE 'SELECT NOT EXISTS (SELECT 1 FROM share_logs_legacy)' INTO v_empty;
+        IF v_empty THEN
+            EXECUTE 'DROP TABLE share_logs_legacy';
+            dropped := dropped + 1;
+        END IF;
+    END IF;
+    
+    -- 3. Dünden p_days_ahead gün sonrasına kadar günlük partition'lar
+    FOR v_day IN SELECT generate_series(CURRENT_DATE - 1, CURRENT_DATE + p_days_ahead, INTERVAL '1 day')::DATE LOOP
+        v_name := 'share_logs_' || to_char(v_day, 'YYYYMMDD');
+        CONTINUE WHEN to_regclass(v_name) IS NOT NULL;
+        BEGIN
+            EXECUTE format('CREATE TABLE %I PARTITION OF share_logs FOR VALUES FROM (%L) TO (%L)',
+                           v_name, v_day, v_day + 1);
+            created := created + 1;
+        EXCEPTION
+            WHEN invalid_object_definition THEN
+                NULL;   -- aralık share_logs_legacy tarafından kapsanıyor
+            WHEN check_violation THEN
+                RAISE WARNING 'share_logs_default has rows for %, partition not created', v_day;
+        END;
+    END LOOP;
+    
+    RETURN NEXT;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT * FROM share_log_maintenance();
+
+-- ============================================================
+-- 3. UPTIME — Online aralıkları ve artımlı uptime muhasebesi
+-- ============================================================
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS is_online BOOLEAN NOT NULL DEFAULT false;
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS uptime_accounted_at TIMESTAMP;
+
+-- Siparişin online aralıkları (uptime motoru). ended_at NULL = şu an online.
+CREATE TABLE IF NOT EXISTS order_uptime_intervals (
+    id BIGSERIAL PRIMARY KEY,
+    order_id INTEGER NOT NULL REFERENCES orders(id),
+    started_at TIMESTAMP NOT NULL,
+    ended_at TIMESTAMP,
+    end_reason VARCHAR(20)                        -- disconnect, no_shares, order_end, admin_action
+);
+
+CREATE INDEX IF NOT EXISTS idx_uptime_order ON order_uptime_intervals(order_id, started_at);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_uptime_open ON order_uptime_intervals(order_id) WHERE ended_at IS NULL;
+
+-- Uptime muhasebesi: sipariş durumunu (online/offline) değiştirir ve son
+-- işlenen andan (uptime_accounted_at) p_at'e kadar geçen süreyi uptime veya
+-- downtime'a ekler. Süre [started_at, expected_end_at] ile sınırlıdır.
+-- Offline'a geriye dönük geçişte (p_at < uptime_accounted_at, ör. son share
+-- anı) fazladan sayılmış uptime downtime'a aktarılır.
+CREATE OR REPLACE FUNCTION order_uptime_event(
+    p_order_id INTEGER,
+    p_at TIMESTAMP,
+    p_online BOOLEAN,
+    p_reason VARCHAR(20) DEFAULT NULL             -- kapanış sebebi: disconnect, no_shares, order_end
+) RETURNS VOID AS $$
+DECLARE
+    o RECORD;
+    v_at TIMESTAMP;
+    v_mark TIMESTAMP;
+    v_open TIMESTAMP;
+    v_elapsed BIGINT;
+    v_up BIGINT;
+    v_down BIGINT;
+BEGIN
+    SELECT id, is_online, started_at, expected_end_at, uptime_accounted_at,
+           COALESCE(uptime_seconds, 0) AS up, COALESCE(downtime_seconds, 0) AS down
+    INTO o FROM orders
+    WHERE id = p_order_id AND status IN ('active', 'delivering', 'dispute') AND started_at IS NOT NULL
+    FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+    
+    v_at := GREATEST(COALESCE(p_at, LOCALTIMESTAMP), o.started_at);
+    IF o.expected_end_at IS NOT NULL THEN
+        v_at := LEAST(v_at, o.expected_end_at);
+    END IF;
+    v_mark := COALESCE(o.uptime_accounted_at, o.started_at);
+    
+    IF p_online AND NOT o.is_online THEN
+        -- Online'a geriye dönük geçilmez: mark'a kadar downtime zaten işlendi
+        v_at := GREATEST(v_at, v_mark);
+    ELSIF o.is_online AND NOT p_online THEN
+        -- Geriye dönük kapanış açık aralığın başından öteye gidemez
+        -- (düzeltme yalnızca bu aralıkta sayılmış uptime'ı geri alır)
+        SELECT started_at INTO v_open FROM order_uptime_intervals
+        WHERE order_id = p_order_id AND ended_at IS NULL;
+        v_at := GREATEST(v_at, LEAST(COALESCE(v_open, v_mark), v_mark));
+    END IF;
+    v_elapsed := EXTRACT(EPOCH FROM (v_at - v_mark))::BIGINT;
+    v_up := o.up;
+    v_down := o.down;
+    
+    IF o.is_online AND NOT p_online THEN
+        v_up := v_up + v_elapsed;                   -- negatifse düzeltme
+        v_down := v_down + GREATEST(-v_elapsed, 0);
+    ELSIF o.is_online THEN
+        v_up := v_up + GREATEST(v_elapsed, 0);
+    ELSE
+        v_down := v_down + GREATEST(v_elapsed, 0);
+    END IF;
+    
+    UPDATE orders SET
+        uptime_seconds = v_up,
+        downtime_seconds = v_down,
+        uptime_percent = CASE WHEN v_up + v_down > 0
+                              THEN ROUND(v_up * 100.0 / (v_up + v_down), 2)
+                              ELSE 0 END,
+        uptime_accounted_at = GREATEST(v_mark, v_at),
+        is_online = p_online
+    WHERE id = p_order_id;
+    
+    IF p_online AND NOT o.is_online THEN
+        INSERT INTO order_uptime_intervals (order_id, started_at) VALUES (p_order_id, v_at)
+        ON CONFLICT (order_id) WHERE ended_at IS NULL DO NOTHING;
+    ELSIF o.is_online AND NOT p_online THEN
+        UPDATE order_uptime_intervals SET ended_at = v_at, end_reason = p_reason
+        WHERE order_id = p_order_id AND ended_at IS NULL;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Periyodik uptime taraması (main.py dakikada bir çağırır):
+-- bağlı görünüp p_stale_minutes'tır kabul edilen share göndermeyen ve süresi
+-- dolan siparişleri offline'a alır, kalanların süresini şimdiye kadar işler.
+CREATE OR REPLACE FUNCTION order_uptime_sweep(p_stale_minutes INTEGER DEFAULT 10) RETURNS INTEGER AS $$
+DECLARE
+    r RECORD;
+    v_closed INTEGER := 0;
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('order_uptime_sweep')) THEN
+        RETURN 0;
+    END IF;
+    
+    -- Share gelmeyen veya süresi biten online siparişler (offline son share anından başlar)
+    FOR r IN
+        SELECT o.id, o.expected_end_at,
+               GREATEST(COALESCE(o.last_share_at, i.started_at), i.started_at) AS last_seen
+        FROM orders o
+        JOIN order_uptime_intervals i ON i.order_id = o.id AND i.ended_at IS NULL
+        WHERE o.is_online AND o.status IN ('active', 'delivering', 'dispute')
+        ORDER BY o.id                               -- kilitler id sırasıyla (bulk share UPDATE ile aynı)
+    LOOP
+        IF r.expected_end_at IS NOT NULL AND r.expected_end_at <= LOCALTIMESTAMP
+           AND r.last_seen >= r.expected_end_at - p_stale_minutes * INTERVAL '1 minute' THEN
+            PERFORM order_uptime_event(r.id, r.expected_end_at, false, 'order_end');
+            v_closed := v_closed + 1;
+        ELSIF r.last_seen < LOCALTIMESTAMP - p_stale_minutes * INTERVAL '1 minute' THEN
+            PERFORM order_uptime_event(r.id, r.last_seen, false, 'no_shares');
+            v_closed := v_closed + 1;
+        END IF;
+    END LOOP;
+    
+    -- Durum değişmeden geçen süreyi işle (uptime_percent güncel kalsın)
+    FOR r IN
+        SELECT id, is_online FROM orders
+        WHERE status IN ('active', 'delivering', 'dispute') AND started_at IS NOT NULL
+          AND COALESCE(uptime_accounted_at, started_at) < LEAST(LOCALTIMESTAMP, COALESCE(expected_end_at, LOCALTIMESTAMP))
+        ORDER BY id
+    LOOP
+        PERFORM order_uptime_event(r.id, LOCALTIMESTAMP, r.is_online);
+    END LOOP;
+    
+    RETURN v_closed;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Mevcut aktif siparişler: muhasebe yükseltme anından başlar (geçmiş bilinmiyor,
+-- downtime sayılmasın). Online durumu ilk kabul edilen share ile açılır.
+UPDATE orders SET uptime_accounted_at = LEAST(LOCALTIMESTAMP, COALESCE(expected_end_at, LOCALTIMESTAMP))
+WHERE uptime_accounted_at IS NULL AND started_at IS NOT NULL
+  AND status IN ('active', 'delivering', 'dispute');
+
+-- ============================================================
+-- 4. LISTINGS — Marketplace arama index'leri (keyset sayfalama)
+-- ============================================================
+DROP INDEX IF EXISTS idx_listings_status;
+DROP INDEX IF EXISTS idx_listings_price;
+CREATE INDEX IF NOT EXISTS idx_listings_market_price ON listings(status, price_per_hour, id);
+CREATE INDEX IF NOT EXISTS idx_listings_market_hashrate ON listings(status, hashrate, id);
+CREATE INDEX IF NOT EXISTS idx_listings_market_created ON listings(status, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_listings_market_algo_price ON listings(LOWER(algorithm), status, price_per_hour, id);
+CREATE INDEX IF NOT EXISTS idx_listings_market_algo_hashrate ON listings(LOWER(algorithm), status, hashrate, id);
+CREATE INDEX IF NOT EXISTS idx_listings_market_algo_created ON listings(LOWER(algorithm), status, created_at, id);
+
+-- ============================================================
+-- 5. ADMIN DASHBOARD — Materialized sayaçlar
+-- ============================================================
+CREATE INDEX IF NOT EXISTS idx_orders_completed ON orders(completed_at) WHERE status = 'completed';
+
+-- Admin dashboard sayaçları — tek satır, refresh_admin_dashboard_stats() ile
+-- arka planda CONCURRENTLY yenilenir (okuyucular bloklanmaz)
+CREATE MATERIALIZED VIEW IF NOT EXISTS admin_dashboard_stats AS
+SELECT
+    1 AS id,
+    (SELECT COUNT(*) FROM orders WHERE status IN ('paid', 'active', 'delivering')) AS active_orders,
+    (SELECT COUNT(*) FROM orders WHERE status = 'delivering' AND review_at IS NOT NULL) AS pending_review,
+    (SELECT COUNT(*) FROM disputes WHERE status = 'open') AS open_disputes,
+    (SELECT COALESCE(SUM(commission), 0) FROM orders
+     WHERE status = 'completed'
+       AND completed_at >= CURRENT_DATE AND completed_at < CURRENT_DATE + 1) AS today_commission,
+    (SELECT COUNT(*) FROM users) AS total_users,
+    (SELECT COALESCE(SUM(total_paid), 0) FROM orders WHERE status = 'completed') AS total_volume,
+    (SELECT COUNT(*) FROM transactions WHERE type = 'withdraw' AND status = 'pending') AS pending_withdrawals,
+    LOCALTIMESTAMP AS refreshed_at;
+
+-- CONCURRENTLY refresh için unique index şart
+CREATE UNIQUE INDEX IF NOT EXISTS idx_admin_dashboard_stats ON admin_dashboard_stats(id);
+
+-- Admin dashboard view'ini yenile; aynı anda tek yenileme (çoklu worker)
+CREATE OR REPLACE FUNCTION refresh_admin_dashboard_stats() RETURNS BOOLEAN AS $$
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('refresh_admin_dashboard_stats')) THEN
+        RETURN false;
+    END IF;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY admin_dashboard_stats;
+    RETURN true;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT refresh_admin_dashboard_stats();
+
+-- ============================================================
+-- 6. PROXY EVENTS — Tekrar teslim edilen event'lerin ayıklanması
+-- ============================================================
+CREATE TABLE IF NOT EXISTS processed_proxy_events (
+    event_id VARCHAR(64) PRIMARY KEY,
+    processed_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_processed_proxy_events_time ON processed_proxy_events(processed_at);